@@ -2,7 +2,20 @@
 __version__ = "0.1.1"
 
 from .excel_handler import ExcelHandler
+from .input_cache import InputCache
+from .stage_store import StageStore, MemoryStageStore, ArrowStageStore
+from .result_table import ResultTableCollector, build_legacy_layout, fan_out_result_table
+from .result_sink import SQLiteResultSink
+from .manifest import StageManifest
+from .workflow_graph import WorkflowGraph
+from .hierarchical_classifier import HierarchicalClassifier
+from .checkpoint import WorkflowCheckpoint
+from .planner import WorkflowPlanner
+from .metrics import WorkflowMetrics
+from .spill import ChunkSpill
+from .sharding import shard_keyword_file, merge_shard_results
 from .keyword_classifier import KeywordClassifier
 from .workflow_processor import WorkFlowProcessor
+from .service import ClassificationService
 from .logger_config import add_ui_handler, remove_ui_handler, set_ui_handler_level
 from .models import UnclassifiedKeywords, SourceRules, WorkFlowRules
@@ -0,0 +1,62 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional
+from .logger_config import logger
+
+# 工作进程中的处理器实例，由进程池初始化时传入，每个进程只反序列化一次
+_worker_processor = None
+
+
+def _init_worker(processor):
+    global _worker_processor
+    _worker_processor = processor
+
+
+def _run_branch(method: str, args: tuple) -> Any:
+    """在工作进程中调用处理器的分支方法"""
+    return getattr(_worker_processor, method)(*args)
+
+
+class BranchScheduler:
+    """相互独立分支（结果文件）的调度器
+
+    max_workers大于1时各分支在进程池中执行，按分支大小从大到小提交以均衡负载；
+    等于1时在当前进程中按原顺序执行。结果总是按分支登记的顺序返回，与执行顺序无关。
+
+    用法:
+        scheduler = BranchScheduler(processor, max_workers=4)
+        results = scheduler.run('_process_stage2_branch', {output_name: args}, {output_name: rows})
+    """
+
+    def __init__(self, processor, max_workers: int = 1):
+        if max_workers < 1:
+            raise ValueError(f"max_workers必须大于0，当前值: {max_workers}")
+        self.processor = processor
+        self.max_workers = max_workers
+
+    def run(self, method: str, branches: Dict[str, tuple], sizes: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """执行所有分支
+
+        Args:
+            method: 处理器的分支方法名
+            branches: 分支名称到方法参数的映射
+            sizes: 分支名称到分支大小（行数）的映射，用于决定提交顺序
+
+        Returns:
+            分支名称到返回值的映射，顺序与branches一致
+        """
+        if self.max_workers == 1 or len(branches) <= 1:
+            return {name: getattr(self.processor, method)(*args) for name, args in branches.items()}
+        sizes = sizes or {}
+        # 大的分支先提交，避免最后剩下一个大分支单独运行；大小相同时保持原顺序
+        order = sorted(branches, key=lambda name: -sizes.get(name, 0))
+        workers = min(self.max_workers, len(branches))
+        logger.debug(f"使用{workers}个进程并行处理{len(branches)}个分支: {method}")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self.processor,)) as executor:
+            futures: Dict[str, Future] = {name: executor.submit(_run_branch, method, branches[name]) for name in order}
+            results = {}
+            for name in branches:
+                try:
+                    results[name] = futures[name].result()
+                except Exception as e:
+                    raise Exception(f"分支{name}处理失败: {str(e)}")
+        return results
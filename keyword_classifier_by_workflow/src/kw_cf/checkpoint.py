@@ -0,0 +1,118 @@
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .logger_config import logger
+
+# 检查点格式版本，结构变化时递增，旧检查点不再用于恢复
+CHECKPOINT_VERSION = 1
+
+
+def file_content_hash(file_path: Path) -> str:
+    """计算文件（或目录内所有文件）内容的sha256，与修改时间无关"""
+    file_path = Path(file_path)
+    files = sorted(path for path in file_path.rglob('*') if path.is_file()) if file_path.is_dir() else [file_path]
+    digest = hashlib.sha256()
+    for path in files:
+        if file_path.is_dir():
+            digest.update(path.relative_to(file_path).as_posix().encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class WorkflowCheckpoint:
+    """工作流检查点
+
+    每完成一个层级保存一次：已完成的层级及各层级处理的分支（结果文件名称）、输出文件位置、
+    写入清单，以及工作流规则、待分类文件的内容哈希和影响结果的参数。
+    恢复时只有输入哈希和参数完全一致才使用检查点。
+    """
+
+    def __init__(self, checkpoint_path: Path):
+        self.checkpoint_path = Path(checkpoint_path)
+
+    @staticmethod
+    def fingerprint(rules_file: Path, classification_file: Path, options: Optional[dict] = None) -> dict:
+        """计算工作流输入的指纹
+
+        Args:
+            rules_file: 工作流规则文件路径
+            classification_file: 待分类文件路径
+            options: 影响分类结果或输出位置的参数
+
+        Returns:
+            输入指纹
+        """
+        try:
+            return {
+                'rules_file': str(rules_file),
+                'rules_hash': file_content_hash(rules_file),
+                'classification_file': str(classification_file),
+                'input_hash': file_content_hash(classification_file),
+                'options': options or {},
+            }
+        except Exception as e:
+            raise Exception(f"计算输入哈希失败: {str(e)}")
+
+    def save(self, inputs: dict, completed_levels: List[int], branches: Dict[int, List[str]], state: dict) -> Path:
+        """保存检查点，先写临时文件再替换，避免中断时留下不完整的检查点
+
+        Args:
+            inputs: fingerprint返回的输入指纹
+            completed_levels: 已完成的层级
+            branches: 层级到该层级处理的结果文件名称列表的映射
+            state: 恢复所需的输出文件位置和写入清单
+
+        Returns:
+            检查点文件路径
+        """
+        try:
+            data = {
+                'version': CHECKPOINT_VERSION,
+                'updated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'inputs': inputs,
+                'completed_levels': list(completed_levels),
+                'branches': {str(level): names for level, names in branches.items()},
+                **state,
+            }
+            self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+            temp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2, default=str), encoding='utf-8')
+            os.replace(temp_path, self.checkpoint_path)
+            logger.debug(f'检查点已保存: 已完成层级{completed_levels}')
+            return self.checkpoint_path
+        except Exception as e:
+            raise Exception(f"保存检查点失败: {str(e)}")
+
+    def load(self, inputs: dict, compare: Tuple[str, ...] = ('rules_hash', 'input_hash', 'options')) -> Optional[dict]:
+        """读取与输入指纹一致的检查点，不存在、版本不同或输入已变化时返回None
+
+        Args:
+            inputs: fingerprint返回的输入指纹
+            compare: 需要一致的指纹字段，增量运行时只要求规则和参数不变
+        """
+        if not self.checkpoint_path.exists():
+            return None
+        try:
+            data = json.loads(self.checkpoint_path.read_text(encoding='utf-8'))
+        except Exception as e:
+            logger.warning(f'检查点{self.checkpoint_path}无法读取，将从头开始: {e}')
+            return None
+        if data.get('version') != CHECKPOINT_VERSION:
+            logger.warning('检查点版本不同，将从头开始')
+            return None
+        previous = data.get('inputs', {})
+        changed = [name for name in compare if previous.get(name) != inputs.get(name)]
+        if changed:
+            logger.warning(f'工作流输入已变化（{", ".join(changed)}），检查点不再有效，将从头开始')
+            return None
+        return data
+
+    def clear(self):
+        """删除检查点"""
+        if self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
@@ -0,0 +1,242 @@
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from .keyword_classifier import KeywordClassifier, validate_separator
+from .workflow_processor import WorkFlowProcessor, SCHEDULES
+from .excel_handler import ExcelHandler, EXCEL_SUFFIXES, TABLE_SUFFIX_FORMATS, TABLE_FORMAT_SUFFIXES
+from .sharding import shard_keyword_file, merge_shard_results
+from .service import ClassificationService
+from .logger_config import logger, console_handler
+
+# 工作进程中的处理器，每个进程创建一次，处理的所有待分类文件共用已编译的规则
+_worker_processor: Optional[WorkFlowProcessor] = None
+
+
+def find_keyword_files(path: Path) -> List[Path]:
+    """返回待分类文件列表：文件直接返回，目录返回其中所有以'待分类_'开头的表格文件（按名称排序）"""
+    path = Path(path)
+    if not path.is_dir():
+        return [path]
+    suffixes = (*EXCEL_SUFFIXES, *TABLE_SUFFIX_FORMATS)
+    return sorted(file for file in path.iterdir()
+                  if file.is_file() and file.name.startswith('待分类_') and file.suffix.lower() in suffixes)
+
+
+def _create_processor(options: dict) -> WorkFlowProcessor:
+    classifier = KeywordClassifier(case_sensitive=options['case_sensitive'], separator=options['separator'])
+    return WorkFlowProcessor(keyword_classifier=classifier, output_dir=options['output_dir'],
+                             branch_workers=options['branch_workers'], write_workers=options['write_workers'],
+                             schedule=options['schedule'], chunk_size=options['chunk_size'],
+                             memory_budget_mb=options['memory_budget_mb'], keep_unmatched=options['keep_unmatched'])
+
+
+def _init_worker(options: dict):
+    global _worker_processor
+    _worker_processor = _create_processor(options)
+
+
+def _process_file(rules_file: Path, keyword_file: Path, output_dir: Path) -> dict:
+    """在当前进程的处理器中处理一个待分类文件，失败时返回错误信息而不是抛出异常"""
+    processor = _worker_processor
+    try:
+        processor.set_output_dir(output_dir)
+        result = processor.process_workflow(rules_file, keyword_file)
+        return {'file': str(keyword_file), 'output_dir': str(output_dir), 'stage': result.get('stage'), 'error': None}
+    except Exception as e:
+        return {'file': str(keyword_file), 'output_dir': str(output_dir), 'stage': None, 'error': str(e)}
+
+
+def run_batch(rules_file: Path, keyword_files: List[Path], output_dir: Path, workers: int = 1,
+              case_sensitive: bool = False, separator: str = '&', schedule: str = 'levels',
+              batch: bool = False, chunk_size: Optional[int] = None,
+              memory_budget_mb: Optional[int] = None, keep_unmatched: bool = False) -> List[dict]:
+    """用同一工作流规则处理多个待分类文件
+
+    workers大于1且有多个文件时，各文件在进程池中并行处理；每个工作进程只创建一个处理器，
+    依次处理分配到的文件，规则在进程内只编译一次。只有一个文件时workers用于该文件的分支并行和并行写入。
+
+    Args:
+        rules_file: 工作流规则文件路径
+        keyword_files: 待分类文件列表
+        output_dir: 输出目录
+        workers: 并行进程数
+        case_sensitive: 是否区分大小写
+        separator: 多个匹配规则之间的分隔符
+        schedule: 二级及以上分类的调度方式
+        batch: 是否为目录批量模式，为True时每个待分类文件的结果输出到以文件名命名的子目录
+        chunk_size: 分块执行时每块的关键词数
+        memory_budget_mb: 分块执行的内存预算（MB），多个文件并行时为每个进程的预算
+        keep_unmatched: 是否保留没有匹配的分支的未匹配关键词，分片运行时使用
+
+    Returns:
+        每个文件的处理结果，error为None表示成功
+    """
+    global _worker_processor
+    parallel_files = workers > 1 and len(keyword_files) > 1
+    options = {
+        'case_sensitive': case_sensitive, 'separator': separator, 'output_dir': output_dir, 'schedule': schedule,
+        'chunk_size': chunk_size, 'memory_budget_mb': memory_budget_mb, 'keep_unmatched': keep_unmatched,
+        # 文件之间并行时，单个文件内部不再开启进程池
+        'branch_workers': 1 if parallel_files else workers,
+        'write_workers': 1 if parallel_files else workers,
+    }
+    output_dirs: Dict[Path, Path] = {
+        keyword_file: Path(output_dir) / keyword_file.stem if batch else Path(output_dir) for keyword_file in keyword_files
+    }
+    if not parallel_files:
+        _init_worker(options)
+        try:
+            return [_process_file(rules_file, keyword_file, output_dirs[keyword_file]) for keyword_file in keyword_files]
+        finally:
+            _worker_processor = None
+    workers = min(workers, len(keyword_files))
+    logger.info(f'使用{workers}个进程并行处理{len(keyword_files)}个待分类文件')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as executor:
+        futures = [executor.submit(_process_file, rules_file, keyword_file, output_dirs[keyword_file])
+                   for keyword_file in keyword_files]
+        return [future.result() for future in futures]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='kw-cf', description='按工作流规则对关键词分类（无界面）')
+    parser.add_argument('rules_file', type=Path, help='工作流规则文件（工作流规则_*.xlsx）')
+    parser.add_argument('input', type=Path, help='待分类文件，或包含多个待分类_*文件的目录')
+    parser.add_argument('-o', '--output-dir', type=Path, default=Path('./工作流结果'),
+                        help='输出目录，目录模式下每个待分类文件输出到以文件名命名的子目录（默认: ./工作流结果）')
+    parser.add_argument('-c', '--case-sensitive', action='store_true', help='规则匹配区分大小写')
+    parser.add_argument('-s', '--separator', default='&', help='多个匹配规则之间的分隔符（默认: &）')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='并行进程数：多个文件时为同时处理的文件数，单个文件时为分支并行和写入的进程数（默认: 1）')
+    parser.add_argument('--schedule', choices=SCHEDULES, default='levels', help='二级及以上分类的调度方式（默认: levels）')
+    parser.add_argument('--chunk-size', type=int, help='分块执行，每块的关键词数')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='分块执行的内存预算（MB），按进程内存调整块大小；多个文件并行时为每个进程的预算')
+    parser.add_argument('--keep-unmatched', action='store_true',
+                        help='保留没有匹配的分支的未匹配关键词，运行kw-cf-shard的分片时使用，由kw-cf-merge合并时删除')
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'), default='INFO',
+                        help='控制台日志级别（默认: INFO）')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口，全部文件处理成功时返回0"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    console_handler.setLevel(args.log_level)
+    is_valid, error_message = validate_separator(args.separator)
+    if not is_valid:
+        parser.error(error_message)
+    if args.workers < 1:
+        parser.error(f'workers必须大于0，当前值: {args.workers}')
+    if args.chunk_size is not None and args.chunk_size < 1:
+        parser.error(f'chunk-size必须大于0，当前值: {args.chunk_size}')
+    if args.memory_budget is not None and args.memory_budget < 1:
+        parser.error(f'memory-budget必须大于0，当前值: {args.memory_budget}')
+    if not args.rules_file.is_file():
+        parser.error(f'工作流规则文件不存在: {args.rules_file}')
+    if not args.input.exists():
+        parser.error(f'待分类文件或目录不存在: {args.input}')
+    keyword_files = find_keyword_files(args.input)
+    if not keyword_files:
+        parser.error(f"{args.input} 中没有以'待分类_'开头的文件")
+
+    results = run_batch(args.rules_file, keyword_files, args.output_dir, args.workers, args.case_sensitive,
+                        args.separator, args.schedule, batch=args.input.is_dir(), chunk_size=args.chunk_size,
+                        memory_budget_mb=args.memory_budget, keep_unmatched=args.keep_unmatched)
+    failed = [result for result in results if result['error']]
+    for result in results:
+        if result['error']:
+            logger.error(f"{result['file']} 处理失败: {result['error']}")
+        else:
+            logger.info(f"{result['file']} 处理完成，结果已保存到: {result['output_dir']}")
+    logger.info(f'共{len(results)}个文件，成功{len(results) - len(failed)}个，失败{len(failed)}个')
+    return 1 if failed else 0
+
+
+def shard_main(argv: Optional[List[str]] = None) -> int:
+    """kw-cf-shard入口：按关键词的稳定哈希将待分类文件拆分为多个分片，分别在不同机器上运行kw-cf"""
+    parser = argparse.ArgumentParser(prog='kw-cf-shard', description='按关键词哈希将待分类文件拆分为多个分片')
+    parser.add_argument('input', type=Path, help='待分类文件')
+    parser.add_argument('shards', type=int, help='分片数')
+    parser.add_argument('-o', '--output-dir', type=Path, default=Path('./分片'), help='分片输出目录（默认: ./分片）')
+    parser.add_argument('-f', '--format', choices=('xlsx', *TABLE_FORMAT_SUFFIXES), default='csv', help='分片文件格式（默认: csv）')
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'), default='INFO',
+                        help='控制台日志级别（默认: INFO）')
+    args = parser.parse_args(argv)
+    console_handler.setLevel(args.log_level)
+    if args.shards < 1:
+        parser.error(f'分片数必须大于0，当前值: {args.shards}')
+    if not args.input.is_file():
+        parser.error(f'待分类文件不存在: {args.input}')
+    try:
+        manifest = shard_keyword_file(args.input, args.shards, args.output_dir, output_format=args.format)
+    except Exception as e:
+        logger.error(str(e))
+        return 1
+    logger.info(f"共{manifest['keywords']}个关键词，拆分为{manifest['shard_count']}个分片，已保存到: {args.output_dir}")
+    return 0
+
+
+def merge_main(argv: Optional[List[str]] = None) -> int:
+    """kw-cf-merge入口：合并各分片的运行结果，检查各分片使用的工作流规则一致"""
+    parser = argparse.ArgumentParser(prog='kw-cf-merge', description='将各分片的工作流结果合并为一次运行的结果')
+    parser.add_argument('shard_dir', type=Path, help='kw-cf-shard的输出目录（包含分片清单）')
+    parser.add_argument('result_dirs', type=Path, nargs='+', help='各分片的工作流结果目录')
+    parser.add_argument('-o', '--output-dir', type=Path, default=Path('./工作流结果'), help='合并结果的输出目录（默认: ./工作流结果）')
+    parser.add_argument('-f', '--format', choices=('xlsx', *TABLE_FORMAT_SUFFIXES), default='xlsx', help='合并结果的格式（默认: xlsx）')
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'), default='INFO',
+                        help='控制台日志级别（默认: INFO）')
+    args = parser.parse_args(argv)
+    console_handler.setLevel(args.log_level)
+    try:
+        merge_shard_results(args.shard_dir, args.result_dirs, args.output_dir, ExcelHandler(output_format=args.format))
+    except Exception as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+def serve_main(argv: Optional[List[str]] = None) -> int:
+    """kw-cf-serve入口：在本机启动分类服务，规则只加载和编译一次"""
+    parser = argparse.ArgumentParser(prog='kw-cf-serve', description='在本机启动关键词分类HTTP服务')
+    parser.add_argument('rules_files', type=Path, nargs='+',
+                        help='工作流规则文件，请求中按去掉"工作流规则_"前缀的文件名选择规则')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，只允许本机回环地址（默认: 127.0.0.1）')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口（默认: 8765）')
+    parser.add_argument('-c', '--case-sensitive', action='store_true', help='规则匹配区分大小写')
+    parser.add_argument('-s', '--separator', default='&', help='多个匹配规则之间的分隔符（默认: &）')
+    parser.add_argument('--max-concurrency', type=int, default=4, help='同时处理的分类请求数上限（默认: 4）')
+    parser.add_argument('--queue-timeout', type=float, default=5.0, help='达到并发上限时请求等待的秒数，超时返回503（默认: 5）')
+    parser.add_argument('--max-keywords', type=int, default=100_000, help='单个请求的关键词数上限（默认: 100000）')
+    parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'), default='INFO',
+                        help='控制台日志级别（默认: INFO）')
+    args = parser.parse_args(argv)
+    console_handler.setLevel(args.log_level)
+    is_valid, error_message = validate_separator(args.separator)
+    if not is_valid:
+        parser.error(error_message)
+    rules_files = {}
+    for rules_file in args.rules_files:
+        if not rules_file.is_file():
+            parser.error(f'工作流规则文件不存在: {rules_file}')
+        rules_files[rules_file.stem.removeprefix('工作流规则_')] = rules_file
+    try:
+        service = ClassificationService(rules_files, args.case_sensitive, args.separator, args.max_concurrency,
+                                        args.queue_timeout, args.max_keywords)
+        server = service.create_server(args.host, args.port)
+    except Exception as e:
+        logger.error(str(e))
+        return 1
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('分类服务已停止')
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,457 @@
 import pandas as pd
 import datetime
+import json
+import importlib.util
+import urllib.parse
+import openpyxl
 from pathlib import Path
 from .models import WorkFlowRule,WorkFlowRules,UnclassifiedKeywords
-from typing import  Dict,Optional,Callable
+from typing import  Dict,List,Optional,Callable,Literal,Iterator
 from .logger_config import logger
+from .input_cache import InputCache
+from .metrics import IO_COUNTERS, new_counters, path_size
+
+ReaderEngine = Literal['auto', 'calamine', 'openpyxl', 'pyxlsb']
+WriterEngine = Literal['auto', 'openpyxl', 'write_only', 'xlsxwriter']
+TableFormat = Literal['xlsx', 'csv', 'parquet', 'arrow']
+
+# 读取引擎与其依赖模块的对应关系
+READER_ENGINE_MODULES: Dict[str, str] = {
+    'calamine': 'python_calamine',
+    'openpyxl': 'openpyxl',
+    'pyxlsb': 'pyxlsb',
+}
+
+# 写入引擎：openpyxl为pandas默认写入方式（在内存中构建完整单元格对象模型），
+# write_only与xlsxwriter为流式写入，内存占用与行数无关
+WRITER_ENGINES = ('auto', 'openpyxl', 'write_only', 'xlsxwriter')
+
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm', '.xls', '.xlsb')
+# 非Excel格式的文件后缀，读取时.feather/.ipc同样按Arrow处理
+TABLE_FORMAT_SUFFIXES: Dict[str, str] = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+TABLE_SUFFIX_FORMATS: Dict[str, str] = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
+# Excel单个sheet的最大行数（含表头），超出的行写入编号的续表sheet
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_SHEET_NAME_LENGTH = 31
+SPILL_SHEET_SUFFIX = '_续'
+# 目录形式的结果中记录sheet顺序的索引文件（JSON列表），不是表格文件，读取sheet时忽略
+SHEET_ORDER_FILE = 'sheet顺序.json'
+
+# pandas读取Excel、CSV时默认识别为缺失值的字符串，逐行读取xlsx时按同样规则丢弃，
+# 使流式读取与read_keyword_file的结果一致
+DEFAULT_NA_STRINGS = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+})
+
+# 文件名中不能出现的字符，sheet名称保存为文件名时按%XX转义
+_UNSAFE_FILE_NAME_CHARS = '<>:"/\\|?*%'
+
+
+def _cell_value(value):
+    """将DataFrame单元格的值转换为可写入的值，缺失值写为空单元格"""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _iter_sheet_rows(df: pd.DataFrame) -> Iterator[list]:
+    """逐行生成DataFrame的表头与数据行"""
+    yield [str(column) for column in df.columns]
+    for row in df.itertuples(index=False, name=None):
+        yield [_cell_value(value) for value in row]
+
+
+def _spill_sheet_name(sheet_name: str, part: int) -> str:
+    """续表sheet的名称，如 手机_续2"""
+    suffix = f'{SPILL_SHEET_SUFFIX}{part}'
+    return sheet_name[:EXCEL_MAX_SHEET_NAME_LENGTH - len(suffix)] + suffix
+
+
+def _split_excel_sheets(sheets: Dict[str, pd.DataFrame], max_rows: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+    """将超出Excel行数上限的sheet拆分为编号的续表sheet，max_rows为每个sheet的数据行数，默认为行数上限减去表头"""
+    if max_rows is None:
+        max_rows = EXCEL_MAX_ROWS - 1
+    result = {}
+    for sheet_name, df in sheets.items():
+        if len(df) <= max_rows:
+            result[sheet_name] = df
+            continue
+        parts = range(0, len(df), max_rows)
+        logger.warning(f"Sheet '{sheet_name}' 共{len(df)}行，超出Excel行数上限，拆分为{len(parts)}个sheet")
+        for part, start in enumerate(parts, 1):
+            part_name = sheet_name if part == 1 else _spill_sheet_name(sheet_name, part)
+            result[part_name] = df.iloc[start:start + max_rows]
+    return result
+
+
+def _group_spilled_sheets(sheet_names: List[str]) -> Dict[str, List[str]]:
+    """按原sheet分组工作簿中的sheet名称：原sheet名称 -> [原sheet, 续表2, 续表3, ...]"""
+    groups: Dict[str, List[str]] = {}
+    base_name = None
+    part = 1
+    for sheet_name in sheet_names:
+        if base_name is not None and sheet_name == _spill_sheet_name(base_name, part + 1):
+            groups[base_name].append(sheet_name)
+            part += 1
+            continue
+        groups[sheet_name] = [sheet_name]
+        base_name = sheet_name
+        part = 1
+    return groups
+
+
+def _merge_spilled_sheets(sheets: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """将续表sheet合并回原sheet，与_split_excel_sheets互逆"""
+    return {
+        base_name: sheets[parts[0]] if len(parts) == 1 else pd.concat([sheets[part] for part in parts], ignore_index=True)
+        for base_name, parts in _group_spilled_sheets(list(sheets)).items()
+    }
+
+
+def _sheet_file_stem(sheet_name: str) -> str:
+    """sheet名称转换为可用的文件名"""
+    return ''.join(f'%{ord(char):02X}' if char in _UNSAFE_FILE_NAME_CHARS else char for char in sheet_name)
+
+
+def _sheet_order(sheet_name: str) -> tuple:
+    """没有sheet顺序索引的目录中sheet的顺序：Sheet1在前，未匹配关键词在后"""
+    return (sheet_name != 'Sheet1', sheet_name == '未匹配关键词', sheet_name)
+
+
+def _to_arrow_compatible(df: pd.DataFrame) -> pd.DataFrame:
+    """Parquet/Arrow要求列类型一致，混合类型的列转换为字符串"""
+    mixed_columns = [
+        column for column in df.columns
+        if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed')
+    ]
+    if not mixed_columns:
+        return df
+    df = df.copy()
+    for column in mixed_columns:
+        df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
 
 class ExcelHandler:
-    def __init__(self,error_callback:Optional[Callable]=None):
+    def __init__(self,error_callback:Optional[Callable]=None,reader_engine:ReaderEngine='auto',
+                 writer_engine:WriterEngine='auto',output_format:TableFormat='xlsx',
+                 input_cache:Optional[InputCache]=None):
+        """初始化Excel处理器
+
+        Args:
+            error_callback: 错误回调函数
+            reader_engine: 读取引擎，auto优先使用calamine（Rust实现），不可用时自动回退到openpyxl；
+                           .xlsb文件使用calamine或pyxlsb读取
+            writer_engine: 写入引擎，auto优先使用xlsxwriter的constant_memory模式，不可用时使用openpyxl的write_only模式；
+                           openpyxl为pandas默认写入方式
+            output_format: 结果文件格式，xlsx为一个多sheet的工作簿；csv/parquet/arrow为一个目录，每个sheet一个文件
+            input_cache: 输入文件缓存，设置后重复读取同一待分类、工作流规则文件时直接加载解析结果
+        """
+        if reader_engine not in ('auto', *READER_ENGINE_MODULES):
+            raise ValueError(f"不支持的读取引擎: {reader_engine}，支持的读取引擎: {['auto', *READER_ENGINE_MODULES]}")
+        if writer_engine not in WRITER_ENGINES:
+            raise ValueError(f"不支持的写入引擎: {writer_engine}，支持的写入引擎: {list(WRITER_ENGINES)}")
+        if output_format not in ('xlsx', *TABLE_FORMAT_SUFFIXES):
+            raise ValueError(f"不支持的结果文件格式: {output_format}，支持的格式: {['xlsx', *TABLE_FORMAT_SUFFIXES]}")
         self.error_callback:Optional[Callable] = error_callback
+        self.reader_engine:ReaderEngine = reader_engine
+        self.writer_engine:WriterEngine = writer_engine
+        self.output_format:TableFormat = output_format
+        self.input_cache:Optional[InputCache] = input_cache
+        # 累计读取、写入的文件数和字节数，用于运行指标
+        self.io_counters:Dict[str,int] = new_counters(IO_COUNTERS)
+
+    def __getstate__(self):
+        # 回调函数（如界面对象的方法）无法传递到工作进程
+        state = self.__dict__.copy()
+        state['error_callback'] = None
+        return state
+
+    def _count_io(self, kind: Literal['read', 'written'], file_path: Path):
+        """累计一次文件读取或写入，目录按其中所有文件的大小计算"""
+        self.io_counters[f'files_{kind}'] += 1
+        self.io_counters[f'bytes_{kind}'] += path_size(file_path)
+
+    def get_output_path(self, output_dir: Path, name: str) -> Path:
+        """按结果文件格式生成输出路径：xlsx为工作簿文件，其他格式为目录"""
+        if self.output_format == 'xlsx':
+            return Path(output_dir) / f'{name}.xlsx'
+        return Path(output_dir) / name
+
+    @staticmethod
+    def is_sheet_directory(file_path: Path) -> bool:
+        """判断路径是否为目录形式的结果（每个sheet一个文件）"""
+        file_path = Path(file_path)
+        suffix = file_path.suffix.lower()
+        return file_path.is_dir() or (suffix not in EXCEL_SUFFIXES and suffix not in TABLE_SUFFIX_FORMATS)
+
+    @staticmethod
+    def _list_sheet_files(directory: Path) -> Dict[str, Path]:
+        """列出目录形式结果中的sheet文件，按sheet顺序索引排列，索引中没有的sheet排在最后"""
+        files = {
+            urllib.parse.unquote(path.stem): path
+            for path in Path(directory).iterdir()
+            if path.is_file() and path.suffix.lower() in TABLE_SUFFIX_FORMATS
+        }
+        order = [name for name in ExcelHandler._read_sheet_order(directory) if name in files]
+        order += sorted(set(files) - set(order), key=_sheet_order)
+        return {name: files[name] for name in order}
+
+    @staticmethod
+    def _read_sheet_order(directory: Path) -> List[str]:
+        """读取目录中的sheet顺序索引，没有索引时返回空列表"""
+        index_path = Path(directory) / SHEET_ORDER_FILE
+        if not index_path.is_file():
+            return []
+        return json.loads(index_path.read_text(encoding='utf-8'))
+
+    def _read_table_file(self, file_path: Path, usecols=None, dtype=None, nrows=None) -> pd.DataFrame:
+        """读取单个CSV/Parquet/Arrow文件，参数含义与pd.read_excel一致"""
+        table_format = TABLE_SUFFIX_FORMATS[Path(file_path).suffix.lower()]
+        self._count_io('read', file_path)
+        select = usecols if callable(usecols) or usecols is None else (lambda column: column in set(usecols))
+        if table_format == 'csv':
+            # CSV没有类型信息，统一按字符串读取，避免如001的关键词被转换为数字
+            return pd.read_csv(file_path, usecols=select, dtype=str, nrows=nrows, encoding='utf-8-sig')
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        if table_format == 'parquet':
+            names = pyarrow.parquet.read_schema(file_path).names
+        else:
+            with pyarrow.memory_map(str(file_path)) as source:
+                names = pyarrow.ipc.open_file(source).schema.names
+        columns = [name for name in names if select is None or select(name)]
+        if table_format == 'parquet':
+            df = pd.read_parquet(file_path, columns=columns)
+        else:
+            df = pd.read_feather(file_path, columns=columns)
+        if nrows is not None:
+            df = df.head(nrows)
+        if dtype is None:
+            return df
+        # 只转换非空值，空单元格保持为缺失值，不会变成字符串'None'
+        return df.where(df.isna(), df.astype(dtype))
+
+    def _write_table_file(self, file_path: Path, df: pd.DataFrame):
+        """写入单个CSV/Parquet/Arrow文件"""
+        table_format = TABLE_SUFFIX_FORMATS[Path(file_path).suffix.lower()]
+        if table_format == 'csv':
+            df.to_csv(file_path, index=False, encoding='utf-8-sig')
+        elif table_format == 'parquet':
+            _to_arrow_compatible(df).to_parquet(file_path, index=False)
+        else:
+            _to_arrow_compatible(df).reset_index(drop=True).to_feather(file_path)
+        self._count_io('written', file_path)
+
+    def _write_sheet_directory(self, directory: Path, sheets: Dict[str, pd.DataFrame], replace: bool) -> Path:
+        """写入目录形式的结果，replace为True时先删除目录中原有的sheet文件"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        existing = self._list_sheet_files(directory)
+        for sheet_name, path in existing.items():
+            if replace or sheet_name in sheets:
+                path.unlink()
+        suffix = TABLE_FORMAT_SUFFIXES.get(self.output_format, TABLE_FORMAT_SUFFIXES['parquet'])
+        for sheet_name, df in sheets.items():
+            self._write_table_file(directory / f'{_sheet_file_stem(sheet_name)}{suffix}', df)
+        # 文件系统不保存sheet的顺序，写入索引使读取时与xlsx结果的sheet顺序一致
+        # 追加写入时已有的sheet保持原位置，新sheet排在后面
+        order = list(sheets) if replace else list(existing) + [name for name in sheets if name not in existing]
+        (directory / SHEET_ORDER_FILE).write_text(json.dumps(order, ensure_ascii=False), encoding='utf-8')
+        return directory
+
+    def read_table(self, file_path: Path, sheet_name: str|int|None = 0, **kwargs) -> pd.DataFrame | Dict[str, pd.DataFrame]:
+        """读取Excel、CSV、Parquet、Arrow文件或目录形式的结果，返回值与pd.read_excel一致
+
+        单个CSV/Parquet/Arrow文件视为只有Sheet1的工作簿；Excel中的续表sheet会合并回原sheet。
+
+        Args:
+            file_path: 文件或目录路径
+            sheet_name: sheet名称或序号，None表示读取所有sheet
+            **kwargs: usecols、dtype、nrows等读取参数
+
+        Returns:
+            DataFrame，或sheet_name为None时sheet名称到DataFrame的映射
+        """
+        file_path = Path(file_path)
+        if file_path.is_dir():
+            sheet_files = self._list_sheet_files(file_path)
+            if sheet_name is None:
+                return {name: self._read_table_file(path, **kwargs) for name, path in sheet_files.items()}
+            if isinstance(sheet_name, int):
+                sheet_name = list(sheet_files)[sheet_name]
+            if sheet_name not in sheet_files:
+                raise ValueError(f"{file_path} 中不存在Sheet '{sheet_name}'")
+            return self._read_table_file(sheet_files[sheet_name], **kwargs)
+        if file_path.suffix.lower() in TABLE_SUFFIX_FORMATS:
+            df = self._read_table_file(file_path, **kwargs)
+            return {'Sheet1': df} if sheet_name is None else df
+        self._count_io('read', file_path)
+        if sheet_name is None:
+            return _merge_spilled_sheets(self.read_excel(file_path, sheet_name=None, **kwargs))
+        # 读取单个sheet时同样合并其续表sheet，sheet序号按合并后的sheet计算
+        groups = _group_spilled_sheets(self._excel_sheet_names(file_path))
+        if isinstance(sheet_name, int):
+            sheet_name = list(groups)[sheet_name]
+        parts = groups.get(sheet_name, [sheet_name])
+        if len(parts) == 1:
+            return self.read_excel(file_path, sheet_name=sheet_name, **kwargs)
+        nrows = kwargs.pop('nrows', None)
+        sheets = self.read_excel(file_path, sheet_name=parts, **kwargs)
+        df = pd.concat([sheets[part] for part in parts], ignore_index=True)
+        return df.head(nrows) if nrows is not None else df
+
+    def _excel_sheet_names(self, file_path: Path) -> List[str]:
+        """Excel文件中实际的sheet名称（包括续表sheet），不读取单元格"""
+        if Path(file_path).suffix.lower() in ('.xlsx', '.xlsm'):
+            workbook = openpyxl.load_workbook(file_path, read_only=True)
+            try:
+                return list(workbook.sheetnames)
+            finally:
+                workbook.close()
+        with pd.ExcelFile(file_path, engine=self.get_reader_engines(file_path)[0]) as excel_file:
+            return list(excel_file.sheet_names)
+
+    def read_sheet_names(self, file_path: Path) -> List[str]:
+        """读取文件中的sheet名称（续表sheet不单独列出）"""
+        if Path(file_path).is_dir():
+            return list(self._list_sheet_files(file_path))
+        return list(self.read_table(file_path, sheet_name=None, nrows=0).keys())
+
+    def get_writer_engine(self) -> str:
+        """返回实际使用的写入引擎"""
+        if self.writer_engine == 'auto':
+            return 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') is not None else 'write_only'
+        return self.writer_engine
+
+    def write_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """将多个sheet写入新的文件（已存在的文件会被覆盖）
+
+        目录路径按每个sheet一个文件写入；Excel文件中超出行数上限的sheet自动拆分为续表sheet。
+
+        Args:
+            output_file: 输出文件路径
+            sheets: sheet名称到DataFrame的映射，按顺序写入
+
+        Returns:
+            输出文件路径
+        """
+        output_file = Path(output_file)
+        if self.is_sheet_directory(output_file):
+            return self._write_sheet_directory(output_file, sheets, replace=True)
+        if output_file.suffix.lower() in TABLE_SUFFIX_FORMATS:
+            if len(sheets) != 1:
+                raise ValueError(f"{output_file.name} 只能保存一个sheet，当前有{len(sheets)}个，请使用目录形式的结果")
+            self._write_table_file(output_file, next(iter(sheets.values())))
+            return output_file
+        sheets = _split_excel_sheets(sheets)
+        engine = self.get_writer_engine()
+        if engine == 'xlsxwriter':
+            import xlsxwriter
+            workbook = xlsxwriter.Workbook(str(output_file), {'constant_memory': True, 'strings_to_numbers': False,
+                                                              'strings_to_formulas': False, 'strings_to_urls': False})
+            try:
+                for sheet_name, df in sheets.items():
+                    worksheet = workbook.add_worksheet(sheet_name)
+                    for row_index, row in enumerate(_iter_sheet_rows(df)):
+                        worksheet.write_row(row_index, 0, row)
+            finally:
+                workbook.close()
+        elif engine == 'write_only':
+            workbook = openpyxl.Workbook(write_only=True)
+            for sheet_name, df in sheets.items():
+                worksheet = workbook.create_sheet(title=sheet_name)
+                for row in _iter_sheet_rows(df):
+                    worksheet.append(row)
+            workbook.save(output_file)
+        else:
+            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+        self._count_io('written', output_file)
+        return output_file
+
+    def append_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """向已有文件追加sheet，同名sheet会被替换
+
+        目录形式的结果只写入新的sheet文件；流式写入引擎无法修改已有Excel文件，
+        会先读取原有的sheet，再与新sheet一起一次性重新写入。
+
+        Args:
+            output_file: 已有的文件路径
+            sheets: sheet名称到DataFrame的映射
+
+        Returns:
+            输出文件路径
+        """
+        if self.is_sheet_directory(output_file):
+            return self._write_sheet_directory(output_file, sheets, replace=False)
+        fits_excel = all(len(df) < EXCEL_MAX_ROWS for df in sheets.values())
+        if self.get_writer_engine() == 'openpyxl' and fits_excel and Path(output_file).suffix.lower() in EXCEL_SUFFIXES:
+            self._count_io('read', output_file)
+            with pd.ExcelWriter(output_file, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+            self._count_io('written', output_file)
+            return Path(output_file)
+        existing = self.read_table(output_file, sheet_name=None)
+        existing.update(sheets)
+        return self.write_sheets(output_file, existing)
+
+    @staticmethod
+    def is_engine_available(engine: str) -> bool:
+        """检查读取引擎依赖是否已安装"""
+        module_name = READER_ENGINE_MODULES.get(engine)
+        return module_name is not None and importlib.util.find_spec(module_name) is not None
+
+    def get_reader_engines(self, file_path: Path) -> List[str]:
+        """按优先级返回可用于读取该文件的引擎列表，列表之后的引擎作为前面引擎失败时的回退"""
+        is_xlsb = Path(file_path).suffix.lower() == '.xlsb'
+        if self.reader_engine == 'auto':
+            candidates = ['calamine', 'pyxlsb'] if is_xlsb else ['calamine', 'openpyxl']
+        elif is_xlsb:
+            # openpyxl无法读取二进制工作簿
+            candidates = [self.reader_engine, 'calamine', 'pyxlsb']
+        else:
+            candidates = [self.reader_engine, 'openpyxl']
+        if is_xlsb and 'openpyxl' in candidates:
+            candidates.remove('openpyxl')
+        engines = []
+        for engine in candidates:
+            if engine not in engines and self.is_engine_available(engine):
+                engines.append(engine)
+        if not engines:
+            raise ValueError(f"没有可用于读取 {Path(file_path).name} 的引擎，请安装 {' 或 '.join(READER_ENGINE_MODULES[e] for e in candidates)}")
+        return engines
+
+    def read_excel(self, file_path: Path, **kwargs) -> pd.DataFrame | Dict[str, pd.DataFrame]:
+        """使用配置的读取引擎读取Excel，失败时依次回退到后备引擎
+
+        Args:
+            file_path: Excel文件路径
+            **kwargs: 传递给pd.read_excel的参数
+
+        Returns:
+            pd.read_excel的返回值
+        """
+        engines = self.get_reader_engines(file_path)
+        for i, engine in enumerate(engines):
+            try:
+                return pd.read_excel(file_path, engine=engine, **kwargs)
+            except Exception as e:
+                if i == len(engines) - 1:
+                    raise
+                logger.warning(f"使用{engine}引擎读取 {file_path} 失败: {e}，回退到{engines[i + 1]}引擎")
     def read_rules(self, file_path: Path):
         """从Excel文件中读取分词规则，并进行去重"""
         try:
             # 默认读取分词规则sheet的分词规则列
-            df = pd.read_excel(file_path, sheet_name='分词规则')
+            df = self.read_table(file_path, sheet_name='分词规则')
             
             # 检查是否存在分词规则列
             if '分词规则' in df.columns:
@@ -27,7 +466,7 @@ class ExcelHandler:
     def read_keywords(self, file_path: Path):
         """从Excel文件中读取关键词，并进行去重"""
         try:
-            df = pd.read_excel(file_path)
+            df = self.read_table(file_path)
             
             # 使用第一列作为关键词列
             keywords = df.iloc[:, 0].dropna().astype(str).tolist()
@@ -36,6 +475,28 @@ class ExcelHandler:
         except Exception as e:
             raise Exception(f"读取关键词文件失败: {str(e)}")
     
+    def add_columns(self, output_file: Path, columns: Dict[str, Dict[str, Dict[str, str]]]) -> Path:
+        """按关键词映射为多个sheet新增列，整个文件只读取和写入一次
+
+        Args:
+            output_file: 已有的文件路径
+            columns: Dict[sheet名称, Dict[新列名称, Dict[关键词, 列值]]]，未匹配到的关键词留空
+
+        Returns:
+            输出文件路径
+        """
+        sheets = self.read_table(output_file, sheet_name=None)
+        for sheet_name, sheet_columns in columns.items():
+            if sheet_name not in sheets:
+                raise ValueError(f"{output_file} 中不存在Sheet '{sheet_name}'")
+            df = sheets[sheet_name]
+            for column_name, keyword_to_value in sheet_columns.items():
+                df[column_name] = df['关键词'].map(keyword_to_value)
+        if self.is_sheet_directory(output_file):
+            # 目录形式的结果只需重写被修改的sheet
+            return self.append_sheets(output_file, {sheet_name: sheets[sheet_name] for sheet_name in columns})
+        return self.write_sheets(output_file, sheets)
+
     def save_results(self, result_df: pd.DataFrame, output_file: Path|None=None,sheet_name:str|None=None):
         """保存分类结果到Excel文件
         
@@ -51,7 +512,7 @@ class ExcelHandler:
                 # 设置默认输出目录
                 output_dir = Path('./默认输出结果')
                 # 设置默认文件名
-                output_file = output_dir / f'默认输出结果_{current_time}.xlsx'
+                output_file = self.get_output_path(output_dir, f'默认输出结果_{current_time}')
             else:
                 output_file = Path(output_file)
             
@@ -66,16 +527,20 @@ class ExcelHandler:
                 # 权限错误时，使用用户目录作为备选
                 user_dir = Path.home()
                 current_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_file = user_dir / f"关键词分类结果_{current_time}.xlsx"
+                output_file = self.get_output_path(user_dir, f"关键词分类结果_{current_time}")
                 logger.warning(f"无法创建原目录，将保存到用户目录: {output_file}")
             except Exception as e:
                 # 其他错误时，保存到当前目录
                 current_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_file = Path(f"关键词分类结果_{current_time}.xlsx")
+                output_file = self.get_output_path(Path('.'), f"关键词分类结果_{current_time}")
                 logger.error(f"创建目录时出错: {str(e)}，将保存到当前目录: {output_file}")
             
             # 保存到Excel
-            result_df.to_excel(output_file, index=False, sheet_name=sheet_name)
+            if self.get_writer_engine() == 'openpyxl' and output_file.suffix.lower() in EXCEL_SUFFIXES and len(result_df) < EXCEL_MAX_ROWS:
+                result_df.to_excel(output_file, index=False, sheet_name=sheet_name)
+                self._count_io('written', output_file)
+            else:
+                self.write_sheets(output_file, {sheet_name or 'Sheet1': result_df})
             
             return output_file
         except Exception as e:
@@ -96,18 +561,22 @@ class ExcelHandler:
             file_name = file_path.name
             if not file_name.startswith("工作流规则_"):
                 raise ValueError(f"工作流规则文件名必须以'工作流规则_'开头，当前文件名: {file_name}")
+            # 影响解析结果的读取选项，作为缓存键的一部分
+            cache_options = {'reader_engine': self.reader_engine, 'sheet_name': None}
+            if self.input_cache:
+                cached = self.input_cache.get('workflow_rules', file_path, cache_options)
+                if cached is not None:
+                    return cached
             
-            # 读取Excel文件的所有sheet
-            excel_file = pd.ExcelFile(file_path)
-            sheet_names = excel_file.sheet_names
+            # 一次性读取Excel文件的所有sheet
+            sheets = self.read_table(file_path, sheet_name=None)
             
             # 检查是否至少有Sheet1
-            if 'Sheet1' not in sheet_names:
+            if 'Sheet1' not in sheets:
                 raise ValueError("工作流规则文件必须包含Sheet1")
             rules_data = []
             # 遍历所有sheet，读取规则
-            for i, sheet_name in enumerate(sheet_names):
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
+            for i, (sheet_name, df) in enumerate(sheets.items()):
                 # 检查sheet是否有数据
                 if df.empty:
                     continue
@@ -140,7 +609,10 @@ class ExcelHandler:
                         rule_data['parent_rule'] = row['上层分类规则']
                     rules_data.append(WorkFlowRule(**rule_data))
                     rule_data = {}
-            return WorkFlowRules(rules = rules_data)
+            workflow_rules = WorkFlowRules(rules = rules_data)
+            if self.input_cache:
+                self.input_cache.put('workflow_rules', file_path, workflow_rules, cache_options)
+            return workflow_rules
         except Exception as e:
             raise Exception(f"读取工作流规则失败: {str(e)}")
     
@@ -158,36 +630,149 @@ class ExcelHandler:
             file_name = file_path.name
             if not file_name.startswith("待分类_"):
                 raise ValueError(f"待分类文件名必须以'待分类_'开头，当前文件名: {file_name}")
+            # 影响解析结果的读取选项，作为缓存键的一部分
+            cache_options = {'reader_engine': self.reader_engine, 'usecols': ['关键词'], 'dtype': 'str'}
+            if self.input_cache:
+                cached = self.input_cache.get('keywords', file_path, cache_options)
+                if cached is not None:
+                    return cached
             
-            # 读取Excel文件
-            df = pd.read_excel(file_path)
+            # 只读取关键词列，其余列不解析
+            df = self.read_table(file_path, usecols=lambda column: column == '关键词', dtype=str)
             
             # 检查是否包含关键词列
             if '关键词' not in df.columns:
                 raise ValueError("待分类文件必须包含'关键词'列")
             
             # 清理数据
-            keywords = df['关键词'].dropna().astype(str).tolist()
-            return UnclassifiedKeywords(data=keywords)
+            keywords = UnclassifiedKeywords(data=df['关键词'].dropna().astype(str).tolist())
+            if self.input_cache:
+                self.input_cache.put('keywords', file_path, keywords, cache_options)
+            return keywords
         except Exception as e:
             raise Exception(f"读取待分类文件失败: {str(e)}")
-    def read_stage_results(self, file_path: Path) -> Dict[str,pd.DataFrame]:
+
+    def iter_keyword_file(self, file_path: Path, chunk_size: int = 100_000) -> Iterator[UnclassifiedKeywords]:
+        """流式读取待分类文件，按块返回清理后的关键词
+
+        xlsx通过openpyxl的read_only模式逐行读取，CSV/Parquet/Arrow按块读取，只解析关键词列，
+        内存占用与文件大小无关。关键词在块间同样保序去重，所有块拼接后与read_keyword_file的结果一致。
+
+        Args:
+            file_path: 待分类文件路径
+            chunk_size: 每块的原始行数
+
+        Yields:
+            UnclassifiedKeywords: 每块清理后的关键词（空块不返回）
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size必须大于0，当前值: {chunk_size}")
+        file_name = file_path.name
+        if not file_name.startswith("待分类_"):
+            raise ValueError(f"待分类文件名必须以'待分类_'开头，当前文件名: {file_name}")
+
+        seen = set()
+
+        def to_chunk(raw_keywords: List) -> Optional[UnclassifiedKeywords]:
+            values = [value for value in raw_keywords if value is not None]
+            if not values:
+                return None
+            cleaned = UnclassifiedKeywords(data=values).data
+            fresh = [keyword for keyword in cleaned if keyword not in seen]
+            seen.update(fresh)
+            return UnclassifiedKeywords(data=fresh) if fresh else None
+
+        for raw_keywords in self._iter_raw_keywords(file_path, chunk_size):
+            chunk = to_chunk(raw_keywords)
+            if chunk:
+                yield chunk
+
+    def _iter_raw_keywords(self, file_path: Path, chunk_size: int) -> Iterator[List]:
+        """按块读取待分类文件关键词列的原始值"""
+        table_format = TABLE_SUFFIX_FORMATS.get(file_path.suffix.lower())
+        if table_format is not None or file_path.suffix.lower() in ('.xlsx', '.xlsm'):
+            # 其余格式通过read_keyword_file读取，在read_table中计数
+            self._count_io('read', file_path)
+        if table_format == 'csv':
+            reader = pd.read_csv(file_path, usecols=lambda column: column == '关键词', dtype=str,
+                                 chunksize=chunk_size, encoding='utf-8-sig')
+            with reader:
+                for df in reader:
+                    if '关键词' not in df.columns:
+                        raise ValueError("待分类文件必须包含'关键词'列")
+                    yield df['关键词'].dropna().tolist()
+        elif table_format in ('parquet', 'arrow'):
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+            if table_format == 'parquet':
+                parquet_file = pyarrow.parquet.ParquetFile(file_path)
+                if '关键词' not in parquet_file.schema_arrow.names:
+                    raise ValueError("待分类文件必须包含'关键词'列")
+                for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=['关键词']):
+                    yield batch.column(0).to_pylist()
+            else:
+                with pyarrow.memory_map(str(file_path)) as source:
+                    reader = pyarrow.ipc.open_file(source)
+                    if '关键词' not in reader.schema.names:
+                        raise ValueError("待分类文件必须包含'关键词'列")
+                    for i in range(reader.num_record_batches):
+                        column = reader.get_batch(i).column('关键词')
+                        for start in range(0, len(column), chunk_size):
+                            yield column.slice(start, chunk_size).to_pylist()
+        elif file_path.suffix.lower() in ('.xlsx', '.xlsm'):
+            try:
+                workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            except Exception as e:
+                raise Exception(f"读取待分类文件失败: {str(e)}")
+            try:
+                # 第一个sheet及其续表sheet
+                parts = next(iter(_group_spilled_sheets(workbook.sheetnames).values()))
+                buffer = []
+                for part in parts:
+                    worksheet = workbook[part]
+                    header = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+                    if '关键词' not in header:
+                        raise ValueError("待分类文件必须包含'关键词'列")
+                    column = header.index('关键词') + 1
+                    for (value,) in worksheet.iter_rows(min_row=2, min_col=column, max_col=column, values_only=True):
+                        # 与pandas一致：整数值的浮点数按整数输出
+                        if isinstance(value, float) and value.is_integer():
+                            value = int(value)
+                        elif isinstance(value, str) and value in DEFAULT_NA_STRINGS:
+                            value = None
+                        buffer.append(value)
+                        if len(buffer) >= chunk_size:
+                            yield buffer
+                            buffer = []
+                yield buffer
+            finally:
+                workbook.close()
+        else:
+            # .xls/.xlsb及目录不支持逐行读取，整体读取关键词列后分块
+            keywords = self.read_keyword_file(file_path).data
+            for start in range(0, len(keywords), chunk_size):
+                yield keywords[start:start + chunk_size]
+    def read_stage_results(self, file_path: Path, columns: Optional[List[str]] = None) -> Dict[str,pd.DataFrame]:
         """读取分类结果文件
         
         Args:
             file_path: 分类结果文件路径
+            columns: 只读取的列，None表示读取所有列，不存在的列忽略
             
         Returns:
             Dict[str:pd.DataFrame]classified_sheet_name:pd.DataFrame
         """
         try:
-            # 读取Excel文件的所有sheet
-            excel_file = pd.ExcelFile(file_path)
-            sheet_names = excel_file.sheet_names
+            # 一次性读取Excel文件的所有sheet
+            if columns is None:
+                sheets = self.read_table(file_path, sheet_name=None)
+            else:
+                wanted = set(columns)
+                sheets = self.read_table(file_path, sheet_name=None, usecols=lambda column: column in wanted)
             result = {}
             
-            for sheet_name in sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
+            for sheet_name, df in sheets.items():
                 if df.empty:
                     continue
                 if '关键词' not in df.columns:
@@ -210,8 +795,7 @@ class ExcelHandler:
             result = {}
             for output_name,file_path in file_path.items():
                 # 读取Excel文件的所有sheet
-                excel_file = pd.ExcelFile(file_path)
-                sheet_names = list(excel_file.sheet_names)
+                sheet_names = self.read_sheet_names(file_path)
                 result[output_name] = {'file_path':file_path, 'classified_sheet_name':sheet_names}
             return result
         except Exception as e:
@@ -0,0 +1,247 @@
+from typing import Dict, List, Optional, Tuple
+from . import models
+from .logger_config import logger
+
+# 节点键：(层级, 结果文件名称, sheet名称, 父级规则)，与任务图的节点相同
+NodeKey = Tuple[int, Optional[str], Optional[str], Optional[str]]
+
+_ROOT: NodeKey = (1, None, None, None)
+
+
+class CompiledNode:
+    """判定结构中的一个节点：该分支按顺序匹配的规则及匹配结果到分类位置的映射"""
+
+    def __init__(self, key: NodeKey, rules: models.WorkFlowRules, mapping_dict: dict, parsed_rules: list):
+        self.key = key
+        self.rules = rules
+        self.mapping_dict = mapping_dict
+        self.parsed_rules = parsed_rules
+        # 规则文本 -> 从1开始的位置，用于统计规则计算次数
+        self.positions: Dict[str, int] = {}
+        for i, (rule_text, _) in enumerate(parsed_rules):
+            self.positions.setdefault(rule_text, i + 1)
+
+    def match(self, keyword: str) -> str:
+        """返回第一个匹配的规则，没有匹配时返回空字符串，与KeywordClassifier.classify_keywords一致"""
+        for rule_text, rule_matcher in self.parsed_rules:
+            try:
+                if rule_matcher(keyword):
+                    return rule_text
+            except Exception as e:
+                logger.debug(f"应用规则 '{rule_text}' 到关键词 '{keyword}' 时出错: {str(e)}")
+        return ''
+
+
+class HierarchicalClassifier:
+    """将整个工作流规则树编译为一个分层的判定结构，每个关键词一次遍历得到全部层级的分类路径
+
+    一级节点匹配结果文件名称，二级节点（结果文件）匹配sheet，三级节点（结果文件、sheet）匹配三级规则，
+    N级节点（结果文件、sheet、N-1级匹配的规则）匹配N级规则。"全"按结果文件的二级规则中出现的sheet展开，
+    节点的规则及顺序与按层级执行时相同，因此分类结果与按层级执行完全一致，
+    但关键词在层级之间不再写出、读回和重新分组。
+
+    用法:
+        classifier = HierarchicalClassifier(processor)
+        level_results = classifier.classify(keywords)
+    """
+
+    def __init__(self, processor):
+        if processor.workflow_rules is None:
+            raise ValueError("处理器尚未读取工作流规则")
+        self.processor = processor
+        self.workflow_rules: models.WorkFlowRules = processor.workflow_rules
+        self.max_level = self.workflow_rules.get_max_level()
+        self.nodes: Dict[NodeKey, CompiledNode] = {}
+        self.messages: List[str] = []
+        self._messages: Dict[NodeKey, str] = {}
+        # 各层级规则中出现的父级规则，用于决定没有规则的分支是否需要提示
+        self._parent_rules: Dict[int, set] = {}
+        for rule in self.workflow_rules.rules:
+            self._parent_rules.setdefault(rule.level, set()).add(rule.parent_rule)
+        self._compile()
+
+    def _compile_node(self, key: NodeKey, rules: Optional[models.WorkFlowRules]):
+        if not rules:
+            return
+        level = key[0]
+        self.processor._set_classifier_rules(rules.to_rules_list())
+        self.nodes[key] = CompiledNode(key, rules, self.processor._create_mapping_dict(rules, level),
+                                       self.processor.classifier.parsed_rules)
+
+    def _level_rules(self, level: int, output_name: str, sheet_names: List[str]) -> Optional[models.WorkFlowRules]:
+        """一个结果文件在第level级的规则，"全"只在该结果文件的范围内展开，与任务图一致"""
+        if level == 3:
+            level_rules = self.workflow_rules.filter_rules(source_sheet_name='Sheet3')
+        else:
+            level_rules = self.workflow_rules.filter_rules(level=level)
+        if level_rules is not None:
+            level_rules = level_rules.filter_rules(output_name=lambda x: x in (output_name, '全'))
+        if level_rules is None:
+            return None
+        stage_results = {output_name: {'classified_sheet_name': list(sheet_names)}}
+        if level == 3:
+            level_rules = self.processor.get_level_rules(level_rules, stage_results)
+        else:
+            level_rules = self.processor.get_level_rules_v1(level_rules, stage_results)
+        return level_rules.filter_rules(output_name=output_name)
+
+    def _compile(self):
+        """按规则树编译全部节点"""
+        stage1_rules = self.workflow_rules.get_rules_by_level(1)
+        self._compile_node(_ROOT, stage1_rules)
+        if self.max_level < 2 or stage1_rules is None:
+            return
+        sheet2_rules = self.workflow_rules.filter_rules(source_sheet_name='Sheet2')
+        output_names = list(dict.fromkeys(rule.output_name for rule in stage1_rules.rules))
+        for output_name in output_names:
+            rules = sheet2_rules.filter_rules(output_name=output_name) if sheet2_rules else None
+            self._compile_node((2, output_name, None, None), rules)
+            if rules is None or self.max_level < 3 or self.workflow_rules.get('Sheet3') is None:
+                continue
+            # 结果文件可能产生的sheet：该结果文件的二级规则指定的sheet
+            sheet_names = list(dict.fromkeys(rule.classified_sheet_name for rule in rules.rules))
+            sheet3_rules = self._level_rules(3, output_name, sheet_names)
+            for sheet_name in sheet_names:
+                key = (3, output_name, sheet_name, None)
+                self._compile_node(key, sheet3_rules.filter_rules(classified_sheet_name=sheet_name) if sheet3_rules else None)
+                self._compile_descendants(key, sheet_names)
+
+    def _compile_descendants(self, sheet_key: NodeKey, sheet_names: List[str]):
+        _, output_name, sheet_name, _ = sheet_key
+        current = [sheet_key] if sheet_key in self.nodes else []
+        for level in range(4, self.max_level + 1):
+            if self.workflow_rules.get(level) is None:
+                break
+            level_rules = self._level_rules(level, output_name, sheet_names)
+            children = []
+            parent_rules = dict.fromkeys(rule for key in current for rule in self.nodes[key].rules.to_rules_list())
+            for parent_rule in parent_rules:
+                key = (level, output_name, sheet_name, parent_rule)
+                self._compile_node(key, level_rules.filter_rules(classified_sheet_name=sheet_name, parent_rule=parent_rule)
+                                   if level_rules else None)
+                if key in self.nodes:
+                    children.append(key)
+            if not children:
+                break
+            current = children
+
+    def _next_key(self, node: CompiledNode, rule_text: str) -> Optional[NodeKey]:
+        """匹配规则后进入的下一级节点"""
+        level, output_name, sheet_name, _ = node.key
+        if level >= self.max_level:
+            return None
+        target = node.mapping_dict[rule_text]
+        if level == 1:
+            return (2, target['output_name'], None, None)
+        if level == 2:
+            return (3, output_name, target['classified_sheet_name'], None)
+        return (level + 1, output_name, sheet_name, rule_text)
+
+    def _missing_node_message(self, key: NodeKey) -> Tuple[NodeKey, Optional[str]]:
+        """关键词进入没有规则的分支时的提示，与按层级执行时一致；整个层级没有规则时只提示一次
+
+        Returns:
+            (提示对应的节点键, 提示信息)，不需要提示时提示信息为None
+        """
+        level, output_name, _, parent_rule = key
+        level_key = (level, None, None, None)
+        if level == 2:
+            if self.workflow_rules.get('Sheet2') is None:
+                return level_key, '找不到Sheet2规则，已经返回'
+            return key, f'找不到{output_name}的Sheet2规则，已经返回'
+        if level == 3:
+            if self.workflow_rules.get('Sheet3') is None:
+                return level_key, '找不到Sheet3规则，已经返回'
+            return key, f'找不到{output_name}的Sheet2规则，已经返回'
+        if self.workflow_rules.get(level) is None:
+            return level_key, f'找不到{level}规则，已经返回'
+        if parent_rule in self._parent_rules.get(level, ()):
+            return key, f'找不到{output_name}的Sheet2规则，已经返回'
+        return key, None
+
+    def path(self, keyword: str) -> Tuple[List[Tuple[CompiledNode, str]], Optional[NodeKey]]:
+        """一个关键词从一级节点开始经过的节点及各节点匹配的规则
+
+        Returns:
+            ([(节点, 匹配的规则)], 没有规则的下一级节点键)，最后一个节点未匹配时规则为空字符串，
+            下一级节点存在或已经是最大层级时节点键为None
+        """
+        steps = []
+        key = _ROOT
+        while key is not None:
+            node = self.nodes.get(key)
+            if node is None:
+                return steps, key
+            rule_text = node.match(keyword)
+            steps.append((node, rule_text))
+            if not rule_text:
+                break
+            key = self._next_key(node, rule_text)
+        return steps, None
+
+    def classify(self, keywords: List[str]) -> Dict[int, dict]:
+        """对关键词一次遍历全部层级
+
+        Args:
+            keywords: 待分类关键词
+
+        Returns:
+            层级到分类结果的映射：
+                1: 一级分类结果
+                2: {结果文件名称: 分类结果}
+                3: {结果文件名称: {sheet名称: 分类结果}}
+                N: {结果文件名称: {sheet名称: {父级规则: 分类结果}}}
+        """
+        try:
+            counters = self.processor._classification_counters
+            node_words: Dict[NodeKey, List[models.ClassifiedWord]] = {}
+            first_position: Dict[NodeKey, int] = {}
+            output_order: Dict[str, int] = {}
+            sheet_order: Dict[Tuple[str, str], int] = {}
+            for position, keyword in enumerate(keywords):
+                steps, missing_key = self.path(keyword)
+                for node, rule_text in steps:
+                    key = node.key
+                    counters['rows_in'] += 1
+                    counters['evaluations'] += node.positions.get(rule_text, len(node.parsed_rules)) if rule_text else len(node.parsed_rules)
+                    if key not in node_words:
+                        node_words[key] = []
+                        first_position[key] = position
+                    node_words[key].append(models.ClassifiedWord.model_construct(keyword=keyword, matched_rule=rule_text))
+                    if not rule_text:
+                        break
+                    counters['rows_out'] += 1
+                    next_key = self._next_key(node, rule_text)
+                    if next_key is not None:
+                        output_order.setdefault(next_key[1], len(output_order))
+                        if next_key[2] is not None:
+                            sheet_order.setdefault((next_key[1], next_key[2]), len(sheet_order))
+                if missing_key is not None:
+                    message_key, message = self._missing_node_message(missing_key)
+                    if message and message_key not in self._messages:
+                        self._messages[message_key] = message
+                        first_position.setdefault(message_key, position)
+
+            def sort_key(key: NodeKey) -> tuple:
+                level, output_name, sheet_name, _ = key
+                return (level, output_order.get(output_name, -1), sheet_order.get((output_name, sheet_name), -1),
+                        first_position.get(key, -1))
+
+            self.messages = [self._messages[key] for key in sorted(self._messages, key=sort_key)]
+            level_results: Dict[int, dict] = {}
+            for key in sorted(node_words, key=sort_key):
+                node = self.nodes[key]
+                result = self.processor._trans_words_to_cassified_result(node_words[key], node.mapping_dict)
+                level, output_name, sheet_name, parent_rule = key
+                if level == 1:
+                    level_results[1] = result
+                elif level == 2:
+                    level_results.setdefault(2, {})[output_name] = result
+                elif level == 3:
+                    level_results.setdefault(3, {}).setdefault(output_name, {})[sheet_name] = result
+                else:
+                    level_results.setdefault(level, {}).setdefault(output_name, {}).setdefault(sheet_name, {})[parent_rule] = result
+            logger.info(f'一次遍历完成: {len(keywords)}个关键词，{len(self.nodes)}个分支节点')
+            return level_results
+        except Exception as e:
+            raise Exception(f"一次遍历分类失败: {str(e)}")
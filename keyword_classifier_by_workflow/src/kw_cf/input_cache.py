@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Callable, Dict, Literal, Optional, Tuple
+from .logger_config import logger
+from .models import UnclassifiedKeywords, WorkFlowRule, WorkFlowRules
+
+CacheKind = Literal['keywords', 'workflow_rules']
+
+# 缓存格式版本，序列化内容变化时递增，旧缓存自动失效
+CACHE_VERSION = 2
+
+# 缓存内容与模型之间的转换：缓存中只保存校验后的纯数据，读取时跳过重复校验
+_CODECS: Dict[str, Tuple[Callable[[Any], Any], Callable[[Any], Any]]] = {
+    'keywords': (
+        lambda model: model.data,
+        lambda data: UnclassifiedKeywords.model_construct(data=data),
+    ),
+    'workflow_rules': (
+        lambda model: [rule.model_dump() for rule in model.rules],
+        lambda data: WorkFlowRules.model_construct(rules=[WorkFlowRule.model_construct(**rule) for rule in data]),
+    ),
+}
+
+
+class InputCache:
+    """已解析输入文件的本地缓存
+
+    以文件大小、修改时间、内容哈希和读取选项（读取引擎、读取的列、数据类型等）为键，
+    保存read_keyword_file、read_workflow_rules校验后的结果，以相同选项重复读取同一文件时直接加载缓存。缓存总大小超过上限时，按最近使用时间淘汰最旧的条目。
+    """
+
+    def __init__(self, cache_dir: Path = Path('./.kw_cf_cache'), max_size_bytes: int = 1024 * 1024 * 1024):
+        """初始化输入缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_size_bytes: 缓存总大小上限（字节）
+        """
+        if max_size_bytes <= 0:
+            raise ValueError(f"max_size_bytes必须大于0，当前值: {max_size_bytes}")
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        # 同一进程内按路径、大小、修改时间记住已计算的指纹，避免重复计算哈希
+        self._fingerprints:Dict[tuple,str] = {}
+
+    def _fingerprint(self, file_path: Path) -> str:
+        """获取文件指纹，文件未变化时复用本进程内已计算的结果"""
+        file_path = Path(file_path)
+        if file_path.is_file():
+            stat = file_path.stat()
+            memo_key = (str(file_path.resolve()), stat.st_size, stat.st_mtime_ns)
+            if memo_key not in self._fingerprints:
+                self._fingerprints[memo_key] = self._compute_fingerprint(file_path)
+            return self._fingerprints[memo_key]
+        return self._compute_fingerprint(file_path)
+
+    @staticmethod
+    def _compute_fingerprint(file_path: Path) -> str:
+        """计算文件（或目录内所有文件）的大小、最新修改时间和内容哈希"""
+        files = sorted(path for path in file_path.rglob('*') if path.is_file()) if file_path.is_dir() else [file_path]
+        digest = hashlib.sha256()
+        total_size = 0
+        latest_mtime = 0
+        for path in files:
+            stat = path.stat()
+            total_size += stat.st_size
+            latest_mtime = max(latest_mtime, stat.st_mtime_ns)
+            digest.update(path.relative_to(file_path).as_posix().encode() if file_path.is_dir() else b'')
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+        return f'{total_size}-{latest_mtime}-{digest.hexdigest()}'
+
+    @staticmethod
+    def _options_key(options: Optional[dict]) -> str:
+        """读取选项的哈希，选项不同的读取结果分别缓存"""
+        text = json.dumps(options or {}, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+    def _entry_path(self, kind: CacheKind, file_path: Path, options: Optional[dict] = None) -> Path:
+        return self.cache_dir / f'{kind}-v{CACHE_VERSION}-{self._fingerprint(file_path)}-{self._options_key(options)}.pkl'
+
+    def get(self, kind: CacheKind, file_path: Path, options: Optional[dict] = None) -> Optional[Any]:
+        """读取缓存，未命中或缓存损坏时返回None
+
+        Args:
+            kind: 缓存内容类型
+            file_path: 输入文件路径
+            options: 影响解析结果的读取选项，如读取引擎、读取的列和数据类型
+        """
+        entry = self._entry_path(kind, file_path, options)
+        if not entry.exists():
+            return None
+        try:
+            with open(entry, 'rb') as f:
+                data = pickle.load(f)
+            # 更新修改时间，作为淘汰时的最近使用时间
+            os.utime(entry)
+        except Exception as e:
+            logger.warning(f"读取缓存 {entry} 失败: {e}，将重新解析 {file_path}")
+            entry.unlink(missing_ok=True)
+            return None
+        logger.debug(f"命中输入缓存: {file_path} -> {entry.name}")
+        return _CODECS[kind][1](data)
+
+    def put(self, kind: CacheKind, file_path: Path, value: Any, options: Optional[dict] = None) -> Optional[Path]:
+        """写入缓存并按大小上限淘汰旧条目，写入失败不影响正常流程，options与get相同"""
+        try:
+            entry = self._entry_path(kind, file_path, options)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = entry.with_suffix(f'.{os.getpid()}.tmp')
+            with open(temp_path, 'wb') as f:
+                pickle.dump(_CODECS[kind][0](value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry)
+            self.evict()
+            return entry
+        except Exception as e:
+            logger.warning(f"写入缓存失败: {e}")
+            return None
+
+    def evict(self) -> int:
+        """淘汰最久未使用的条目直到总大小不超过上限，返回淘汰的条目数"""
+        entries = sorted(self.cache_dir.glob('*.pkl'), key=lambda path: path.stat().st_mtime_ns)
+        total_size = sum(path.stat().st_size for path in entries)
+        evicted = 0
+        # 最新写入的条目始终保留
+        for entry in entries[:-1]:
+            if total_size <= self.max_size_bytes:
+                break
+            total_size -= entry.stat().st_size
+            entry.unlink(missing_ok=True)
+            evicted += 1
+        if evicted:
+            logger.debug(f"输入缓存超出上限，已淘汰{evicted}个条目")
+        return evicted
+
+    def clear(self):
+        """清空缓存目录"""
+        for entry in self.cache_dir.glob('*.pkl'):
+            entry.unlink(missing_ok=True)
@@ -1,9 +1,24 @@
+import re
 from lark import Lark, Transformer, v_args
 from typing import Optional, Callable
 from .logger_config import logger
 from .models import UnclassifiedKeywords, SourceRules,ClassifiedWord
 
 
+def validate_separator(separator: str) -> tuple[bool, str]:
+    """检查多个匹配规则之间的分隔符是否可用，返回(是否可用, 错误信息)"""
+    # 检查分隔符是否为分词功能符号
+    invalid_separators = [' ', ',', '.', '\t', '\n', '\r']
+    if separator in invalid_separators:
+        return False, f"分隔符不能是 '{separator}', 它具有分词功能"
+
+    # 检查是否为特殊字符
+    if re.match(r'[\[\]()<>|+]', separator):
+        return False, f"分隔符不能是 '{separator}', 它是规则解析中的特殊字符"
+
+    return True, ""
+
+
 class KeywordClassifier:
     def __init__(self, case_sensitive=False, separator="&",error_callback:Optional[Callable]=None):
         self.rules = []
@@ -13,6 +28,20 @@ class KeywordClassifier:
         self.error_callback = error_callback
         self.parser = self._create_parser()
 
+    def __getstate__(self):
+        # 解析器和解析后的匹配函数（lambda）不能序列化，传给子进程时只保留规则文本
+        state = self.__dict__.copy()
+        state['parser'] = None
+        state['parsed_rules'] = []
+        state['error_callback'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parser = self._create_parser()
+        if self.rules:
+            self.set_rules(SourceRules.model_construct(data=self.rules))
+
     def _create_parser(self):
         """创建Lark解析器"""
         grammar = r"""
@@ -1,9 +1,9 @@
 from .workflow_processor import WorkFlowProcessor
+from .keyword_classifier import validate_separator
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, scrolledtext
 import threading
-import re
 import logging
 from .logger_config import add_ui_handler, remove_ui_handler, set_ui_handler_level
 
@@ -90,26 +90,17 @@ class KeywordClassifierGUI:
         self.log_text.config(state=tk.DISABLED)
     
     def browse_rules_file(self):
-        filename = filedialog.askopenfilename(filetypes=[("Excel 文件", "*.xlsx"), ("所有文件", "*.*")])
+        filename = filedialog.askopenfilename(filetypes=[("Excel 文件", "*.xlsx"), ("CSV/Parquet/Arrow 文件", "*.csv *.parquet *.arrow"), ("所有文件", "*.*")])
         if filename:
             self.rules_path_var.set(filename)
     
     def browse_keywords_file(self):
-        filename = filedialog.askopenfilename(filetypes=[("Excel 文件", "*.xlsx"), ("所有文件", "*.*")])
+        filename = filedialog.askopenfilename(filetypes=[("Excel 文件", "*.xlsx"), ("CSV/Parquet/Arrow 文件", "*.csv *.parquet *.arrow"), ("所有文件", "*.*")])
         if filename:
             self.keywords_path_var.set(filename)
     
     def validate_separator(self, separator):
-        # 检查分隔符是否为分词功能符号
-        invalid_separators = [' ', ',', '.', '\t', '\n', '\r']
-        if separator in invalid_separators:
-            return False, f"分隔符不能是 '{separator}', 它具有分词功能"
-        
-        # 检查是否为特殊字符
-        if re.match(r'[\[\]()<>|+]', separator):
-            return False, f"分隔符不能是 '{separator}', 它是规则解析中的特殊字符"
-        
-        return True, ""
+        return validate_separator(separator)
     
     def log_message(self, message):
         self.log_text.config(state=tk.NORMAL)
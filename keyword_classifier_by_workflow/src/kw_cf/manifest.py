@@ -0,0 +1,110 @@
+import datetime
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+import pandas as pd
+
+
+class StageManifest:
+    """工作流写入结果的清单
+
+    记录每个输出文件的sheet、行数和列名，在写入时同步更新，
+    后续阶段获取sheet名称时直接读取清单，不再重新打开工作簿。
+    """
+
+    def __init__(self):
+        # 文件路径 -> {'output_name': 结果文件名称, 'sheets': {sheet名称: {'rows': 行数, 'columns': 列名列表}}}
+        self._files: Dict[str, dict] = {}
+
+    def __contains__(self, file_path: Path) -> bool:
+        return str(file_path) in self._files
+
+    def record_sheets(self, file_path: Path, sheets: Dict[str, pd.DataFrame], output_name: Optional[str] = None,
+                      replace: bool = False):
+        """记录写入的sheet，同名sheet会被覆盖
+
+        Args:
+            file_path: 输出文件路径
+            sheets: sheet名称到DataFrame的映射
+            output_name: 结果文件名称
+            replace: 是否为新建文件，为True时清除该文件已有的记录
+        """
+        entry = self._files.get(str(file_path))
+        if entry is None or replace:
+            entry = self._files[str(file_path)] = {'output_name': output_name, 'sheets': {}}
+        elif output_name is not None:
+            entry['output_name'] = output_name
+        for sheet_name, df in sheets.items():
+            entry['sheets'][sheet_name] = {'rows': len(df), 'columns': [str(col) for col in df.columns]}
+
+    def record_columns(self, file_path: Path, columns: Dict[str, List[str]]):
+        """记录sheet新增的列
+
+        Args:
+            file_path: 输出文件路径
+            columns: sheet名称到新增列名列表的映射
+        """
+        sheets = self._files[str(file_path)]['sheets']
+        for sheet_name, column_names in columns.items():
+            sheet_columns = sheets[sheet_name]['columns']
+            sheet_columns.extend(name for name in column_names if name not in sheet_columns)
+
+    def sheet_names(self, file_path: Path) -> List[str]:
+        """按写入顺序返回文件的sheet名称"""
+        if str(file_path) not in self._files:
+            raise KeyError(f"清单中没有 {file_path} 的记录")
+        return list(self._files[str(file_path)]['sheets'])
+
+    def row_count(self, file_path: Path) -> int:
+        """返回文件所有sheet的总行数"""
+        return sum(sheet['rows'] for sheet in self._files[str(file_path)]['sheets'].values())
+
+    def output_name(self, file_path: Path) -> Optional[str]:
+        """返回文件对应的结果文件名称"""
+        return self._files[str(file_path)]['output_name']
+
+    def read_stage_classified_sheet_name(self, file_path: Dict[str, Path]) -> Dict[str, Dict[str, list[str] | Path]]:
+        """与ExcelHandler.read_stage_classified_sheet_name返回相同结构，sheet名称从清单读取"""
+        try:
+            return {
+                output_name: {'file_path': path, 'classified_sheet_name': self.sheet_names(path)}
+                for output_name, path in file_path.items()
+            }
+        except Exception as e:
+            raise Exception(f"读取分类结果文件失败: {str(e)}")
+
+    def to_dict(self) -> dict:
+        return {
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'files': [
+                {
+                    'file_path': file_path,
+                    'output_name': entry['output_name'],
+                    'sheets': [{'name': name, **sheet} for name, sheet in entry['sheets'].items()],
+                }
+                for file_path, entry in self._files.items()
+            ],
+        }
+
+    def save(self, manifest_path: Path) -> Path:
+        """将清单保存为JSON文件"""
+        manifest_path = Path(manifest_path)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        manifest_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding='utf-8')
+        return manifest_path
+
+    @classmethod
+    def load(cls, manifest_path: Path) -> 'StageManifest':
+        """从JSON文件加载清单"""
+        return cls.from_dict(json.loads(Path(manifest_path).read_text(encoding='utf-8')))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StageManifest':
+        """从to_dict的结果恢复清单"""
+        manifest = cls()
+        for file_entry in data['files']:
+            manifest._files[file_entry['file_path']] = {
+                'output_name': file_entry['output_name'],
+                'sheets': {sheet['name']: {k: v for k, v in sheet.items() if k != 'name'} for sheet in file_entry['sheets']},
+            }
+        return manifest
@@ -0,0 +1,175 @@
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from .logger_config import logger
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不记录进程内存峰值
+    resource = None
+
+# 分类计数：输入关键词数、匹配的关键词数、编译的规则数、规则计算次数
+CLASSIFICATION_COUNTERS = ('rows_in', 'rows_out', 'rules_compiled', 'evaluations')
+# 文件读写计数：读取、写入的文件数和字节数
+IO_COUNTERS = ('files_read', 'bytes_read', 'files_written', 'bytes_written')
+
+
+def new_counters(names=CLASSIFICATION_COUNTERS) -> Dict[str, int]:
+    return dict.fromkeys(names, 0)
+
+
+def path_size(file_path: Path) -> int:
+    """文件的字节数，目录按其中所有文件计算，不存在时为0"""
+    file_path = Path(file_path)
+    if file_path.is_dir():
+        return sum(path.stat().st_size for path in file_path.rglob('*') if path.is_file())
+    return file_path.stat().st_size if file_path.exists() else 0
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """当前进程的内存峰值（RSS），无法获取时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（RSS），只支持Linux，无法获取时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class WorkflowMetrics:
+    """工作流运行指标
+
+    按阶段记录耗时、CPU时间、输入输出关键词数、编译的规则数、规则计算次数、文件读写字节数和内存峰值，
+    每个阶段下再按分支记录同样的指标。阶段的计数由snapshot返回的累计计数相减得到；
+    分支在独立的计数中执行，其计数在add_branch时计入所属阶段。
+
+    CPU时间只包括当前进程，在工作进程中执行的分支的CPU时间单独计入worker_cpu_seconds。
+    内存峰值为进程RSS的历史最高值；trace_memory为True时另外用tracemalloc记录每个阶段Python对象的内存峰值。
+
+    用法:
+        metrics = WorkflowMetrics(processor.metrics_snapshot)
+        metrics.start()
+        metrics.begin('阶段1')
+        ...
+        metrics.add_branch('结果文件A', branch_metrics)
+        report = metrics.finish()
+    """
+
+    def __init__(self, snapshot: Callable[[], Dict[str, int]], trace_memory: bool = False):
+        self.snapshot = snapshot
+        self.trace_memory = trace_memory
+        self.stages: List[dict] = []
+        self._current: Optional[dict] = None
+        self._own_tracing = False
+        self._started_at: Optional[str] = None
+        self._start = (0.0, 0.0)
+
+    def start(self):
+        """开始记录一次运行"""
+        self.stages = []
+        self._current = None
+        self._started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+        self._start = (time.perf_counter(), time.process_time())
+
+    def begin(self, name: str):
+        """开始一个阶段，上一个未结束的阶段自动结束"""
+        self.end()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._current = {
+            'name': name,
+            'start': (time.perf_counter(), time.process_time()),
+            'counters': self.snapshot(),
+            'branch_counters': {},
+            'worker_cpu_seconds': 0.0,
+            'branch_peak_traced_bytes': 0,
+            'branches': [],
+        }
+
+    def keep_traced_peak(self):
+        """保留当前阶段到目前为止的tracemalloc峰值，之后可以重置峰值单独统计分支"""
+        if self._current is not None and tracemalloc.is_tracing():
+            self._current['branch_peak_traced_bytes'] = max(self._current['branch_peak_traced_bytes'],
+                                                             tracemalloc.get_traced_memory()[1])
+
+    def add_branch(self, name: str, branch_metrics: dict):
+        """记录当前阶段的一个分支，branch_metrics为WorkFlowProcessor._measure返回的指标"""
+        if self._current is None:
+            return
+        current = self._current
+        current['branches'].append({'name': name, **branch_metrics})
+        for key, value in branch_metrics.items():
+            if key in CLASSIFICATION_COUNTERS or key in IO_COUNTERS:
+                current['branch_counters'][key] = current['branch_counters'].get(key, 0) + value
+        if branch_metrics.get('pid') != os.getpid():
+            current['worker_cpu_seconds'] += branch_metrics.get('cpu_seconds', 0.0)
+        else:
+            current['branch_peak_traced_bytes'] = max(current['branch_peak_traced_bytes'],
+                                                      branch_metrics.get('peak_traced_bytes') or 0)
+
+    def end(self):
+        """结束当前阶段"""
+        if self._current is None:
+            return
+        current, self._current = self._current, None
+        wall_start, cpu_start = current['start']
+        before, after = current['counters'], self.snapshot()
+        stage = {
+            'name': current['name'],
+            'wall_seconds': round(time.perf_counter() - wall_start, 6),
+            'cpu_seconds': round(time.process_time() - cpu_start, 6),
+            'worker_cpu_seconds': round(current['worker_cpu_seconds'], 6),
+        }
+        for key in (*CLASSIFICATION_COUNTERS, *IO_COUNTERS):
+            stage[key] = after.get(key, 0) - before.get(key, 0) + current['branch_counters'].get(key, 0)
+        stage['peak_rss_bytes'] = peak_rss_bytes()
+        if tracemalloc.is_tracing():
+            stage['peak_traced_bytes'] = max(tracemalloc.get_traced_memory()[1], current['branch_peak_traced_bytes'])
+        stage['branches'] = current['branches']
+        self.stages.append(stage)
+
+    def finish(self) -> dict:
+        """结束记录并返回运行指标"""
+        self.end()
+        wall_start, cpu_start = self._start
+        report = {
+            'started_at': self._started_at,
+            'wall_seconds': round(time.perf_counter() - wall_start, 6),
+            'cpu_seconds': round(time.process_time() - cpu_start, 6),
+            'worker_cpu_seconds': round(sum(stage['worker_cpu_seconds'] for stage in self.stages), 6),
+            **{key: sum(stage[key] for stage in self.stages) for key in (*CLASSIFICATION_COUNTERS, *IO_COUNTERS)},
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': self.stages,
+        }
+        if tracemalloc.is_tracing():
+            report['peak_traced_bytes'] = max((stage.get('peak_traced_bytes', 0) for stage in self.stages), default=0)
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+        return report
+
+    @staticmethod
+    def save(report: dict, report_path: Path) -> Path:
+        """将运行指标保存为JSON文件"""
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding='utf-8')
+        logger.info(f'运行指标已保存到: {report_path}')
+        return report_path
@@ -0,0 +1,195 @@
+from pathlib import Path
+from typing import Dict, List
+from . import models
+from .logger_config import logger
+
+
+class WorkflowPlanner:
+    """工作流的执行计划（不执行分类）
+
+    读取工作流规则和待分类文件，按规则可能产生的结果文件和sheet展开"全"，
+    统计每个层级、每个分支（结果文件名称、sheet、父级规则）的规则数、关键词数和规则计算次数的上限，
+    以及按处理器当前配置将进行的文件读写次数。
+
+    分类前无法知道关键词会落入哪个分支，因此每个分支的关键词数按全部关键词计算；
+    每个关键词在一个层级中最多进入一个分支，层级的计算次数上限为关键词数乘以该层级规则最多的分支的规则数。
+
+    xlsx结果的读写次数按文件计算；目录形式的结果（csv/parquet/arrow）按sheet文件计算，
+    哪些sheet会有关键词要分类后才知道，因此按规则可能产生的sheet给出上限。
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def plan(self, rules_file: Path, classification_file: Path) -> dict:
+        """生成执行计划
+
+        Args:
+            rules_file: 工作流规则文件路径
+            classification_file: 待分类文件路径
+
+        Returns:
+            执行计划，levels为各层级的分支、规则数、关键词数、计算次数上限和文件读写次数
+        """
+        try:
+            processor = self.processor
+            workflow_rules = processor.excel_handler.read_workflow_rules(rules_file)
+            keyword_count = len(processor.excel_handler.read_keyword_file(classification_file).data)
+            max_level = workflow_rules.get_max_level()
+            branches = self._plan_branches(workflow_rules, max_level)
+            # 结果文件可能包含的sheet（含未匹配关键词），用于计算目录形式结果的读写次数
+            output_sheets = {name: ['Sheet1'] for name in branches[1][0]['output_names']} if branches.get(1) else {}
+            for branch in branches.get(2, []):
+                output_sheets[branch['output_name']] += [*branch.pop('classified_sheet_names'), '未匹配关键词']
+            if output_sheets:
+                output_sheets['未匹配关键词'] = ['Sheet1']
+            levels = []
+            for level in range(1, max_level + 1):
+                level_branches = branches.get(level, [])
+                max_rules = max((branch['rules'] for branch in level_branches), default=0)
+                for branch in level_branches:
+                    branch.pop('output_names', None)
+                    branch['max_keywords'] = keyword_count
+                    branch['max_evaluations'] = keyword_count * branch['rules']
+                reads, writes = self._file_operations(level, output_sheets, level_branches)
+                levels.append({
+                    'level': level,
+                    'branch_count': len(level_branches),
+                    'rules': sum(branch['rules'] for branch in level_branches),
+                    'max_keywords': keyword_count,
+                    'max_evaluations': keyword_count * max_rules,
+                    'file_reads': reads,
+                    'file_writes': writes,
+                    'branches': level_branches,
+                })
+            final_writes = self._final_writes(output_sheets)
+            plan = {
+                'rules_file': str(rules_file),
+                'classification_file': str(classification_file),
+                'keywords': keyword_count,
+                'max_level': max_level,
+                'config': {
+                    'stage_store': type(processor.stage_store).__name__,
+                    'schedule': processor.schedule,
+                    'result_layout': processor.result_layout,
+                    'output_format': processor.excel_handler.output_format,
+                },
+                'levels': levels,
+                'final_file_writes': final_writes,
+                'file_reads': sum(level['file_reads'] for level in levels),
+                'file_writes': sum(level['file_writes'] for level in levels) + final_writes,
+            }
+            for level in levels:
+                logger.info(f"第{level['level']}级: {level['branch_count']}个分支，{level['rules']}条规则，"
+                            f"计算次数上限{level['max_evaluations']}，读取{level['file_reads']}次，写入{level['file_writes']}次")
+            return plan
+        except Exception as e:
+            raise Exception(f"生成执行计划失败: {str(e)}")
+
+    def _plan_branches(self, workflow_rules: models.WorkFlowRules, max_level: int) -> Dict[int, List[dict]]:
+        """按规则树列出各层级的分支，"全"按规则中出现的结果文件名称和sheet展开"""
+        processor = self.processor
+        stage1_rules = workflow_rules.get_rules_by_level(1)
+        output_names = list(dict.fromkeys(rule.output_name for rule in stage1_rules.rules)) if stage1_rules else []
+        branches: Dict[int, List[dict]] = {1: [{
+            'output_name': None, 'classified_sheet_name': None, 'parent_rule': None,
+            'rules': len(stage1_rules.rules) if stage1_rules else 0, 'output_names': output_names,
+        }]}
+        sheet2_rules = workflow_rules.filter_rules(source_sheet_name='Sheet2') if max_level >= 2 else None
+        if sheet2_rules is None:
+            return branches
+        # 结果文件可能产生的sheet：该结果文件的二级规则指定的sheet
+        sheet_names: Dict[str, List[str]] = {}
+        for output_name in output_names:
+            rules = sheet2_rules.filter_rules(output_name=output_name)
+            if rules is None:
+                continue
+            sheet_names[output_name] = list(dict.fromkeys(rule.classified_sheet_name for rule in rules.rules))
+            branches.setdefault(2, []).append({
+                'output_name': output_name, 'classified_sheet_name': None, 'parent_rule': None, 'rules': len(rules.rules),
+                'classified_sheet_names': sheet_names[output_name],
+            })
+        stage_results = {output_name: {'classified_sheet_name': list(names)} for output_name, names in sheet_names.items()}
+        # 上一层级的分支：(结果文件名称, sheet, 父级规则) -> 规则文本列表
+        previous: Dict[tuple, List[str]] = {}
+        for level in range(3, max_level + 1):
+            level_rules = workflow_rules.filter_rules(source_sheet_name='Sheet3') if level == 3 else workflow_rules.filter_rules(level=level)
+            if level_rules is None:
+                break
+            if level == 3:
+                level_rules = processor.get_level_rules(level_rules, stage_results)
+            else:
+                # get_level_rules_v1会修改传入的sheet列表，每个层级传入副本
+                level_rules = processor.get_level_rules_v1(
+                    level_rules, {name: {'classified_sheet_name': list(value['classified_sheet_name'])} for name, value in stage_results.items()})
+            grouped: Dict[tuple, List[str]] = {}
+            for rule in level_rules.rules:
+                key = (rule.output_name, rule.classified_sheet_name, rule.parent_rule if level > 3 else None)
+                grouped.setdefault(key, []).append(rule.rule)
+            current: Dict[tuple, List[str]] = {}
+            for (output_name, sheet_name, parent_rule), rules in grouped.items():
+                if sheet_name not in sheet_names.get(output_name, []):
+                    continue
+                # 四级及以上的分支只有父级规则出现在同一sheet的上一层级规则中时才会有关键词
+                if level > 3 and not any(
+                        parent_rule in parent_rules for (o, s, _), parent_rules in previous.items() if (o, s) == (output_name, sheet_name)):
+                    continue
+                current[(output_name, sheet_name, parent_rule)] = rules
+                branches.setdefault(level, []).append({
+                    'output_name': output_name, 'classified_sheet_name': sheet_name, 'parent_rule': parent_rule, 'rules': len(rules),
+                })
+            previous = current
+        return branches
+
+    def _file_operations(self, level: int, output_sheets: Dict[str, List[str]], level_branches: List[dict]) -> tuple[int, int]:
+        """按处理器配置估计第level级的文件读取、写入次数
+
+        Args:
+            level: 层级
+            output_sheets: 一级可能产生的结果文件（含未匹配关键词）及其可能包含的sheet
+            level_branches: 该层级的分支
+
+        Returns:
+            (读取次数, 写入次数)
+        """
+        processor = self.processor
+        # 长表模式、一次遍历和阶段存储的中间结果不写入文件
+        stage_files = (processor.stage_store is processor.excel_handler and processor.result_layout != 'long'
+                       and processor.schedule != 'single_pass')
+        # 目录形式的结果按sheet文件读写，xlsx按文件读写
+        sheet_files = processor.excel_handler.output_format != 'xlsx'
+        if level == 1:
+            reads = 0 if processor.excel_handler.input_cache else 2
+            return reads, len(output_sheets) if stage_files else 0
+        if not stage_files:
+            return 0, 0
+        branch_outputs = [name for name in output_sheets if name != '未匹配关键词']
+        # 任务图调度直接使用上一层级的分类结果，逐层级处理时每个分支读取一次阶段文件
+        if processor.schedule == 'graph':
+            branch_reads = 0
+        elif sheet_files:
+            branch_reads = sum(len(output_sheets[name]) if level > 2 else 1 for name in branch_outputs)
+        else:
+            branch_reads = len(branch_outputs)
+        if level == 2:
+            # 目录形式的结果只写入新的sheet文件；xlsx追加sheet时需要先读取原文件，再整体写入
+            if sheet_files:
+                return branch_reads, sum(len(output_sheets[name]) - 1 for name in branch_outputs)
+            return branch_reads + len(branch_outputs), len(branch_outputs)
+        # 有该层级分支的文件新增列，每个文件读取一次、写入一次；目录形式的结果只重写新增列的sheet
+        written_outputs = list(dict.fromkeys(branch['output_name'] for branch in level_branches))
+        if sheet_files:
+            written_sheets = {(branch['output_name'], branch['classified_sheet_name']) for branch in level_branches}
+            return branch_reads + sum(len(output_sheets[name]) for name in written_outputs), len(written_sheets)
+        return branch_reads + len(written_outputs), len(written_outputs)
+
+    def _final_writes(self, output_sheets: Dict[str, List[str]]) -> int:
+        """工作流结束时的写入次数：长表写入一个文件，阶段存储导出全部结果文件，目录形式的结果按sheet文件计算"""
+        processor = self.processor
+        if processor.result_layout == 'long':
+            return 1
+        if processor.schedule == 'single_pass' or (processor.stage_store is not processor.excel_handler and processor.export_stage_store):
+            if processor.excel_handler.output_format != 'xlsx':
+                return sum(len(sheets) for sheets in output_sheets.values())
+            return len(output_sheets)
+        return 0
@@ -0,0 +1,165 @@
+import datetime
+import sqlite3
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import pandas as pd
+from .excel_handler import ExcelHandler
+from .logger_config import logger
+from .models import ClassifiedWord
+from .result_table import RESULT_TABLE_COLUMNS, ResultTableCollector, fan_out_result_table
+
+# 长表列名与数据库字段名的对应关系
+_RESULT_FIELDS = {
+    '关键词': 'keyword',
+    '分类层级': 'level',
+    '结果文件名称': 'output_name',
+    '分类sheet名称': 'classified_sheet_name',
+    '匹配的规则': 'matched_rule',
+    '父级规则': 'parent_rule',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    rules_file TEXT,
+    source_file TEXT,
+    row_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    keyword TEXT NOT NULL,
+    level INTEGER,
+    output_name TEXT,
+    classified_sheet_name TEXT,
+    matched_rule TEXT,
+    parent_rule TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_level ON results(run_id, level);
+CREATE INDEX IF NOT EXISTS idx_results_output_sheet ON results(run_id, output_name, classified_sheet_name);
+CREATE INDEX IF NOT EXISTS idx_results_rule ON results(run_id, matched_rule);
+CREATE INDEX IF NOT EXISTS idx_results_parent ON results(run_id, parent_rule);
+"""
+
+
+class SQLiteResultSink:
+    """将分类结果批量写入本地SQLite数据库
+
+    每次写入对应runs表中的一条记录（run_id），结果行与长表结果的列一致，
+    可按层级、结果文件名称、sheet、规则、父级规则查询，也可按run_id导出为Excel。
+    """
+
+    def __init__(self, db_path: Path = Path('./工作流结果/分类结果.db'), batch_size: int = 50_000):
+        """初始化结果数据库
+
+        Args:
+            db_path: 数据库文件路径
+            batch_size: 每批executemany写入的行数
+        """
+        if batch_size <= 0:
+            raise ValueError(f"batch_size必须大于0，当前值: {batch_size}")
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        # WAL模式下写入不阻塞读取，批量写入时降低同步频率
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def write_records(self, records: Iterable[Tuple], kind: str, rules_file: Optional[Path] = None,
+                      source_file: Optional[Path] = None) -> int:
+        """在一个事务中批量写入结果行
+
+        Args:
+            records: 按RESULT_TABLE_COLUMNS顺序排列的结果行
+            kind: 结果类型，workflow或classify
+            rules_file: 规则文件路径
+            source_file: 待分类文件路径
+
+        Returns:
+            本次写入的run_id
+        """
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        'INSERT INTO runs (kind, created_at, rules_file, source_file) VALUES (?, ?, ?, ?)',
+                        (kind, datetime.datetime.now().isoformat(timespec='seconds'),
+                         str(rules_file) if rules_file else None, str(source_file) if source_file else None))
+                    run_id = cursor.lastrowid
+                    row_count = 0
+                    records = iter(records)
+                    while batch := [(run_id, *record) for record in islice(records, self.batch_size)]:
+                        conn.executemany(
+                            f'INSERT INTO results (run_id, {", ".join(_RESULT_FIELDS.values())}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            batch)
+                        row_count += len(batch)
+                    conn.execute('UPDATE runs SET row_count = ? WHERE run_id = ?', (row_count, run_id))
+            finally:
+                conn.close()
+            logger.info(f'分类结果已写入 {self.db_path}，run_id: {run_id}，共{row_count}行')
+            return run_id
+        except Exception as e:
+            raise Exception(f"写入结果数据库失败: {str(e)}")
+
+    def write_result_table(self, result_table: ResultTableCollector | pd.DataFrame, rules_file: Optional[Path] = None,
+                           source_file: Optional[Path] = None) -> int:
+        """写入工作流的长表结果，返回run_id"""
+        result_df = result_table.to_dataframe() if isinstance(result_table, ResultTableCollector) else result_table
+        result_df = result_df[RESULT_TABLE_COLUMNS].astype(object).where(result_df[RESULT_TABLE_COLUMNS].notna(), None)
+        return self.write_records(result_df.itertuples(index=False, name=None), 'workflow', rules_file, source_file)
+
+    def write_classified_words(self, classified_words: List[ClassifiedWord], rules_file: Optional[Path] = None,
+                               source_file: Optional[Path] = None) -> int:
+        """写入KeywordClassifier.classify_keywords的结果，返回run_id"""
+        records = ((word.keyword, None, None, None, word.matched_rule or None, None) for word in classified_words)
+        return self.write_records(records, 'classify', rules_file, source_file)
+
+    def list_runs(self) -> pd.DataFrame:
+        """列出所有写入记录"""
+        conn = self._connect()
+        try:
+            return pd.read_sql_query('SELECT * FROM runs ORDER BY run_id', conn)
+        finally:
+            conn.close()
+
+    def query(self, run_id: int, **conditions) -> pd.DataFrame:
+        """按条件查询一次写入的结果，列名与长表结果一致，行按写入顺序排列
+
+        Args:
+            run_id: 写入记录ID
+            conditions: 字段条件，可用level、output_name、classified_sheet_name、matched_rule、parent_rule，
+                值为None时匹配空值
+
+        Returns:
+            查询结果
+        """
+        unknown = [name for name in conditions if name not in _RESULT_FIELDS.values() or name == 'keyword']
+        if unknown:
+            raise ValueError(f"不支持的查询条件: {', '.join(unknown)}")
+        where = ['run_id = ?']
+        params: list = [run_id]
+        for name, value in conditions.items():
+            if value is None:
+                where.append(f'{name} IS NULL')
+            else:
+                where.append(f'{name} = ?')
+                params.append(value)
+        columns = ', '.join(f'{field} AS "{column}"' for column, field in _RESULT_FIELDS.items())
+        conn = self._connect()
+        try:
+            return pd.read_sql_query(f'SELECT {columns} FROM results WHERE {" AND ".join(where)} ORDER BY rowid', conn, params=params)
+        finally:
+            conn.close()
+
+    def export(self, run_id: int, excel_handler: ExcelHandler, output_dir: Path, write_workers: int = 1) -> Dict[str, Path]:
+        """将一次工作流的结果导出为分文件结果，返回结果文件名称到输出路径的映射"""
+        return fan_out_result_table(self.query(run_id), excel_handler, output_dir, write_workers)
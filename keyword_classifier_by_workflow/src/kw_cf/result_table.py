@@ -0,0 +1,129 @@
+import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from .excel_handler import ExcelHandler, TABLE_FORMAT_SUFFIXES
+from .logger_config import logger
+from .models import ClassifiedResult
+from .workbook_writer import WorkbookWriterPool
+
+# 长表结果的列，一行对应一个关键词在一个层级的分类结果
+RESULT_TABLE_COLUMNS = ['关键词', '分类层级', '结果文件名称', '分类sheet名称', '匹配的规则', '父级规则']
+
+
+class ResultTableCollector:
+    """收集工作流各层级的分类结果，生成单张长表
+
+    按分类结果产生的顺序记录，匹配成功的行在前、未匹配的行在后，
+    build_legacy_layout依赖该顺序还原分文件结果中各sheet的行顺序。
+    """
+
+    def __init__(self):
+        self._records: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, classified_result: Optional[ClassifiedResult], classified_sheet_name: Optional[str] = None,
+            parent_rule: Optional[str] = None):
+        """记录一个分类结果
+
+        Args:
+            classified_result: 分类结果，为None时忽略
+            classified_sheet_name: 三级及以上分类的来源sheet，用于记录未匹配关键词所在的sheet
+            parent_rule: 三级以上分类的父级规则，用于记录未匹配关键词的父级规则
+        """
+        if classified_result is None:
+            return
+        for kw in classified_result.classified_keywords:
+            # 一级分类结果固定写入Sheet1
+            sheet_name = 'Sheet1' if kw.level == 1 else kw.classified_sheet_name
+            self._records.append((kw.keyword, kw.level, kw.output_name, sheet_name,
+                                  kw.matched_rule, kw.parent_rule or None))
+        for kw in classified_result.unclassified_keywords:
+            self._records.append((kw.keyword, kw.level, kw.output_name, classified_sheet_name or kw.classified_sheet_name,
+                                  None, parent_rule or kw.parent_rule or None))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self._records, columns=RESULT_TABLE_COLUMNS)
+
+
+def get_result_table_path(output_dir: Path, output_format: str, name: str = '分类结果') -> Path:
+    """获取长表结果的输出路径，长表始终保存为单个文件"""
+    suffix = TABLE_FORMAT_SUFFIXES.get(output_format, '.xlsx')
+    return Path(output_dir) / f'{name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}{suffix}'
+
+
+def _legacy_sheet(group: pd.DataFrame, matched: bool) -> pd.DataFrame:
+    """按分文件结果的格式生成一个sheet：匹配的为关键词、匹配的规则，未匹配的为关键词、分类层级"""
+    df = group[['关键词', '匹配的规则' if matched else '分类层级']].reset_index(drop=True)
+    if group['父级规则'].notna().any():
+        df['父级规则'] = group['父级规则'].to_numpy()
+    return df
+
+
+def build_legacy_layout(result_df: pd.DataFrame) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """将长表还原为分文件结果的结构
+
+    一、二级分类结果按结果文件名称、分类sheet名称拆分为各文件的sheet，
+    三级及以上的匹配结果按关键词映射为对应sheet的'阶段N'列，未匹配的行不写入。
+
+    Args:
+        result_df: 长表结果
+
+    Returns:
+        结果文件名称到{sheet名称: DataFrame}的映射
+    """
+    missing_cols = [col for col in RESULT_TABLE_COLUMNS if col not in result_df.columns]
+    if missing_cols:
+        raise ValueError(f"长表结果缺少必需列: {', '.join(missing_cols)}")
+    result_df = result_df.astype({'分类层级': int})
+    matched = result_df['匹配的规则'].notna() & (result_df['匹配的规则'].astype(str) != '')
+    layout: Dict[str, Dict[str, pd.DataFrame]] = {}
+    for level in (1, 2):
+        level_df = result_df[result_df['分类层级'] == level]
+        for (output_name, sheet_name, is_matched), group in level_df.groupby(
+                ['结果文件名称', '分类sheet名称', matched[level_df.index]], sort=False, dropna=False):
+            layout.setdefault(output_name, {})[sheet_name] = _legacy_sheet(group, is_matched)
+    high_df = result_df[(result_df['分类层级'] >= 3) & matched]
+    for level in sorted(high_df['分类层级'].unique()):
+        level_df = high_df[high_df['分类层级'] == level]
+        for (output_name, sheet_name), group in level_df.groupby(['结果文件名称', '分类sheet名称'], sort=False, dropna=False):
+            sheet_df = layout.get(output_name, {}).get(sheet_name)
+            if sheet_df is None:
+                logger.warning(f'{output_name}中不存在sheet {sheet_name}，第{level}级结果已忽略')
+                continue
+            keyword_to_rule = dict(zip(group['关键词'], group['匹配的规则']))
+            sheet_df[f'阶段{level}'] = sheet_df['关键词'].map(keyword_to_rule)
+    return layout
+
+
+def fan_out_result_table(result_table: Path | pd.DataFrame, excel_handler: ExcelHandler, output_dir: Path,
+                         write_workers: int = 1) -> Dict[str, Path]:
+    """将长表结果展开为分文件结果，每个结果文件名称一个文件
+
+    Args:
+        result_table: 长表结果文件路径或DataFrame
+        excel_handler: 用于读取长表和写入结果文件的Excel处理器
+        output_dir: 输出目录
+        write_workers: 并行写入的进程数
+
+    Returns:
+        结果文件名称到输出路径的映射
+    """
+    try:
+        if isinstance(result_table, pd.DataFrame):
+            result_df = result_table
+        else:
+            result_df = excel_handler.read_table(result_table, sheet_name=None)['Sheet1']
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_files = {}
+        with WorkbookWriterPool(excel_handler, write_workers) as pool:
+            for output_name, sheets in build_legacy_layout(result_df).items():
+                output_file = excel_handler.get_output_path(output_dir, f'{output_name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}')
+                pool.submit(output_file, 'write_sheets', output_file, sheets)
+                output_files[output_name] = output_file
+        return output_files
+    except Exception as e:
+        raise Exception(f"展开长表结果失败: {str(e)}")
@@ -0,0 +1,365 @@
+import datetime
+import ipaddress
+import json
+import socket
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from .keyword_classifier import KeywordClassifier
+from .workflow_processor import WorkFlowProcessor
+from .hierarchical_classifier import HierarchicalClassifier, CompiledNode
+from .checkpoint import file_content_hash
+from .metrics import new_counters, peak_rss_bytes
+from . import models
+from .logger_config import logger
+
+# 服务计数：请求数、成功的请求数、请求错误数（4xx）、服务错误数（5xx）、因并发上限被拒绝的请求数、分类的关键词数
+SERVICE_COUNTERS = ('requests', 'completed', 'client_errors', 'server_errors', 'rejected', 'keywords')
+
+
+class ServiceError(Exception):
+    """请求无法处理，status为返回的HTTP状态码"""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RuleBook:
+    """一个已加载的工作流规则：读取一次并将全部分支编译为分层判定结构，之后的请求直接使用"""
+
+    def __init__(self, name: str, rules_file: Path, case_sensitive: bool = False, separator: str = '&'):
+        self.name = name
+        self.rules_file = Path(rules_file)
+        self.rules_hash = file_content_hash(self.rules_file)
+        # 服务不写任何结果文件，输出目录使用系统临时目录
+        self.processor = WorkFlowProcessor(keyword_classifier=KeywordClassifier(case_sensitive=case_sensitive, separator=separator),
+                                           output_dir=tempfile.gettempdir())
+        self.processor.workflow_rules = self.processor.excel_handler.read_workflow_rules(self.rules_file)
+        self.classifier = HierarchicalClassifier(self.processor)
+        self.loaded_at = datetime.datetime.now().isoformat(timespec='seconds')
+        # 匹配函数本身无状态，各请求并行分类，只有分类计数的更新在同一规则的请求之间串行
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _step(node: CompiledNode, rule_text: str) -> dict:
+        """关键词在一个节点的分类结果，结果文件名称和sheet名称为关键词所在的位置，与分文件结果一致"""
+        level, output_name, sheet_name, parent_rule = node.key
+        target = node.mapping_dict.get(rule_text, {}) if rule_text else {}
+        if level == 1:
+            output_name, sheet_name = target.get('output_name', '未匹配关键词'), 'Sheet1'
+        elif level == 2:
+            sheet_name = target.get('classified_sheet_name', '未匹配关键词')
+        return {'level': level, 'output_name': output_name, 'classified_sheet_name': sheet_name,
+                'parent_rule': parent_rule, 'matched_rule': rule_text or None}
+
+    def _count(self, matches: List[tuple[CompiledNode, str]]):
+        """计入一个请求中各节点的分类结果"""
+        with self.lock:
+            counters = self.processor._classification_counters
+            for node, rule_text in matches:
+                counters['rows_in'] += 1
+                counters['evaluations'] += node.positions.get(rule_text, len(node.parsed_rules)) if rule_text else len(node.parsed_rules)
+                if rule_text:
+                    counters['rows_out'] += 1
+
+    def classify_workflow(self, keywords: List[str]) -> List[dict]:
+        """按完整工作流分类，返回每个关键词经过的各层级"""
+        results = []
+        matches = []
+        for keyword in keywords:
+            steps, _ = self.classifier.path(keyword)
+            matches.extend(steps)
+            results.append({'keyword': keyword, 'path': [self._step(node, rule_text) for node, rule_text in steps]})
+        self._count(matches)
+        return results
+
+    def classify_level(self, keywords: List[str], level: int, output_name: Optional[str] = None,
+                       classified_sheet_name: Optional[str] = None, parent_rule: Optional[str] = None) -> List[dict]:
+        """只用一个分支的规则分类：一级不需要分支参数，二级需要结果文件名称，三级另外需要sheet名称，四级及以上另外需要父级规则"""
+        key = (level, output_name if level >= 2 else None, classified_sheet_name if level >= 3 else None,
+               parent_rule if level >= 4 else None)
+        node = self.classifier.nodes.get(key)
+        if node is None:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"规则{self.name}中没有分支: 层级{level}，结果文件名称{key[1]}，"
+                                                     f"sheet{key[2]}，父级规则{key[3]}")
+        results = []
+        matches = []
+        for keyword in keywords:
+            rule_text = node.match(keyword)
+            matches.append((node, rule_text))
+            results.append({'keyword': keyword, **self._step(node, rule_text)})
+        self._count(matches)
+        return results
+
+    def describe(self) -> dict:
+        with self.lock:
+            counters = dict(self.processor._classification_counters)
+        return {
+            'rules_file': str(self.rules_file),
+            'rules_hash': self.rules_hash,
+            'loaded_at': self.loaded_at,
+            'max_level': self.classifier.max_level,
+            'branches': len(self.classifier.nodes),
+            'rules': sum(len(node.parsed_rules) for node in self.classifier.nodes.values()),
+            **counters,
+        }
+
+
+class ClassificationService:
+    """本地关键词分类服务
+
+    启动时读取工作流规则并编译全部分支，之后的请求不再有解释器启动、导入和规则编译的开销。
+    只监听本机回环地址；同时处理的请求数超过max_concurrency时，等待queue_timeout秒后仍无空闲则返回503。
+
+    接口（请求和响应均为JSON）:
+        GET  /health                 服务状态和已加载的规则
+        GET  /metrics                请求计数、耗时、各规则的分类计数和进程内存峰值
+        POST /classify/workflow      {"rule_book": 名称, "keywords": [...]}，返回每个关键词经过的各层级
+        POST /classify/level         另外指定"level"及对应的"output_name"、"classified_sheet_name"、"parent_rule"，只用该分支的规则分类
+        POST /reload                 {"rule_book": 名称}，规则文件内容变化时重新读取并编译，省略名称时检查全部规则
+
+    用法:
+        service = ClassificationService({'示例': Path('data/工作流规则_示例.xlsx')})
+        server = service.create_server(port=8765)
+        server.serve_forever()
+    """
+
+    def __init__(self, rules_files: Dict[str, Path], case_sensitive: bool = False, separator: str = '&',
+                 max_concurrency: int = 4, queue_timeout: float = 5.0, max_keywords: int = 100_000):
+        """初始化分类服务
+
+        Args:
+            rules_files: 规则名称到工作流规则文件路径的映射，请求中按名称选择规则
+            case_sensitive: 是否区分大小写
+            separator: 多个匹配规则之间的分隔符
+            max_concurrency: 同时处理的分类请求数上限
+            queue_timeout: 达到并发上限时请求等待的秒数
+            max_keywords: 单个请求的关键词数上限
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency必须大于0，当前值: {max_concurrency}")
+        if max_keywords < 1:
+            raise ValueError(f"max_keywords必须大于0，当前值: {max_keywords}")
+        if not rules_files:
+            raise ValueError("至少需要一个工作流规则文件")
+        self.case_sensitive = case_sensitive
+        self.separator = separator
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_keywords = max_keywords
+        self.rule_books: Dict[str, RuleBook] = {}
+        for name, rules_file in rules_files.items():
+            self.rule_books[name] = self._load(name, rules_file)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._counters = new_counters(SERVICE_COUNTERS)
+        self._in_flight = 0
+        self._seconds = {'total': 0.0, 'max': 0.0}
+        self._started = time.perf_counter()
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    def _load(self, name: str, rules_file: Path) -> RuleBook:
+        try:
+            start = time.perf_counter()
+            rule_book = RuleBook(name, rules_file, self.case_sensitive, self.separator)
+            logger.info(f'规则{name}已加载: {len(rule_book.classifier.nodes)}个分支，耗时{time.perf_counter() - start:.3f}秒')
+            return rule_book
+        except Exception as e:
+            raise Exception(f"加载规则{name}失败: {str(e)}")
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self._counters[key] += value
+
+    def _rule_book(self, payload: dict) -> RuleBook:
+        name = payload.get('rule_book')
+        if name is None and len(self.rule_books) == 1:
+            return next(iter(self.rule_books.values()))
+        if name not in self.rule_books:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"未加载规则: {name}，已加载: {list(self.rule_books)}")
+        return self.rule_books[name]
+
+    def _keywords(self, payload: dict) -> List[str]:
+        """请求中的关键词，与读取待分类文件时相同地清理、保序去重"""
+        keywords = payload.get('keywords')
+        if not isinstance(keywords, list):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "keywords必须是关键词列表")
+        if len(keywords) > self.max_keywords:
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"单个请求最多{self.max_keywords}个关键词，当前{len(keywords)}个")
+        keywords = [keyword for keyword in keywords if keyword is not None]
+        invalid = [keyword for keyword in keywords if not isinstance(keyword, str)]
+        if invalid:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"关键词必须是字符串，当前: {invalid[:5]}")
+        return models.UnclassifiedKeywords(data=keywords).data if keywords else []
+
+    def classify_workflow(self, payload: dict) -> dict:
+        rule_book = self._rule_book(payload)
+        keywords = self._keywords(payload)
+        self._count('keywords', len(keywords))
+        return {'rule_book': rule_book.name, 'rules_hash': rule_book.rules_hash, 'results': rule_book.classify_workflow(keywords)}
+
+    def classify_level(self, payload: dict) -> dict:
+        rule_book = self._rule_book(payload)
+        level = payload.get('level')
+        # bool是int的子类，true/false不能作为层级
+        if not isinstance(level, int) or isinstance(level, bool) or level < 1:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"level必须是大于0的整数，当前值: {level}")
+        keywords = self._keywords(payload)
+        self._count('keywords', len(keywords))
+        results = rule_book.classify_level(keywords, level, payload.get('output_name'),
+                                           payload.get('classified_sheet_name'), payload.get('parent_rule'))
+        return {'rule_book': rule_book.name, 'rules_hash': rule_book.rules_hash, 'results': results}
+
+    def reload(self, payload: dict) -> dict:
+        """重新读取内容已变化的规则文件，编译完成后才替换，替换前的请求继续使用原规则"""
+        names = [self._rule_book(payload).name] if payload.get('rule_book') is not None else list(self.rule_books)
+        reloaded = []
+        for name in names:
+            rule_book = self.rule_books[name]
+            if file_content_hash(rule_book.rules_file) != rule_book.rules_hash:
+                self.rule_books[name] = self._load(name, rule_book.rules_file)
+                reloaded.append(name)
+        return {'reloaded': reloaded}
+
+    def health(self) -> dict:
+        return {
+            'status': 'ok',
+            'started_at': self.started_at,
+            'uptime_seconds': round(time.perf_counter() - self._started, 3),
+            'rule_books': {name: {'rules_hash': rule_book.rules_hash, 'loaded_at': rule_book.loaded_at}
+                           for name, rule_book in self.rule_books.items()},
+        }
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counters, in_flight, seconds = dict(self._counters), self._in_flight, dict(self._seconds)
+        return {
+            **counters,
+            'in_flight': in_flight,
+            'max_concurrency': self.max_concurrency,
+            'request_seconds_total': round(seconds['total'], 6),
+            'request_seconds_max': round(seconds['max'], 6),
+            'uptime_seconds': round(time.perf_counter() - self._started, 3),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'rule_books': {name: rule_book.describe() for name, rule_book in self.rule_books.items()},
+        }
+
+    def handle(self, method: str, path: str, payload: Optional[dict]) -> dict:
+        """处理一个请求，分类请求受并发上限约束
+
+        Raises:
+            ServiceError: 请求无法处理
+        """
+        routes = {
+            ('GET', '/health'): (self.health, False),
+            ('GET', '/metrics'): (self.metrics, False),
+            ('POST', '/classify/workflow'): (self.classify_workflow, True),
+            ('POST', '/classify/level'): (self.classify_level, True),
+            ('POST', '/reload'): (self.reload, True),
+        }
+        if (method, path) not in routes:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"不支持的接口: {method} {path}")
+        handler, limited = routes[(method, path)]
+        if not limited:
+            return handler()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('rejected')
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, f"同时处理的请求已达上限{self.max_concurrency}，请稍后重试")
+        start = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return handler(payload or {})
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._seconds['total'] += seconds
+                self._seconds['max'] = max(self._seconds['max'], seconds)
+            self._slots.release()
+
+    def create_server(self, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+        """创建HTTP服务，只允许本机回环地址；port为0时由系统分配端口（server.server_address[1]）"""
+        try:
+            loopback = ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+        except (OSError, ValueError):
+            loopback = False
+        if not loopback:
+            raise ValueError(f"分类服务只能监听本机回环地址，当前: {host}")
+        server = ThreadingHTTPServer((host, port), _ServiceRequestHandler)
+        server.daemon_threads = True
+        server.service = self
+        logger.info(f'分类服务已启动: http://{host}:{server.server_address[1]}')
+        return server
+
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    """将HTTP请求转交给ClassificationService，请求和响应均为JSON"""
+
+    server_version = 'kw-cf'
+    # 请求体上限，超过时不读取直接返回413
+    max_body_bytes = 64 * 1024 * 1024
+
+    def _send(self, status: HTTPStatus, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_payload(self) -> Optional[dict]:
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"Content-Length无效: {self.headers.get('Content-Length')}")
+        if length > self.max_body_bytes:
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"请求体超过{self.max_body_bytes}字节")
+        if not length:
+            return None
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"请求体不是有效的JSON: {e}")
+        if not isinstance(payload, dict):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "请求体必须是JSON对象")
+        return payload
+
+    def _dispatch(self, method: str):
+        service: ClassificationService = self.server.service
+        service._count('requests')
+        try:
+            payload = self._read_payload() if method == 'POST' else None
+            body = service.handle(method, urlparse(self.path).path, payload)
+        except ServiceError as e:
+            # 因并发上限被拒绝的请求已单独计数
+            if e.status != HTTPStatus.SERVICE_UNAVAILABLE:
+                service._count('client_errors' if e.status < 500 else 'server_errors')
+            self._send(e.status, {'error': str(e)})
+            return
+        except Exception as e:
+            service._count('server_errors')
+            logger.error(f'处理请求{method} {self.path}失败: {e}')
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+            return
+        service._count('completed')
+        self._send(HTTPStatus.OK, body)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        logger.debug(f'{self.address_string()} - {format % args}')
@@ -0,0 +1,231 @@
+import datetime
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+import pandas as pd
+from .excel_handler import ExcelHandler, TABLE_FORMAT_SUFFIXES
+from .checkpoint import file_content_hash
+from .manifest import StageManifest
+from .spill import drop_unmatched_sheet
+from .logger_config import logger
+
+# 分片清单文件名，保存在分片目录中，合并时用于确认各分片的结果齐全
+SHARD_MANIFEST_NAME = '分片清单.json'
+# 分片文件中关键词在整个待分类文件（清理、去重后）中的位置，合并时按此恢复一次运行的行顺序
+POSITION_COLUMN = '序号'
+# 影响分类结果的参数，各分片必须一致
+_RESULT_OPTIONS = ('case_sensitive', 'separator')
+
+
+def keyword_shard(keyword: str, shard_count: int) -> int:
+    """关键词所属的分片（从0开始）
+
+    使用blake2b而不是内置hash，结果与进程、机器和Python版本无关，同一关键词总是落在同一分片。
+    """
+    digest = hashlib.blake2b(keyword.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+
+def shard_keyword_file(classification_file: Path, shard_count: int, output_dir: Path,
+                       excel_handler: Optional[ExcelHandler] = None, output_format: str = 'csv',
+                       chunk_size: int = 100_000) -> dict:
+    """按关键词的稳定哈希将待分类文件拆分为shard_count个分片
+
+    关键词流式读取，清理、去重后与WorkFlowProcessor读取的结果一致；每个分片是一个待分类文件，
+    额外包含序号列（关键词在整个文件中的位置，WorkFlowProcessor读取时忽略）。
+    分片目录中同时保存分片清单，记录待分类文件的内容哈希和各分片的文件名、关键词数。
+
+    Args:
+        classification_file: 待分类文件路径
+        shard_count: 分片数
+        output_dir: 分片输出目录
+        excel_handler: 读写文件使用的处理器，为None时创建新实例
+        output_format: 分片文件格式，csv、parquet、arrow或xlsx
+        chunk_size: 流式读取的块大小
+
+    Returns:
+        分片清单
+    """
+    if shard_count < 1:
+        raise ValueError(f"shard_count必须大于0，当前值: {shard_count}")
+    if output_format != 'xlsx' and output_format not in TABLE_FORMAT_SUFFIXES:
+        raise ValueError(f"不支持的分片文件格式: {output_format}")
+    try:
+        classification_file = Path(classification_file)
+        excel_handler = excel_handler or ExcelHandler()
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        keywords: List[List[str]] = [[] for _ in range(shard_count)]
+        positions: List[List[int]] = [[] for _ in range(shard_count)]
+        position = 0
+        for chunk in excel_handler.iter_keyword_file(classification_file, chunk_size):
+            for keyword in chunk.data:
+                shard = keyword_shard(keyword, shard_count)
+                keywords[shard].append(keyword)
+                positions[shard].append(position)
+                position += 1
+
+        suffix = TABLE_FORMAT_SUFFIXES.get(output_format, '.xlsx')
+        shards = []
+        for shard in range(shard_count):
+            shard_file = output_dir / f'{classification_file.stem}_分片{shard + 1}{suffix}'
+            df = pd.DataFrame({'关键词': keywords[shard], POSITION_COLUMN: positions[shard]})
+            excel_handler.write_sheets(shard_file, {'Sheet1': df})
+            shards.append({'index': shard + 1, 'file': shard_file.name, 'keywords': len(df)})
+            logger.info(f'分片{shard + 1}: {len(df)}个关键词，已保存到: {shard_file}')
+
+        manifest = {
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'classification_file': str(classification_file),
+            'input_hash': file_content_hash(classification_file),
+            'hash': 'blake2b-64',
+            'shard_count': shard_count,
+            'keywords': position,
+            'shards': shards,
+        }
+        (output_dir / SHARD_MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+        return manifest
+    except Exception as e:
+        raise Exception(f"拆分待分类文件失败: {str(e)}")
+
+
+def _latest_file(directory: Path, pattern: str) -> Optional[Path]:
+    """目录中按文件名（含时间）排序的最后一个文件"""
+    files = sorted(Path(directory).glob(pattern))
+    return files[-1] if files else None
+
+
+def _read_shard_run(result_dir: Path) -> dict:
+    """读取一个分片的运行结果：最近一次运行的运行指标和写入清单"""
+    report_path = _latest_file(result_dir, '运行指标_*.json')
+    manifest_path = _latest_file(result_dir, '工作流清单_*.json')
+    if report_path is None or manifest_path is None:
+        raise ValueError(f"{result_dir} 中没有运行指标或写入清单")
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    if report.get('status') != 'completed':
+        raise ValueError(f"{result_dir} 最近一次运行未完成: {report.get('error')}")
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    # 清单中的路径相对于分片运行时的工作目录，结果文件按文件名在结果目录中查找
+    files = [(file_entry['output_name'], Path(result_dir) / Path(file_entry['file_path']).name)
+             for file_entry in manifest['files']]
+    return {'report': report, 'files': files}
+
+
+def _sheet_rank(sheet_name: str) -> int:
+    """Sheet1在最前，二级未匹配关键词在最后，其余按关键词首次出现的位置"""
+    if sheet_name == 'Sheet1':
+        return 0
+    if sheet_name == '未匹配关键词':
+        return 2
+    return 1
+
+
+def merge_shard_results(shard_dir: Path, result_dirs: List[Path], output_dir: Path,
+                        excel_handler: Optional[ExcelHandler] = None) -> dict:
+    """将各分片的工作流结果合并为与在一台机器上处理整个待分类文件相同的结果文件
+
+    合并前检查：每个分片恰好有一个结果目录，各分片最近一次运行均已完成并保留了未匹配关键词（kw-cf --keep-unmatched），
+    且使用的工作流规则文件内容哈希、区分大小写和分隔符一致。
+    合并后仍没有任何分类sheet的结果文件（该分支在全部分片中都没有匹配）去掉未匹配关键词sheet。
+    同名结果文件的同名sheet拼接后按序号恢复一次运行的行顺序；结果文件中的sheet按Sheet1、
+    各分类sheet（按关键词首次出现的顺序）、未匹配关键词的顺序排列。同一时间只有一个结果文件在内存中。
+
+    Args:
+        shard_dir: 分片目录，包含分片清单和分片文件
+        result_dirs: 各分片的工作流结果目录，顺序不限
+        output_dir: 合并结果的输出目录
+        excel_handler: 读写文件使用的处理器，为None时创建新实例，合并结果的格式由其output_format决定
+
+    Returns:
+        {'rules_hash': 规则文件内容哈希, 'keywords': 关键词数, 'result': {结果文件名称: 文件路径}}
+    """
+    try:
+        shard_dir = Path(shard_dir)
+        excel_handler = excel_handler or ExcelHandler()
+        shard_manifest = json.loads((shard_dir / SHARD_MANIFEST_NAME).read_text(encoding='utf-8'))
+        shard_files = {shard['file']: shard['index'] for shard in shard_manifest['shards']}
+
+        # 按运行指标中的待分类文件确认各分片的结果目录
+        runs: Dict[int, dict] = {}
+        for result_dir in map(Path, result_dirs):
+            run = _read_shard_run(result_dir)
+            file_name = Path(run['report'].get('classification_file') or '').name
+            if file_name not in shard_files:
+                raise ValueError(f"{result_dir} 的待分类文件 {file_name} 不属于分片清单")
+            index = shard_files[file_name]
+            if index in runs:
+                raise ValueError(f"分片{index}有多个结果目录: {runs[index]['dir']}, {result_dir}")
+            runs[index] = {**run, 'dir': result_dir}
+        missing = sorted(set(shard_files.values()) - set(runs))
+        if missing:
+            raise ValueError(f"缺少分片{missing}的结果")
+        rules_hashes = {run['report'].get('rules_hash') for run in runs.values()}
+        if len(rules_hashes) != 1 or None in rules_hashes:
+            raise ValueError(f"各分片使用的工作流规则不一致: "
+                             f"{ {index: run['report'].get('rules_hash') for index, run in sorted(runs.items())} }")
+        for index, run in sorted(runs.items()):
+            # 分片中某个分支没有匹配时，不保留未匹配关键词的运行会丢失这些关键词，合并结果与一次运行不同
+            if not run['report']['config'].get('keep_unmatched'):
+                raise ValueError(f"分片{index}运行时没有保留未匹配关键词，请使用kw-cf --keep-unmatched重新运行: {run['dir']}")
+        for option in _RESULT_OPTIONS:
+            values = {json.dumps(run['report']['config'].get(option)) for run in runs.values()}
+            if len(values) != 1:
+                raise ValueError(f"各分片的{option}不一致: {sorted(values)}")
+
+        # 关键词 -> 在整个待分类文件中的位置
+        positions: Dict[str, int] = {}
+        for shard_file in shard_files:
+            df = excel_handler.read_table(shard_dir / shard_file, dtype=str)
+            positions.update(zip(df['关键词'], df[POSITION_COLUMN].astype(int)))
+
+        # 结果文件名称 -> 各分片的结果文件
+        output_files: Dict[str, List[Path]] = {}
+        for index in sorted(runs):
+            for output_name, path in runs[index]['files']:
+                output_files.setdefault(output_name, []).append(path)
+
+        if not set(output_files) - {'未匹配关键词'}:
+            # 与一次运行相同：没有关键词匹配一级分类规则时不生成结果文件
+            raise ValueError('各分片都没有匹配一级分类规则的关键词')
+        first_position: Dict[str, int] = {}
+
+        def merge_output(output_name: str) -> Dict[str, pd.DataFrame]:
+            parts: Dict[str, List[pd.DataFrame]] = {}
+            for path in output_files[output_name]:
+                for sheet_name, df in excel_handler.read_table(path, sheet_name=None).items():
+                    parts.setdefault(sheet_name, []).append(df)
+            sheets = {}
+            for sheet_name, dfs in parts.items():
+                df = pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+                order = df['关键词'].astype(str).map(positions)
+                if order.isna().any():
+                    unknown = df['关键词'][order.isna()].head(5).tolist()
+                    raise ValueError(f"{output_name}的{sheet_name}中有不在分片文件中的关键词: {unknown}")
+                df = df.iloc[order.argsort(kind='stable')].reset_index(drop=True)
+                sheets[sheet_name] = (df, int(order.min()))
+            ranked = drop_unmatched_sheet(sorted(sheets, key=lambda name: (_sheet_rank(name), sheets[name][1])))
+            first_position[output_name] = min(position for _, position in sheets.values())
+            return {sheet_name: sheets[sheet_name][0] for sheet_name in ranked}
+
+        # 一级未匹配关键词在前，其余结果文件按关键词首次出现的顺序
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        manifest = StageManifest()
+        result = {}
+        for output_name in output_files:
+            sheets = merge_output(output_name)
+            output_file = excel_handler.get_output_path(output_dir, f'{output_name}_{timestamp}')
+            excel_handler.write_sheets(output_file, sheets)
+            manifest.record_sheets(output_file, sheets, output_name, replace=True)
+            result[output_name] = output_file
+            del sheets
+        ordered = sorted(result, key=lambda name: (name != '未匹配关键词', first_position[name]))
+        result = {output_name: result[output_name] for output_name in ordered}
+        manifest.save(output_dir / f'工作流清单_{timestamp}.json')
+        rules_hash = rules_hashes.pop()
+        logger.info(f"{len(runs)}个分片的结果已合并到: {output_dir}，规则哈希: {rules_hash}")
+        return {'rules_hash': rules_hash, 'keywords': len(positions), 'result': result}
+    except Exception as e:
+        raise Exception(f"合并分片结果失败: {str(e)}")
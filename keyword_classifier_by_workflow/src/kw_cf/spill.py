@@ -0,0 +1,95 @@
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import pandas as pd
+
+
+def _sheet_order(sheet_name: str) -> int:
+    """sheet在结果文件中的位置：Sheet1在最前，二级未匹配关键词在最后，其余按首次出现的顺序"""
+    if sheet_name == 'Sheet1':
+        return 0
+    if sheet_name == '未匹配关键词':
+        return 2
+    return 1
+
+
+def drop_unmatched_sheet(sheet_names: List[str]) -> List[str]:
+    """合并分块、增量或分片运行的结果后，结果文件中没有任何分类sheet时去掉二级未匹配关键词sheet
+
+    一部分关键词中某个二级分支没有匹配时保留了未匹配关键词，合并后整个分支仍没有匹配时，
+    一次处理全部关键词不会生成未匹配关键词sheet。
+    """
+    if any(_sheet_order(sheet_name) == 1 for sheet_name in sheet_names):
+        return list(sheet_names)
+    return [sheet_name for sheet_name in sheet_names if sheet_name != '未匹配关键词']
+
+
+class ChunkSpill:
+    """分块执行的溢写文件
+
+    每个分块完成全部层级后，各结果文件的每个sheet写入溢写目录中的一个pickle文件（保留列的数据类型），
+    分块的结果随即从内存中释放。合并时逐个结果文件读取，同一sheet的各分块按分块顺序拼接，
+    sheet和结果文件的顺序与一次处理全部关键词时一致。
+
+    用法:
+        spill = ChunkSpill(spill_dir)
+        spill.add('结果文件A', {'Sheet1': df}, matched=True)
+        for output_name, sheets, matched in spill.iter_outputs():
+            ...
+        spill.clear()
+    """
+
+    def __init__(self, spill_dir: Path):
+        self.spill_dir = Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        # 结果文件名称 -> {'matched': 是否为一级匹配的结果文件, 'sheets': {sheet名称: [溢写文件路径]}}
+        self._outputs: Dict[str, dict] = {}
+        self._file_count = 0
+        self.bytes_written = 0
+
+    def add(self, output_name: str, sheets: Dict[str, pd.DataFrame], matched: bool):
+        """写入一个分块中一个结果文件的全部sheet
+
+        Args:
+            output_name: 结果文件名称
+            sheets: sheet名称到DataFrame的映射
+            matched: 是否为一级匹配的结果文件，一级未匹配关键词的结果文件为False
+        """
+        entry = self._outputs.setdefault(output_name, {'matched': matched, 'sheets': {}})
+        for sheet_name, df in sheets.items():
+            path = self.spill_dir / f'{self._file_count:08d}.pkl'
+            self._file_count += 1
+            df.to_pickle(path)
+            self.bytes_written += path.stat().st_size
+            entry['sheets'].setdefault(sheet_name, []).append(path)
+
+    def has_matched(self) -> bool:
+        """是否有一级匹配的结果文件"""
+        return any(entry['matched'] for entry in self._outputs.values())
+
+    def output_names(self) -> List[str]:
+        """按一次处理全部关键词时的顺序返回结果文件名称：一级未匹配关键词在前，其余按首次出现的顺序"""
+        return sorted(self._outputs, key=lambda name: self._outputs[name]['matched'])
+
+    def iter_outputs(self, drop_unmatched: bool = True) -> Iterator[Tuple[str, Dict[str, pd.DataFrame], bool]]:
+        """逐个结果文件合并各分块，同一时间只有一个结果文件在内存中
+
+        Args:
+            drop_unmatched: 合并后没有分类sheet的结果文件是否去掉未匹配关键词sheet，分片运行保留未匹配关键词时为False
+
+        Yields:
+            (结果文件名称, sheet名称到合并后DataFrame的映射, 是否为一级匹配的结果文件)
+        """
+        for output_name in self.output_names():
+            entry = self._outputs[output_name]
+            sheets = {}
+            sheet_names = sorted(entry['sheets'], key=_sheet_order)
+            for sheet_name in drop_unmatched_sheet(sheet_names) if drop_unmatched else sheet_names:
+                parts = [pd.read_pickle(path) for path in entry['sheets'][sheet_name]]
+                sheets[sheet_name] = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+            yield output_name, sheets, entry['matched']
+
+    def clear(self):
+        """删除溢写目录"""
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self._outputs = {}
@@ -0,0 +1,296 @@
+import json
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+import pandas as pd
+from .excel_handler import ExcelHandler, _sheet_file_stem, _to_arrow_compatible
+from .logger_config import logger
+from .workbook_writer import WorkbookWriterPool
+
+# 每个输出文件目录中记录原输出路径、sheet顺序和各sheet新增列文件顺序的文件
+_FILE_META_NAME = 'meta.json'
+_BASE_TABLE_NAME = 'base.arrow'
+
+
+class StageStore(ABC):
+    """阶段中间结果存储的公共部分
+
+    实现了WorkFlowProcessor用到的ExcelHandler读写方法，路径参数仍为最终Excel的输出路径，
+    在export时才真正生成Excel文件。子类实现write_sheets、append_sheets、add_columns、
+    read_sheets、sheet_names和list_files。
+    """
+    # 数据只存在于当前进程内存中时为True，写入任务不能交给子进程
+    in_process = False
+
+    @abstractmethod
+    def write_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """写入一个新的输出文件（已存在的会被覆盖）"""
+
+    @abstractmethod
+    def append_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """向已有输出文件追加sheet，同名sheet会被替换"""
+
+    @abstractmethod
+    def add_columns(self, output_file: Path, columns: Dict[str, Dict[str, Dict[str, str]]]) -> Path:
+        """为sheet新增列，columns为sheet名称 -> 列名 -> 关键词到值的映射"""
+
+    @abstractmethod
+    def read_sheets(self, file_path: Path, columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """按原顺序读取输出文件的所有sheet
+
+        columns为需要的列，存储可以只读取这些列（不存在的列忽略）；None表示需要所有列。
+        """
+
+    @abstractmethod
+    def sheet_names(self, file_path: Path) -> List[str]:
+        """输出文件中的sheet名称"""
+
+    @abstractmethod
+    def list_files(self) -> List[Path]:
+        """存储中的所有输出文件路径"""
+
+    def save_results(self, result_df: pd.DataFrame, output_file: Path, sheet_name: Optional[str] = None) -> Path:
+        """保存单个sheet的结果，与ExcelHandler.save_results对应"""
+        return self.write_sheets(output_file, {sheet_name or 'Sheet1': result_df})
+
+    def read_stage_results(self, file_path: Path, columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """读取分类结果，与ExcelHandler.read_stage_results对应"""
+        try:
+            result = {}
+            for sheet_name, df in self.read_sheets(file_path, columns).items():
+                if df.empty:
+                    continue
+                if '关键词' not in df.columns:
+                    raise ValueError(f"Sheet '{sheet_name}' 必须包含'关键词'列")
+                result[sheet_name] = df
+            return result
+        except Exception as e:
+            raise Exception(f"读取分类结果文件失败: {str(e)}")
+
+    def read_stage_classified_sheet_name(self, file_path: Dict[str, Path]) -> Dict[str, Dict[str, list[str] | Path]]:
+        """读取各输出文件的sheet名称，与ExcelHandler.read_stage_classified_sheet_name对应"""
+        try:
+            return {
+                output_name: {'file_path': path, 'classified_sheet_name': self.sheet_names(path)}
+                for output_name, path in file_path.items()
+            }
+        except Exception as e:
+            raise Exception(f"读取分类结果文件失败: {str(e)}")
+
+    def export(self, excel_handler: ExcelHandler, file_paths: Optional[List[Path]] = None, write_workers: int = 1) -> List[Path]:
+        """将存储中的结果导出为最终文件
+
+        Args:
+            excel_handler: 用于写入最终文件的Excel处理器
+            file_paths: 需要导出的输出文件路径，None表示导出全部
+            write_workers: 并行写入的进程数
+
+        Returns:
+            导出的文件路径列表
+        """
+        file_paths = self.list_files() if file_paths is None else [Path(path) for path in file_paths]
+        with WorkbookWriterPool(excel_handler, write_workers) as pool:
+            for file_path in file_paths:
+                pool.submit(file_path, 'write_sheets', file_path, self.read_sheets(file_path))
+        logger.debug(f'阶段存储已导出{len(file_paths)}个文件')
+        return file_paths
+
+
+class MemoryStageStore(StageStore):
+    """内存中的阶段中间结果存储
+
+    各阶段的DataFrame直接在内存中传递，新增列直接添加到已有DataFrame上，
+    整个工作流不产生中间文件，结果在export时一次写出。
+    """
+    in_process = True
+
+    def __init__(self):
+        self._files: Dict[str, Dict[str, pd.DataFrame]] = {}
+
+    def _get_file(self, file_path: Path) -> Dict[str, pd.DataFrame]:
+        if str(file_path) not in self._files:
+            raise FileNotFoundError(f"阶段存储中不存在 {file_path}")
+        return self._files[str(file_path)]
+
+    def write_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """写入一个新的输出文件（已存在的会被覆盖）"""
+        self._files[str(output_file)] = dict(sheets)
+        return Path(output_file)
+
+    def append_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """向已有输出文件追加sheet，同名sheet会被替换"""
+        self._get_file(output_file).update(sheets)
+        return Path(output_file)
+
+    def add_columns(self, output_file: Path, columns: Dict[str, Dict[str, Dict[str, str]]]) -> Path:
+        """为sheet新增列"""
+        file_sheets = self._get_file(output_file)
+        for sheet_name, sheet_columns in columns.items():
+            if sheet_name not in file_sheets:
+                raise ValueError(f"{output_file} 中不存在Sheet '{sheet_name}'")
+            df = file_sheets[sheet_name]
+            for column_name, keyword_to_value in sheet_columns.items():
+                df[column_name] = df['关键词'].map(keyword_to_value)
+        return Path(output_file)
+
+    def read_sheets(self, file_path: Path, columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """按原顺序返回输出文件的所有sheet，不复制数据，因此总是包含所有列"""
+        return dict(self._get_file(file_path))
+
+    def sheet_names(self, file_path: Path) -> List[str]:
+        return list(self._get_file(file_path))
+
+    def list_files(self) -> List[Path]:
+        return [Path(file_path) for file_path in self._files]
+
+    def clear(self):
+        self._files.clear()
+
+
+class ArrowStageStore(StageStore):
+    """基于Arrow IPC文件的阶段中间结果存储
+
+    替代阶段之间的Excel写入与回读：每个输出文件、sheet的基础数据保存为一张表，
+    每个层级新增的阶段N列单独保存为一张表，读取时通过内存映射加载。
+
+    目录结构:
+        store_dir/<输出文件名>/meta.json
+        store_dir/<输出文件名>/<sheet名称>/base.arrow
+        store_dir/<输出文件名>/<sheet名称>/c1_阶段3.arrow
+
+    新增列文件的顺序记录在meta.json中，读取时按记录的顺序合并，不依赖文件名排序。
+    """
+
+    def __init__(self, store_dir: Path = Path('./.kw_cf_stage_store')):
+        self.store_dir = Path(store_dir)
+
+    def _file_dir(self, file_path: Path) -> Path:
+        return self.store_dir / Path(file_path).name
+
+    def _read_meta(self, file_path: Path) -> dict:
+        meta_path = self._file_dir(file_path) / _FILE_META_NAME
+        if not meta_path.exists():
+            raise FileNotFoundError(f"阶段存储中不存在 {file_path}")
+        return json.loads(meta_path.read_text(encoding='utf-8'))
+
+    def _write_meta(self, file_path: Path, sheet_names: List[str], column_files: Optional[Dict[str, List[str]]] = None):
+        column_files = column_files or {}
+        meta = {
+            'file_path': str(file_path),
+            'sheet_names': sheet_names,
+            'column_files': {sheet_name: column_files.get(sheet_name, []) for sheet_name in sheet_names},
+        }
+        (self._file_dir(file_path) / _FILE_META_NAME).write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+    @staticmethod
+    def _write_arrow(path: Path, df: pd.DataFrame):
+        import pyarrow
+        import pyarrow.ipc
+        table = pyarrow.Table.from_pandas(_to_arrow_compatible(df), preserve_index=False)
+        with pyarrow.OSFile(str(path), 'wb') as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    @staticmethod
+    def _map_arrow(path: Path):
+        """以内存映射方式打开Arrow表，数据不会复制到进程内存
+
+        读取后即关闭文件句柄，返回的表仍引用映射的内存，表释放后映射随之解除。
+        """
+        import pyarrow
+        import pyarrow.ipc
+        with pyarrow.memory_map(str(path)) as source:
+            return pyarrow.ipc.open_file(source).read_all()
+
+    def _write_sheet(self, file_path: Path, sheet_name: str, df: pd.DataFrame):
+        sheet_dir = self._file_dir(file_path) / _sheet_file_stem(sheet_name)
+        if sheet_dir.exists():
+            shutil.rmtree(sheet_dir)
+        sheet_dir.mkdir(parents=True)
+        self._write_arrow(sheet_dir / _BASE_TABLE_NAME, df)
+
+    def write_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """写入一个新的输出文件（已存在的会被覆盖）"""
+        file_dir = self._file_dir(output_file)
+        if file_dir.exists():
+            shutil.rmtree(file_dir)
+        file_dir.mkdir(parents=True)
+        for sheet_name, df in sheets.items():
+            self._write_sheet(output_file, sheet_name, df)
+        self._write_meta(output_file, list(sheets))
+        return Path(output_file)
+
+    def append_sheets(self, output_file: Path, sheets: Dict[str, pd.DataFrame]) -> Path:
+        """向已有输出文件追加sheet，同名sheet会被替换，不改动其他sheet"""
+        meta = self._read_meta(output_file)
+        sheet_names, column_files = meta['sheet_names'], meta['column_files']
+        for sheet_name, df in sheets.items():
+            self._write_sheet(output_file, sheet_name, df)
+            # 替换的sheet重新写入了目录，原有新增列随之删除
+            column_files.pop(sheet_name, None)
+            if sheet_name not in sheet_names:
+                sheet_names.append(sheet_name)
+        self._write_meta(output_file, sheet_names, column_files)
+        return Path(output_file)
+
+    def add_columns(self, output_file: Path, columns: Dict[str, Dict[str, Dict[str, str]]]) -> Path:
+        """为sheet新增列，每个新增列单独保存为一张表，不重写已有数据"""
+        meta = self._read_meta(output_file)
+        sheet_names, column_files = meta['sheet_names'], meta['column_files']
+        for sheet_name, sheet_columns in columns.items():
+            if sheet_name not in sheet_names:
+                raise ValueError(f"{output_file} 中不存在Sheet '{sheet_name}'")
+            sheet_dir = self._file_dir(output_file) / _sheet_file_stem(sheet_name)
+            keywords = self._map_arrow(sheet_dir / _BASE_TABLE_NAME).column('关键词').to_pandas()
+            sheet_column_files = column_files.setdefault(sheet_name, [])
+            for column_name, keyword_to_value in sheet_columns.items():
+                column = pd.DataFrame({column_name: keywords.map(keyword_to_value)})
+                file_name = f'c{len(sheet_column_files) + 1}_{_sheet_file_stem(column_name)}.arrow'
+                self._write_arrow(sheet_dir / file_name, column)
+                sheet_column_files.append(file_name)
+        self._write_meta(output_file, sheet_names, column_files)
+        return Path(output_file)
+
+    def read_sheet(self, file_path: Path, sheet_name: str, columns: Optional[List[str]] = None):
+        """以内存映射方式读取一个sheet，返回pyarrow.Table，columns为None时返回所有列"""
+        sheet_dir = self._file_dir(file_path) / _sheet_file_stem(sheet_name)
+        table = self._map_arrow(sheet_dir / _BASE_TABLE_NAME)
+        for file_name in self._read_meta(file_path)['column_files'].get(sheet_name, []):
+            column_table = self._map_arrow(sheet_dir / file_name)
+            for name in column_table.column_names:
+                if name in table.column_names:
+                    table = table.set_column(table.column_names.index(name), name, column_table.column(name))
+                else:
+                    table = table.append_column(name, column_table.column(name))
+        if columns is not None:
+            table = table.select([name for name in columns if name in table.column_names])
+        return table
+
+    def read_sheets(self, file_path: Path, columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+        """按原顺序读取输出文件的所有sheet
+
+        内存映射的Arrow表转换为DataFrame时会复制数据，只有columns中的列被转换；
+        各层级的分类只需要关键词和上一层级的规则列，不会复制其余各列。
+        """
+        return {
+            sheet_name: self.read_sheet(file_path, sheet_name, columns).to_pandas()
+            for sheet_name in self._read_meta(file_path)['sheet_names']
+        }
+
+    def sheet_names(self, file_path: Path) -> List[str]:
+        return list(self._read_meta(file_path)['sheet_names'])
+
+    def list_files(self) -> List[Path]:
+        """列出存储中的所有输出文件路径"""
+        if not self.store_dir.exists():
+            return []
+        return [
+            Path(json.loads(meta_path.read_text(encoding='utf-8'))['file_path'])
+            for meta_path in sorted(self.store_dir.glob(f'*/{_FILE_META_NAME}'))
+        ]
+
+    def clear(self):
+        """删除存储目录"""
+        if self.store_dir.exists():
+            shutil.rmtree(self.store_dir)
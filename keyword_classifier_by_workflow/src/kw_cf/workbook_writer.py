@@ -0,0 +1,97 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from .excel_handler import ExcelHandler
+from .logger_config import logger
+
+
+def _run_handler_method(excel_handler: ExcelHandler, method: str, args: tuple) -> Any:
+    """在工作进程中调用ExcelHandler的写入方法"""
+    return getattr(excel_handler, method)(*args)
+
+
+def _run_counted_handler_method(excel_handler: ExcelHandler, method: str, args: tuple) -> Tuple[Any, Optional[Dict[str, int]]]:
+    """在工作进程中调用写入方法，同时返回该任务的文件读写计数，由主进程累计到运行指标"""
+    io_counters = getattr(excel_handler, 'io_counters', None)
+    if io_counters is not None:
+        excel_handler.io_counters = dict.fromkeys(io_counters, 0)
+    return _run_handler_method(excel_handler, method, args), getattr(excel_handler, 'io_counters', None)
+
+
+class WorkbookWriteError(Exception):
+    """一个或多个工作簿写入失败，errors为文件路径到错误信息的映射"""
+
+    def __init__(self, errors: Dict[Path, str]):
+        self.errors = errors
+        details = '\n'.join(f'{path}: {error}' for path, error in errors.items())
+        super().__init__(f"{len(errors)}个文件写入失败:\n{details}")
+
+
+class WorkbookWriterPool:
+    """相互独立的输出工作簿写入池
+
+    Excel写入主要是CPU密集的XML序列化，max_workers大于1时每个工作簿在独立进程中写入；
+    等于1时在当前进程中依次写入。单个文件失败不会中断其他文件，全部完成后统一报告。
+
+    用法:
+        with WorkbookWriterPool(excel_handler, max_workers=4) as pool:
+            pool.submit(output_file, 'write_sheets', output_file, sheets)
+        results = pool.results
+    """
+
+    def __init__(self, excel_handler: ExcelHandler, max_workers: int = 1):
+        if max_workers < 1:
+            raise ValueError(f"max_workers必须大于0，当前值: {max_workers}")
+        self.excel_handler = excel_handler
+        self.max_workers = max_workers
+        self.results: Dict[Path, Any] = {}
+        self.errors: Dict[Path, str] = {}
+        self._tasks: List[Tuple[Path, str, tuple]] = []
+
+    def submit(self, output_file: Path, method: str, *args):
+        """登记一个写入任务，method为ExcelHandler的方法名，同一文件只能登记一次"""
+        output_file = Path(output_file)
+        if any(path == output_file for path, _, _ in self._tasks):
+            raise ValueError(f"文件 {output_file} 已登记写入任务，同一文件的写入不能并行")
+        self._tasks.append((output_file, method, args))
+
+    def run(self) -> Dict[Path, Any]:
+        """执行所有写入任务，有失败时抛出WorkbookWriteError"""
+        tasks, self._tasks = self._tasks, []
+        # 写入目标只存在于当前进程内存中时（如MemoryStageStore），不能交给子进程写入
+        in_process = getattr(self.excel_handler, 'in_process', False)
+        if self.max_workers == 1 or len(tasks) <= 1 or in_process:
+            for output_file, method, args in tasks:
+                try:
+                    self.results[output_file] = _run_handler_method(self.excel_handler, method, args)
+                except Exception as e:
+                    self.errors[output_file] = str(e)
+        else:
+            workers = min(self.max_workers, len(tasks))
+            logger.debug(f"使用{workers}个进程并行写入{len(tasks)}个工作簿")
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures: Dict[Path, Future] = {
+                    output_file: executor.submit(_run_counted_handler_method, self.excel_handler, method, args)
+                    for output_file, method, args in tasks
+                }
+                for output_file, future in futures.items():
+                    try:
+                        self.results[output_file], io_counters = future.result()
+                        for key, value in (io_counters or {}).items():
+                            self.excel_handler.io_counters[key] += value
+                    except Exception as e:
+                        self.errors[output_file] = str(e)
+        for output_file, error in self.errors.items():
+            logger.error(f"写入 {output_file} 失败: {error}")
+        if self.errors:
+            raise WorkbookWriteError(self.errors)
+        return self.results
+
+    def __enter__(self) -> 'WorkbookWriterPool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> Optional[bool]:
+        # with代码块出错时不再执行已登记的任务
+        if exc_type is None:
+            self.run()
+        return None
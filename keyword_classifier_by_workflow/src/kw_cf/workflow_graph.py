@@ -0,0 +1,350 @@
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+from . import branch_scheduler
+from . import models
+from .logger_config import logger
+
+# 节点键：(层级, 结果文件名称, sheet名称, 父级规则)，二级节点没有sheet和父级规则，三级节点没有父级规则
+NodeKey = Tuple[int, Optional[str], Optional[str], Optional[str]]
+
+_ROOT: NodeKey = (1, None, None, None)
+
+
+def _classify_node(processor, level: int, keywords: List[str], rules: models.WorkFlowRules):
+    """对一个节点的关键词分类，返回(分类结果, 节点的运行指标)"""
+    return processor._measure('_get_classified_results', models.UnclassifiedKeywords(data=keywords), rules, level)
+
+
+def _run_node(level: int, keywords: List[str], rules: models.WorkFlowRules):
+    """在工作进程中对一个节点分类，处理器由branch_scheduler的进程池初始化函数传入"""
+    return _classify_node(branch_scheduler._worker_processor, level, keywords, rules)
+
+
+class GraphNode:
+    """任务图中的一个分支节点"""
+
+    def __init__(self, key: NodeKey, rules: Optional[models.WorkFlowRules] = None):
+        self.key = key
+        self.rules = rules
+        # (关键词在所属sheet中的位置, 关键词)，合并多个上游节点的关键词时按位置恢复原顺序
+        self.inputs: List[Tuple[int, str]] = []
+        self.contributors: List[NodeKey] = []
+        self.children: List[NodeKey] = []
+        # 尚未完成的上游节点数量
+        self.pending = 0
+        self.result: Optional[models.ClassifiedResult] = None
+        self.seconds = 0.0
+        # 节点的运行指标：耗时、CPU时间、分类计数和内存峰值
+        self.metrics: Optional[dict] = None
+        # waiting -> ready -> running -> done，没有关键词或规则的节点直接变为skipped
+        self.state = 'waiting'
+
+    @property
+    def level(self) -> int:
+        return self.key[0]
+
+    @property
+    def name(self) -> str:
+        return '/'.join(str(part) for part in self.key if part is not None)
+
+
+class WorkflowGraph:
+    """按分支依赖关系调度二级及以上分类的任务图
+
+    节点为(层级, 结果文件名称, sheet名称, 父级规则)：二级节点依赖一级分类，三级节点依赖所属结果文件的二级节点，
+    N级节点依赖同一sheet中包含该父级规则的N-1级节点。节点的上游全部完成后立即执行，
+    不需要等待同层级的其他分支，规则树不均衡时可以缩短整体耗时。
+
+    结果按层级返回，结构与process_stage2、process_stage3、process_stage_high的返回值一致，
+    可以直接交给对应的save方法保存，分类结果与按层级执行完全一致。
+
+    用法:
+        graph = WorkflowGraph(processor, max_workers=4)
+        level_results = graph.run(stage1_results, stage1_seconds)
+        nodes, seconds = graph.critical_path()
+    """
+
+    def __init__(self, processor, max_workers: int = 1):
+        if max_workers < 1:
+            raise ValueError(f"max_workers必须大于0，当前值: {max_workers}")
+        if processor.workflow_rules is None:
+            raise ValueError("处理器尚未读取工作流规则")
+        self.processor = processor
+        self.max_workers = max_workers
+        self.workflow_rules: models.WorkFlowRules = processor.workflow_rules
+        self.max_level = self.workflow_rules.get_max_level()
+        self.nodes: Dict[NodeKey, GraphNode] = {}
+        self.messages: List[str] = []
+        self.wall_seconds = 0.0
+        self._ready: deque = deque()
+        self._messages: List[Tuple[tuple, str]] = []
+        self._rules_cache: Dict[Tuple[int, str], Optional[models.WorkFlowRules]] = {}
+        # 结果文件、sheet在分类结果中的顺序，用于按固定顺序返回结果
+        self._output_order: Dict[str, int] = {}
+        self._sheet_order: Dict[Tuple[str, str], int] = {}
+        # 各层级规则中出现过的父级规则
+        self._parent_rules: Dict[int, set] = {}
+        for rule in self.workflow_rules.rules:
+            self._parent_rules.setdefault(rule.level, set()).add(rule.parent_rule)
+
+    def run(self, stage1_result: Optional[models.ClassifiedResult], stage1_seconds: float = 0.0) -> Dict[int, dict]:
+        """从一级分类结果开始执行任务图
+
+        Args:
+            stage1_result: 一级分类结果
+            stage1_seconds: 一级分类耗时，作为任务图的根节点计入关键路径
+
+        Returns:
+            层级到分类结果的映射：
+                2: {结果文件名称: 分类结果}
+                3: {结果文件名称: {sheet名称: 分类结果}}
+                N: {结果文件名称: {sheet名称: {父级规则: 分类结果}}}
+        """
+        try:
+            start = time.perf_counter()
+            root = self.nodes[_ROOT] = GraphNode(_ROOT)
+            root.seconds = stage1_seconds
+            root.state = 'done'
+            for level in range(4, self.max_level + 1):
+                if self.workflow_rules.get(level) is None:
+                    self._message(_ROOT, f'找不到{level}规则，已经返回')
+            if stage1_result is not None and self.max_level >= 2:
+                self._add_stage2_nodes(stage1_result)
+            if self.max_workers == 1:
+                self._run_inline()
+            else:
+                self._run_pool()
+            self.wall_seconds = time.perf_counter() - start
+            self.messages = [msg for _, msg in sorted(self._messages, key=lambda item: item[0])]
+            nodes, seconds = self.critical_path()
+            logger.info(f'任务图共{len(self.nodes) - 1}个分支节点，耗时{self.wall_seconds:.3f}秒，'
+                        f'关键路径({seconds:.3f}秒): {" -> ".join(node.name for node in nodes)}')
+            return self._level_results()
+        except Exception as e:
+            raise Exception(f"执行任务图失败: {str(e)}")
+
+    def critical_path(self) -> Tuple[List[GraphNode], float]:
+        """返回按分类耗时计算的关键路径（从一级分类到最耗时的叶子节点）及其总耗时"""
+        finish: Dict[NodeKey, float] = {}
+        previous: Dict[NodeKey, Optional[NodeKey]] = {}
+        # 节点的上游层级总是更低，按层级顺序即为拓扑顺序
+        for key in sorted(self.nodes, key=lambda key: key[0]):
+            node = self.nodes[key]
+            if node.state != 'done':
+                continue
+            best = max((c for c in node.contributors if c in finish), key=lambda c: finish[c], default=None)
+            finish[key] = node.seconds + (finish[best] if best is not None else 0.0)
+            previous[key] = best
+        if not finish:
+            return [], 0.0
+        key = max(finish, key=lambda k: finish[k])
+        seconds = finish[key]
+        path = []
+        while key is not None:
+            path.append(self.nodes[key])
+            key = previous[key]
+        return path[::-1], seconds
+
+    def report(self) -> dict:
+        """返回任务图的执行概况，包括各节点耗时和关键路径"""
+        path, seconds = self.critical_path()
+        return {
+            'wall_seconds': round(self.wall_seconds, 6),
+            'critical_path': [node.name for node in path],
+            'critical_path_seconds': round(seconds, 6),
+            'nodes': [
+                {'name': node.name, 'level': node.level, 'state': node.state,
+                 'keywords': len(node.inputs), 'seconds': round(node.seconds, 6)}
+                for node in sorted(self.nodes.values(), key=lambda node: self._sort_key(node.key))
+            ],
+        }
+
+    def _sort_key(self, key: NodeKey) -> tuple:
+        level, output_name, sheet_name, parent_rule = key
+        # 同一sheet的父级规则按其第一个关键词在sheet中的位置排序，与按上一层级结果分组的顺序一致
+        node = self.nodes.get(key)
+        first_position = node.inputs[0][0] if node is not None and node.inputs else -1
+        return (
+            level,
+            self._output_order.get(output_name, -1),
+            self._sheet_order.get((output_name, sheet_name), -1),
+            first_position,
+        )
+
+    def _message(self, key: NodeKey, msg: str):
+        self._messages.append((self._sort_key(key), msg))
+
+    def _branch_rules(self, level: int, output_name: str, sheet_names: List[str]) -> Optional[models.WorkFlowRules]:
+        """获取一个结果文件在第level级的规则，"全"只在该结果文件的范围内展开"""
+        cache_key = (level, output_name)
+        if cache_key not in self._rules_cache:
+            if level == 3:
+                level_rules = self.workflow_rules.filter_rules(source_sheet_name='Sheet3')
+            else:
+                level_rules = self.workflow_rules.filter_rules(level=level)
+            if level_rules is not None:
+                level_rules = level_rules.filter_rules(output_name=lambda x: x in (output_name, '全'))
+            if level_rules is not None:
+                stage_results = {output_name: {'classified_sheet_name': list(sheet_names)}}
+                if level == 3:
+                    level_rules = self.processor.get_level_rules(level_rules, stage_results)
+                else:
+                    level_rules = self.processor.get_level_rules_v1(level_rules, stage_results)
+                level_rules = level_rules.filter_rules(output_name=output_name)
+            self._rules_cache[cache_key] = level_rules
+        return self._rules_cache[cache_key]
+
+    def _add_stage2_nodes(self, stage1_result: models.ClassifiedResult):
+        if self.workflow_rules.get('Sheet2') is None:
+            self._message(_ROOT, '找不到Sheet2规则，已经返回')
+            return
+        sheet2_rules = self.workflow_rules.filter_rules(source_sheet_name='Sheet2')
+        for output_name, keyword_list in stage1_result.get_grouped_keywords(group_by='output_name', match_type='match').items():
+            self._output_order[output_name] = len(self._output_order)
+            key = (2, output_name, None, None)
+            rules = sheet2_rules.filter_rules(output_name=output_name)
+            if not rules:
+                self._message(key, f'找不到{output_name}的Sheet2规则，已经返回')
+                continue
+            node = self.nodes[key] = GraphNode(key, rules)
+            node.contributors.append(_ROOT)
+            node.inputs = [(position, kw.keyword) for position, kw in enumerate(keyword_list)]
+            self._release(node)
+
+    def _add_sheet_nodes(self, stage2_node: GraphNode):
+        """二级节点完成后，按其分类结果建立各sheet的三级及以上节点"""
+        output_name = stage2_node.key[1]
+        # 保留未匹配关键词时，没有匹配的分支结果中只有未匹配关键词，与没有结果相同
+        if stage2_node.result is None or not stage2_node.result.classified_keywords or self.max_level < 3:
+            return
+        sheets = {
+            sheet_name: keyword_list
+            for (_, sheet_name), keyword_list in stage2_node.result.group_by_output_name_and_sheet(match_type='match').items()
+        }
+        for sheet_name in sheets:
+            self._sheet_order[(output_name, sheet_name)] = len(self._sheet_order)
+        if self.workflow_rules.get('Sheet3') is None:
+            self._message(stage2_node.key, '找不到Sheet3规则，已经返回')
+            return
+        sheet3_rules = self._branch_rules(3, output_name, list(sheets))
+        for sheet_name, keyword_list in sheets.items():
+            key = (3, output_name, sheet_name, None)
+            rules = sheet3_rules.filter_rules(classified_sheet_name=sheet_name) if sheet3_rules else None
+            if not rules:
+                self._message(key, f'找不到{output_name}的Sheet2规则，已经返回')
+                continue
+            node = self.nodes[key] = GraphNode(key, rules)
+            node.contributors.append(stage2_node.key)
+            node.inputs = [(position, kw.keyword) for position, kw in enumerate(keyword_list)]
+            self._add_descendants(node, list(sheets))
+            self._release(node)
+
+    def _add_descendants(self, sheet_node: GraphNode, sheet_names: List[str]):
+        """按规则树建立一个sheet的全部下级节点及依赖关系"""
+        _, output_name, sheet_name, _ = sheet_node.key
+        current = [sheet_node]
+        for level in range(4, self.max_level + 1):
+            if self.workflow_rules.get(level) is None:
+                break
+            level_rules = self._branch_rules(level, output_name, sheet_names)
+            children: Dict[NodeKey, GraphNode] = {}
+            for parent_node in current:
+                for rule_name in dict.fromkeys(parent_node.rules.to_rules_list() if parent_node.rules else []):
+                    key = (level, output_name, sheet_name, rule_name)
+                    child = children.get(key)
+                    if child is None:
+                        rules = level_rules.filter_rules(classified_sheet_name=sheet_name, parent_rule=rule_name) if level_rules else None
+                        child = children[key] = self.nodes[key] = GraphNode(key, rules)
+                    child.contributors.append(parent_node.key)
+                    child.pending += 1
+                    parent_node.children.append(key)
+            if not children:
+                break
+            current = list(children.values())
+
+    def _release(self, node: GraphNode):
+        """上游全部完成后决定节点是执行还是跳过"""
+        if not node.inputs:
+            self._resolve(node, 'skipped')
+            return
+        node.inputs.sort(key=lambda item: item[0])
+        if not node.rules:
+            # 与按层级执行一致，只有父级规则出现在该层级规则中时才提示
+            if node.key[3] in self._parent_rules.get(node.level, ()):
+                self._message(node.key, f'找不到{node.key[1]}的Sheet2规则，已经返回')
+            self._resolve(node, 'skipped')
+            return
+        node.state = 'ready'
+        self._ready.append(node.key)
+
+    def _resolve(self, node: GraphNode, state: str):
+        """节点完成或跳过后，将关键词分发给下级节点，下级节点的上游全部完成时释放"""
+        node.state = state
+        if node.level == 2 and state == 'done':
+            self._add_sheet_nodes(node)
+            return
+        positions = {keyword: position for position, keyword in node.inputs}
+        matched: Dict[str, List[Tuple[int, str]]] = {}
+        if node.result is not None:
+            for kw in node.result.classified_keywords:
+                matched.setdefault(kw.matched_rule, []).append((positions.get(kw.keyword, len(positions)), kw.keyword))
+        for child_key in node.children:
+            child = self.nodes[child_key]
+            child.inputs.extend(matched.get(child_key[3], []))
+            child.pending -= 1
+            if child.pending == 0:
+                self._release(child)
+
+    def _complete(self, key: NodeKey, result: Optional[models.ClassifiedResult], metrics: dict):
+        node = self.nodes[key]
+        node.result = result
+        node.metrics = metrics
+        node.seconds = metrics['wall_seconds']
+        logger.debug(f'任务图节点{node.name}完成，{len(node.inputs)}个关键词，耗时{node.seconds:.3f}秒')
+        self._resolve(node, 'done')
+
+    def _run_inline(self):
+        while self._ready:
+            node = self.nodes[self._ready.popleft()]
+            node.state = 'running'
+            result, metrics = _classify_node(self.processor, node.level, [kw for _, kw in node.inputs], node.rules)
+            self._complete(node.key, result, metrics)
+
+    def _run_pool(self):
+        logger.debug(f'使用{self.max_workers}个进程执行任务图')
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=branch_scheduler._init_worker,
+                                 initargs=(self.processor,)) as executor:
+            running: Dict[Future, NodeKey] = {}
+            while self._ready or running:
+                # 关键词多的节点先提交
+                ready = sorted(self._ready, key=lambda key: -len(self.nodes[key].inputs))
+                self._ready.clear()
+                for key in ready:
+                    node = self.nodes[key]
+                    node.state = 'running'
+                    running[executor.submit(_run_node, node.level, [kw for _, kw in node.inputs], node.rules)] = key
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        result, metrics = future.result()
+                    except Exception as e:
+                        raise Exception(f"分支{self.nodes[key].name}处理失败: {str(e)}")
+                    self._complete(key, result, metrics)
+
+    def _level_results(self) -> Dict[int, dict]:
+        level_results: Dict[int, dict] = {}
+        for key in sorted(self.nodes, key=self._sort_key):
+            node = self.nodes[key]
+            if node.state != 'done':
+                continue
+            level, output_name, sheet_name, parent_rule = key
+            if level == 2:
+                level_results.setdefault(2, {})[output_name] = node.result
+            elif level == 3:
+                level_results.setdefault(3, {}).setdefault(output_name, {})[sheet_name] = node.result
+            else:
+                level_results.setdefault(level, {}).setdefault(output_name, {}).setdefault(sheet_name, {})[parent_rule] = node.result
+        return level_results
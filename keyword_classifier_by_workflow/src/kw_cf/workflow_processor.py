@@ -1,41 +1,197 @@
 from pathlib import Path
 from .keyword_classifier import KeywordClassifier
 from .excel_handler import ExcelHandler
+from .workbook_writer import WorkbookWriterPool
+from .stage_store import StageStore, MemoryStageStore
+from .result_table import ResultTableCollector, get_result_table_path
+from .result_sink import SQLiteResultSink
+from .manifest import StageManifest
+from .branch_scheduler import BranchScheduler
+from .workflow_graph import WorkflowGraph
+from .hierarchical_classifier import HierarchicalClassifier
+from .checkpoint import WorkflowCheckpoint, file_content_hash
+from .planner import WorkflowPlanner
+from .metrics import WorkflowMetrics, IO_COUNTERS, new_counters, peak_rss_bytes, current_rss_bytes
+from .spill import ChunkSpill, _sheet_order, drop_unmatched_sheet
 from .logger_config import logger
-from typing import List,Dict,TypedDict,Optional,Callable
+from typing import List,Dict,TypedDict,Optional,Callable,Literal
 from . import models
 import pandas as pd
 import datetime
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+# 分块执行：只指定内存预算时的最大块大小、按预算调整时的最小块大小、流式读取待分类文件的行数
+_DEFAULT_CHUNK_SIZE = 100_000
+_MIN_CHUNK_SIZE = 1_000
+_CHUNK_READ_SIZE = 10_000
+
+# 二级及以上分类支持的调度方式，命令行的可选值同样取自这里
+SCHEDULES = ('levels', 'graph', 'single_pass')
+
 
 class Stage2OutputNameDict(TypedDict):
     file_path:str
     classified_sheet_name:List[str]
     
-    
+
+class StageColumnBuffer:
+    """新增列写入缓冲区
+
+    在一个层级内收集所有工作簿、sheet的新增列，flush时每个工作簿只读取和写入一次。
+    同一sheet同一列的多次写入（如不同父规则的结果）会合并到同一列中。
+    """
+    def __init__(self, excel_handler: ExcelHandler, write_workers: int = 1, manifest: Optional[StageManifest] = None):
+        self.excel_handler = excel_handler
+        self.write_workers = write_workers
+        self.manifest = manifest
+        self._columns:Dict[Path,Dict[str,Dict[str,Dict[str,str]]]] = {}
+
+    def add(self, file_path: Path, sheet_name: str, column_name: str, keyword_to_rule: Dict[str,str]):
+        """登记一个sheet的新增列数据"""
+        column = self._columns.setdefault(Path(file_path), {}).setdefault(sheet_name, {}).setdefault(column_name, {})
+        column.update(keyword_to_rule)
+
+    def flush(self) -> List[Path]:
+        """将缓冲的新增列写入各工作簿，返回写入的文件列表"""
+        columns_by_file, self._columns = self._columns, {}
+        with WorkbookWriterPool(self.excel_handler, self.write_workers) as pool:
+            for file_path, columns in columns_by_file.items():
+                logger.debug(f'写入{file_path}的新增列: {[(sheet, list(cols)) for sheet, cols in columns.items()]}')
+                pool.submit(file_path, 'add_columns', file_path, columns)
+        if self.manifest is not None:
+            for file_path, columns in columns_by_file.items():
+                self.manifest.record_columns(file_path, {sheet: list(cols) for sheet, cols in columns.items()})
+        return list(pool.results.values())
+
 
 class WorkFlowProcessor:
     def __init__(self,
                  excel_handler: ExcelHandler | None = None,
                  keyword_classifier: KeywordClassifier | None = None,
-                 error_callback: Optional[Callable] = None
+                 error_callback: Optional[Callable] = None,
+                 write_workers: int = 1,
+                 stage_store: StageStore | None = None,
+                 export_stage_store: bool = True,
+                 result_layout: Literal['workbooks','long'] = 'workbooks',
+                 result_sink: SQLiteResultSink | None = None,
+                 branch_workers: int = 1,
+                 schedule: Literal['levels','graph','single_pass'] = 'levels',
+                 resume: bool = False,
+                 incremental: bool = False,
+                 trace_memory: bool = False,
+                 output_dir: Path | str = './工作流结果',
+                 chunk_size: Optional[int] = None,
+                 memory_budget_mb: Optional[int] = None,
+                 keep_unmatched: bool = False
                  ):
         """初始化工作流处理器
         
         Args:
             classifier: 关键词分类器实例，如果为None则创建新实例
             excel_handler: Excel处理器实例，如果为None则创建新实例
+            write_workers: 并行写入输出工作簿的进程数，1表示在当前进程中依次写入
+            stage_store: 阶段中间结果存储，为None时各阶段直接读写Excel文件；
+                MemoryStageStore时各阶段结果在内存中传递，文件只在最后写出一次
+            export_stage_store: 使用stage_store时，工作流结束后是否自动导出最终文件
+            result_layout: 结果形式，workbooks为每个结果文件名称一个文件，long为所有层级结果写入一张长表
+            result_sink: 结果数据库，指定时每次工作流的结果额外写入数据库，run_id保存在self.run_id
+            branch_workers: 二级及以上分类中并行处理各结果文件分支的进程数，1表示依次处理
+            schedule: 二级及以上分类的调度方式，levels为逐层级处理，graph为按分支依赖关系的任务图处理，
+                分支的上游完成后立即处理，不等待同层级的其他分支，执行概况保存在self.graph_report；
+                single_pass将整个规则树编译为分层判定结构，每个关键词一次遍历得到全部层级的结果，
+                各层级的中间结果保存在内存中（未指定stage_store时），结束后按原有格式一次写出，不写检查点
+            resume: 是否从输出目录中的检查点继续，规则文件、待分类文件的内容和相关参数不变时跳过已完成的层级；
+                每完成一个层级都会更新检查点，长表模式和结果数据库不写检查点
+            incremental: 是否增量运行，只对上次运行结果中没有的关键词执行全部层级的分类，并合并到已有的结果文件中；
+                要求输出目录中有上次完整运行的检查点且工作流规则文件未变化
+            trace_memory: 运行指标中是否用tracemalloc记录各阶段、分支的Python内存峰值，开启后分类会变慢；
+                未开启时只记录进程的内存峰值（RSS）
+            output_dir: 结果文件、检查点、清单和运行指标的输出目录
+            chunk_size: 分块执行时每块的关键词数，指定时（或指定memory_budget_mb时）待分类文件按块流式读取，
+                每块在内存中一次遍历全部层级，结果溢写到输出目录的临时目录，最后合并为与一次处理相同的结果文件；
+                只支持workbooks结果形式，不写检查点
+            memory_budget_mb: 分块执行的内存预算（MB），每块完成后按进程内存（RSS）调整下一块的大小：
+                超过预算时减半，低于预算的一半时加倍（不超过chunk_size，未指定时为100000）；
+                预算是软上限，合并时的内存峰值取决于最大的结果文件
+            keep_unmatched: 是否保留没有匹配任何规则的分支的未匹配关键词，分片运行时使用：一个分片中某个分支没有匹配
+                不代表全部关键词都没有匹配，由kw-cf-merge合并后再删除始终没有匹配的分支的未匹配关键词；
+                单独使用时结果文件中会多出这些分支的未匹配关键词sheet
         """
         self.excel_handler:ExcelHandler = excel_handler or ExcelHandler(error_callback)
-        self.classifier:KeywordClassifier = keyword_classifier or KeywordClassifier(error_callback)
+        self.classifier:KeywordClassifier = keyword_classifier or KeywordClassifier(error_callback=error_callback)
         self.error_callback:Optional[Callable] = error_callback
+        self.write_workers:int = write_workers
+        if branch_workers < 1:
+            raise ValueError(f"branch_workers必须大于0，当前值: {branch_workers}")
+        self.branch_workers:int = branch_workers
+        if schedule not in SCHEDULES:
+            raise ValueError(f"不支持的调度方式: {schedule}")
+        self.schedule:str = schedule
+        self.graph_report:Optional[dict] = None
+        self.resume:bool = resume
+        self.incremental:bool = incremental
+        # 本次运行的检查点：输入指纹、已完成的层级及各层级的分支
+        self._checkpoint:Optional[dict] = None
+        # 运行指标：每次工作流结束时保存到输出目录的运行指标_<时间>.json，内容同时保存在self.metrics_report
+        self.trace_memory:bool = trace_memory
+        self.metrics:Optional[WorkflowMetrics] = None
+        self.metrics_report:Optional[dict] = None
+        # 分类计数：输入关键词数、匹配的关键词数、编译的规则数、规则计算次数
+        self._classification_counters:Dict[str,int] = new_counters()
+        # 已编译的规则集：(规则文本元组, 是否区分大小写) -> (清洗后的规则, 解析后的匹配函数)
+        self._compiled_rules:Dict[tuple,tuple[list,list]] = {}
+        # 分块执行、增量运行的各部分关键词同样保留未匹配关键词，合并时再按全部结果删除始终没有匹配的分支的未匹配关键词
+        self.keep_unmatched:bool = keep_unmatched
+        # 阶段之间的读写都经过stage_store，未指定时直接使用Excel文件
+        self.stage_store:StageStore|ExcelHandler = stage_store or self.excel_handler
+        self.export_stage_store:bool = export_stage_store
+        self.stage_output_files:List[Path] = []
+        self.exported_files:List[Path] = []
+        if result_layout not in ('workbooks','long'):
+            raise ValueError(f"不支持的结果形式: {result_layout}")
+        self.result_layout:str = result_layout
+        self.result_table:Optional[ResultTableCollector] = None
+        self.result_sink:Optional[SQLiteResultSink] = result_sink
+        self.run_id:Optional[int] = None
+        # 本次工作流写入的文件、sheet、行数清单
+        self.manifest:StageManifest = StageManifest()
         self.workflow_rules:Optional[models.WorkFlowRules] = None
         self.process_result_file:Optional[Dict[str,pd.DataFrame]] = None
         self.process_result_classified_file:Optional[Dict[str,Dict[str,List[str]|str]]] = None
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError(f"chunk_size必须大于0，当前值: {chunk_size}")
+        if memory_budget_mb is not None and memory_budget_mb <= 0:
+            raise ValueError(f"memory_budget_mb必须大于0，当前值: {memory_budget_mb}")
+        if (chunk_size is not None or memory_budget_mb is not None) and (result_layout != 'workbooks' or result_sink is not None):
+            raise ValueError("分块执行只支持workbooks结果形式，不支持长表模式和结果数据库")
+        self.chunk_size:Optional[int] = chunk_size
+        self.memory_budget_mb:Optional[int] = memory_budget_mb
+
+        self.set_output_dir(output_dir)
 
-        self.output_dir = Path('./工作流结果')
+    def set_output_dir(self, output_dir: Path | str):
+        """设置输出目录，检查点随输出目录变化；同一处理器可以依次处理多个待分类文件并输出到不同目录"""
+        self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_path = self.output_dir / '工作流检查点.json'
     
     
+    def __getstate__(self):
+        # 分支在子进程中执行时不传递回调函数、仅存在于内存中的阶段存储和收集的结果
+        state = self.__dict__.copy()
+        state['error_callback'] = None
+        state['result_table'] = None
+        # 编译后的匹配函数不能序列化，子进程中重新编译
+        state['_compiled_rules'] = {}
+        state['metrics'] = None
+        if getattr(self.stage_store, 'in_process', False):
+            state['stage_store'] = None
+        return state
+
     def _transfrom_unmathced_keywords(self,unmatched_keywords:List[models.UnMatchedKeyword])->pd.DataFrame:
         result = []
         for unmatched_keyword in unmatched_keywords:
@@ -115,6 +271,8 @@ class WorkFlowProcessor:
                             models.UnMatchedKeyword( **temp_dict))
             if classified_keywords:
                 return models.ClassifiedResult(classified_keywords=classified_keywords,unclassified_keywords=unclassified_keywords)
+            if self.keep_unmatched and unclassified_keywords:
+                return models.ClassifiedResult.model_construct(classified_keywords=[],unclassified_keywords=unclassified_keywords)
         except Exception as e:
             msg = f"分类结果转换出错: {e},\nmapping_dict: {mapping_dict},\nclassified_keywords:{classified_keywords},\nunclassified_keywords:{unclassified_keywords}"
             raise Exception(msg)
@@ -129,6 +287,65 @@ class WorkFlowProcessor:
             }
         return mapping_dict
 
+    def _set_classifier_rules(self,rules:List[str],error_callback=None):
+        """设置分类器规则，同一组规则只校验和编译一次，工作流规则不变时多次运行共用"""
+        key = (tuple(rules), self.classifier.case_sensitive)
+        compiled = self._compiled_rules.get(key)
+        if compiled is None:
+            self.classifier.set_rules(models.SourceRules(data=rules,error_callback=error_callback))
+            self._compiled_rules[key] = (self.classifier.rules, self.classifier.parsed_rules)
+            self._classification_counters['rules_compiled'] += len(self.classifier.parsed_rules)
+        else:
+            self.classifier.rules, self.classifier.parsed_rules = compiled
+
+    def _count_classification(self, classify_result:list):
+        """累计分类计数，规则按顺序计算到第一个匹配为止，未匹配的关键词计算了全部规则"""
+        positions = {}
+        for i, (rule_text, _) in enumerate(self.classifier.parsed_rules):
+            positions.setdefault(rule_text, i + 1)
+        rule_count = len(self.classifier.parsed_rules)
+        counters = self._classification_counters
+        counters['rows_in'] += len(classify_result)
+        for word in classify_result:
+            if word.matched_rule:
+                counters['rows_out'] += 1
+                counters['evaluations'] += positions.get(word.matched_rule, rule_count)
+            else:
+                counters['evaluations'] += rule_count
+
+    def metrics_snapshot(self) -> Dict[str,int]:
+        """当前进程累计的分类计数和文件读写计数"""
+        return {**self._classification_counters, **self.excel_handler.io_counters}
+
+    def _measure(self, method:str, *args):
+        """在独立的计数中执行处理器方法，返回(方法返回值, 指标)
+
+        分支在工作进程中执行时同样通过本方法统计，指标随返回值带回主进程后计入所属阶段。
+        """
+        counters, io_counters = self._classification_counters, self.excel_handler.io_counters
+        self._classification_counters, self.excel_handler.io_counters = new_counters(), new_counters(IO_COUNTERS)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            if self.metrics is not None:
+                self.metrics.keep_traced_peak()
+            tracemalloc.reset_peak()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            value = getattr(self, method)(*args)
+            branch_metrics = {
+                'wall_seconds': round(time.perf_counter() - start, 6),
+                'cpu_seconds': round(time.process_time() - cpu_start, 6),
+                'pid': os.getpid(),
+                **self._classification_counters,
+                **self.excel_handler.io_counters,
+                'peak_rss_bytes': peak_rss_bytes(),
+            }
+            if tracing:
+                branch_metrics['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            self._classification_counters, self.excel_handler.io_counters = counters, io_counters
+        return value, branch_metrics
+
     def _get_classified_results(self,unclassified_keywords:models.UnclassifiedKeywords,workflow_rules:models.WorkFlowRules,level:int,
                             error_callback=None)->Optional[models.ClassifiedResult]:
         """关键词分类
@@ -148,10 +365,11 @@ class WorkFlowProcessor:
         rules = workflow_rules.to_rules_list()
         
         # 设置分类规则
-        self.classifier.set_rules(models.SourceRules(data=rules,error_callback=error_callback))
+        self._set_classifier_rules(rules,error_callback)
         
         # 分类关键词
         classify_result = self.classifier.classify_keywords(unclassified_keywords)
+        self._count_classification(classify_result)
         
         # 转换分类结果
         classified_reuslt =  self._trans_words_to_cassified_result(classify_result,mapping_dict)
@@ -247,7 +465,8 @@ class WorkFlowProcessor:
                 for rule in special_classified_sheet_name_rules.rules:
                     for classified_sheet_name in classified_sheet_name_dict[rule.output_name]:
                         temp_list.append(rule.model_copy(update={'classified_sheet_name':classified_sheet_name}))
-                special_classified_sheet_name_rules = models.WorkFlowRules(rules=temp_list)
+                # 上一层级没有任何分类sheet时，"全"不对应任何规则
+                special_classified_sheet_name_rules = models.WorkFlowRules(rules=temp_list) if temp_list else None
             return special_classified_sheet_name_rules
         except Exception as e:
             msg = f'将"全"翻译为全部匹配元素时出错，str({e})'
@@ -261,7 +480,8 @@ class WorkFlowProcessor:
             for key,value in stage_results.items():
                 output_name_list.append(key)
                 classified_sheet_name_list:List = value.get('classified_sheet_name')
-                if len(classified_sheet_name_list) > 1:
+                # 各层级都会调用，Sheet1只在第一次时移除
+                if len(classified_sheet_name_list) > 1 and 'Sheet1' in classified_sheet_name_list:
                     classified_sheet_name_list.remove('Sheet1')
                 if classified_sheet_name_dict.get(key) is None:
                     classified_sheet_name_dict[key] = classified_sheet_name_list
@@ -311,19 +531,18 @@ class WorkFlowProcessor:
         """
         try:
             # 读取原 Excel 文件
-            df = pd.read_excel(excel_path, sheet_name=sheet_name)
+            df = self.excel_handler.read_table(excel_path, sheet_name=sheet_name)
             
 
             # 新增列，默认值为空（未匹配到的行留空）
             df[new_column_name] = df["关键词"].map(keyword_to_rule)
             
             # 保存回原文件
-            with pd.ExcelWriter(excel_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                df.to_excel(writer, sheet_name=sheet_name, index=False)   
+            self.excel_handler.append_sheets(excel_path, {sheet_name: df})
             return True
         except Exception as e:
             err_msg = f'add_matched_rule_with_pandas 保存文件失败{e}'
-            raise err_msg
+            raise Exception(err_msg)
             
             
     def get_level_rules(self,workflow_rules:models.WorkFlowRules,stage_results:Dict,
@@ -378,13 +597,17 @@ class WorkFlowProcessor:
             unmatched_keywords = classified_result.get_grouped_keywords(group_by='output_name',match_type='unmatch')
             matched_keywords = classified_result.get_grouped_keywords(group_by='output_name',match_type='match')
             
+            # 各输出工作簿相互独立，交给写入池并行写入
+            pool = WorkbookWriterPool(self.stage_store, self.write_workers)
             try:
                 # 保存分类失败的关键词
                 if unmatched_keywords:
                     for output_name, unclassify_keyword_list in unmatched_keywords.items():
-                        output_file = self.output_dir / f'{output_name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.xlsx'
+                        output_file = self.excel_handler.get_output_path(self.output_dir, f'{output_name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}')
                         df = self._transform_to_df(unclassify_keyword_list)
-                        self.excel_handler.save_results(df, output_file,sheet_name='Sheet1')
+                        pool.submit(output_file, 'save_results', df, output_file, 'Sheet1')
+                        self.manifest.record_sheets(output_file, {'Sheet1': df}, output_name, replace=True)
+                        self.stage_output_files.append(output_file)
             except Exception as e:
                 err_msg = f'保存分类失败的关键词失败：{e}'
                 if error_callback:
@@ -394,10 +617,14 @@ class WorkFlowProcessor:
             try:
                 if matched_keywords:
                     for output_name, matched_keyword_list in matched_keywords.items():
-                        output_file = self.output_dir / f'{output_name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.xlsx'
+                        output_file = self.excel_handler.get_output_path(self.output_dir, f'{output_name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}')
                         df = self._transform_to_df(matched_keyword_list)
-                        self.excel_handler.save_results(df, output_file,sheet_name='Sheet1')
+                        pool.submit(output_file, 'save_results', df, output_file, 'Sheet1')
+                        self.manifest.record_sheets(output_file, {'Sheet1': df}, output_name, replace=True)
+                        self.stage_output_files.append(output_file)
                         success_file_paths[output_name] = output_file
+                pool.run()
+                if matched_keywords:
                     return success_file_paths
             except Exception as e:
                 err_msg = f'保存分类成功的关键词失败：{e}'
@@ -411,6 +638,54 @@ class WorkFlowProcessor:
             raise Exception(f"获取分类结果失败：{e}")
     
 
+    @staticmethod
+    def _stage_columns(level:int) -> List[str]:
+        """分类第level层级时需要从上一阶段结果中读取的列：关键词，三级以上还需要上一层级的规则列"""
+        return ['关键词'] if level <= 3 else ['关键词', '阶段'+str(level-1)]
+
+    def _branch_input(self, file_path:Path, level:int) -> Dict[str,pd.DataFrame]|Path:
+        """分支的输入：并行时内存中的阶段结果无法在子进程中读取，先在当前进程读取；否则由分支自行读取"""
+        if self.branch_workers > 1 and getattr(self.stage_store, 'in_process', False):
+            return self.stage_store.read_stage_results(file_path, self._stage_columns(level))
+        return file_path
+
+    def _load_branch_input(self, branch_input:Dict[str,pd.DataFrame]|Path, level:int) -> Dict[str,pd.DataFrame]:
+        if isinstance(branch_input, dict):
+            return branch_input
+        return self.stage_store.read_stage_results(branch_input, self._stage_columns(level))
+
+    def _branch_error_callback(self, error_callback:Optional[Callable]) -> Optional[Callable]:
+        """回调函数（如界面日志）不能传入子进程，并行时分支的提示信息由返回值带回"""
+        return error_callback if self.branch_workers == 1 else None
+
+    def _run_branches(self, method:str, branches:Dict[str,tuple], file_paths:Dict[str,Path], error_callback=None) -> Dict:
+        """调度各分支并按分支顺序合并结果和提示信息
+
+        Args:
+            method: 分支方法名
+            branches: 结果文件名称到分支方法参数的映射
+            file_paths: 结果文件名称到文件路径的映射，用于按行数估计分支大小
+            error_callback: 错误回调函数
+
+        Returns:
+            合并后的分类结果
+        """
+        sizes = {
+            output_name: self.manifest.row_count(file_paths[output_name]) if file_paths[output_name] in self.manifest else 0
+            for output_name in branches
+        }
+        branch_results = BranchScheduler(self, self.branch_workers).run(
+            '_measure', {output_name: (method, *args) for output_name, args in branches.items()}, sizes)
+        results = {}
+        for output_name, ((branch_result, messages), branch_metrics) in branch_results.items():
+            if self.metrics is not None:
+                self.metrics.add_branch(output_name, branch_metrics)
+            results.update(branch_result)
+            for msg in messages:
+                if error_callback:
+                    error_callback(msg)
+        return results
+
     def process_stage2(self, stage1_files: Dict[str, Path], workflow_rules: models.WorkFlowRules, 
                       error_callback=None) -> Dict[str, models.ClassifiedResult]:
         """处理阶段2：分层处理（Sheet2处理）
@@ -433,29 +708,38 @@ class WorkFlowProcessor:
         try:
             # 获取分类流程2的规则
             sheet2_rules = workflow_rules.filter_rules(source_sheet_name='Sheet2')
-            stage2_results = {}
             
-            # 处理每个阶段1文件
-            for output_name, file_path in stage1_files.items():
-                # 读取阶段1文件
-                stage1_df = self.excel_handler.read_stage_results(file_path)
-                
-                #获取需要分类的关键词
-                unclassified_keyword = self._process_stage_df(stage1_df,2,error_callback=error_callback)
-                
-                # 获取分类规则
-                output_name_rules = sheet2_rules.filter_rules(output_name=output_name)
-                
-                if output_name_rules:
-                    classified_result = self._get_classified_results(unclassified_keyword,output_name_rules,2,error_callback=error_callback)
-                    stage2_results[output_name] = classified_result
-                else:
-                    msg = f'找不到{output_name}的Sheet2规则，已经返回'
-                    if error_callback:
-                        error_callback(msg)
-            return stage2_results
+            # 每个阶段1文件是一个独立分支
+            branches = {
+                output_name: (output_name, self._branch_input(file_path, 2), sheet2_rules, self._branch_error_callback(error_callback))
+                for output_name, file_path in stage1_files.items()
+            }
+            return self._run_branches('_process_stage2_branch', branches, stage1_files, error_callback)
         except Exception as e:
             raise Exception(f"处理阶段2失败: {str(e)}")
+
+    def _process_stage2_branch(self, output_name:str, stage1_df:Dict[str,pd.DataFrame]|Path, sheet2_rules:models.WorkFlowRules,
+                               error_callback=None) -> tuple[Dict[str,models.ClassifiedResult],List[str]]:
+        """处理阶段2的一个分支（一个阶段1文件）
+
+        Returns:
+            ({output_name: 分类结果}, 提示信息列表)，没有对应规则时分类结果为空字典
+        """
+        messages = []
+        # 读取阶段1文件
+        stage1_df = self._load_branch_input(stage1_df, 2)
+        
+        #获取需要分类的关键词
+        unclassified_keyword = self._process_stage_df(stage1_df,2,error_callback=error_callback)
+        
+        # 获取分类规则
+        output_name_rules = sheet2_rules.filter_rules(output_name=output_name)
+        
+        if output_name_rules:
+            classified_result = self._get_classified_results(unclassified_keyword,output_name_rules,2,error_callback=error_callback)
+            return {output_name: classified_result}, messages
+        messages.append(f'找不到{output_name}的Sheet2规则，已经返回')
+        return {}, messages
     
 
     def save_stage2_results(self, stage1_files,classified_result: Dict[str,models.ClassifiedResult], error_callback=None) -> dict[str, Stage2OutputNameDict]:
@@ -470,25 +754,26 @@ class WorkFlowProcessor:
         """
         try:
             stage2_result = {}
+            pool = WorkbookWriterPool(self.stage_store, self.write_workers)
             for key,values in classified_result.items():
                 file_path = stage1_files[key]
-                # 使用Excel写入器追加新Sheet
-                with pd.ExcelWriter(file_path, engine='openpyxl', mode='a') as writer:
-                    stage2_result[key] = {'file_path': file_path, 'classified_sheet_name': []}
-                    if values is None:
-                        logger.warning(f'{key}没有分类结果')
-                        continue
-                    for key, classified_keyword_list in values.group_by_output_name_and_sheet(match_type='match').items():
-                        output_name,classified_sheet_name = key
-                        df = self._transform_to_df(classified_keyword_list)
-                        df.to_excel(writer, sheet_name=classified_sheet_name, index=False)
-                        stage2_result[output_name]['classified_sheet_name'].append(classified_sheet_name)
-                    for key, unclassified_keyword_list in values.group_by_output_name_and_sheet(match_type='unmatch').items():
-                        output_name,classified_sheet_name = key
-                        df = self._transform_to_df(unclassified_keyword_list)
-                        df.to_excel(writer, sheet_name=classified_sheet_name, index=False)
-                        
-                
+                stage2_result[key] = {'file_path': file_path, 'classified_sheet_name': []}
+                if values is None:
+                    logger.warning(f'{key}没有分类结果')
+                    continue
+                # 收集该文件的全部新Sheet，一次性追加写入
+                sheets = {}
+                for key, classified_keyword_list in values.group_by_output_name_and_sheet(match_type='match').items():
+                    output_name,classified_sheet_name = key
+                    sheets[classified_sheet_name] = self._transform_to_df(classified_keyword_list)
+                    stage2_result[output_name]['classified_sheet_name'].append(classified_sheet_name)
+                for key, unclassified_keyword_list in values.group_by_output_name_and_sheet(match_type='unmatch').items():
+                    output_name,classified_sheet_name = key
+                    sheets[classified_sheet_name] = self._transform_to_df(unclassified_keyword_list)
+                pool.submit(file_path, 'append_sheets', file_path, sheets)
+                self.manifest.record_sheets(file_path, sheets)
+            # 各输出工作簿并行写入
+            pool.run()
             return stage2_result
 
         except Exception as e:
@@ -519,44 +804,47 @@ class WorkFlowProcessor:
             # 获取分类流程3的规则
             sheet3_rules = workflow_rules.filter_rules(source_sheet_name='Sheet3')
             sheet3_rules = self.get_level_rules(sheet3_rules,stage2_results,error_callback)
-            stage3_results = {}
             
-            # 处理每个阶段1文件
-            for output_name, values in stage2_results.items():
-                file_path = values['file_path']
-                if values.get('classified_sheet_name') is None:
-                    continue
-                classified_sheet_name_list = values['classified_sheet_name']
-                # 读取阶段2文件
-                stage2_df = self.excel_handler.read_stage_results(file_path)
-                
-                for classified_sheet_name in classified_sheet_name_list:
-                    
-                    #获取需要分类的关键词
-                    unclassified_keyword = self._process_stage_df(stage2_df,3,classified_sheet_name = classified_sheet_name,error_callback=error_callback)
-
-                    # 获取分类规则
-
-                    output_name_rules = sheet3_rules.filter_rules(output_name=output_name,classified_sheet_name=classified_sheet_name)
-
-                    if output_name_rules:
-                        classified_result = self._get_classified_results(unclassified_keyword,output_name_rules,3,error_callback=error_callback)
-                        # if stage3_results == {}:
-                        #     stage3_results[output_name] = {}
-                        # elif stage3_results.get(output_name) is None:
-                        #     stage3_results[output_name] = {}
-                        # else:
-                        #     stage3_results[output_name][classified_sheet_name] = classified_result
-                        if output_name not in stage3_results:
-                            stage3_results[output_name] = {}
-                        stage3_results[output_name][classified_sheet_name] = classified_result
-                    else:
-                        msg = f'找不到{output_name}的Sheet2规则，已经返回'
-                        if error_callback:
-                            error_callback(msg)
-            return stage3_results
+            # 每个阶段2文件是一个独立分支
+            branches = {
+                output_name: (output_name, self._branch_input(values['file_path'], 3), values['classified_sheet_name'],
+                              sheet3_rules, self._branch_error_callback(error_callback))
+                for output_name, values in stage2_results.items()
+                if values.get('classified_sheet_name') is not None
+            }
+            return self._run_branches('_process_stage3_branch', branches,
+                                      {output_name: values['file_path'] for output_name, values in stage2_results.items()},
+                                      error_callback)
         except Exception as e:
             raise Exception(f"处理阶段3失败: {str(e)}")
+
+    def _process_stage3_branch(self, output_name:str, stage2_df:Dict[str,pd.DataFrame]|Path, classified_sheet_name_list:List[str],
+                               sheet3_rules:models.WorkFlowRules, error_callback=None) -> tuple[Dict[str,Dict[str,models.ClassifiedResult]],List[str]]:
+        """处理阶段3的一个分支（一个阶段2文件）
+
+        Returns:
+            ({output_name: {sheet名称: 分类结果}}, 提示信息列表)
+        """
+        stage3_results = {}
+        messages = []
+        # 读取阶段2文件
+        stage2_df = self._load_branch_input(stage2_df, 3)
+        
+        for classified_sheet_name in classified_sheet_name_list:
+            
+            #获取需要分类的关键词
+            unclassified_keyword = self._process_stage_df(stage2_df,3,classified_sheet_name = classified_sheet_name,error_callback=error_callback)
+
+            # 获取分类规则
+
+            output_name_rules = sheet3_rules.filter_rules(output_name=output_name,classified_sheet_name=classified_sheet_name)
+
+            if output_name_rules:
+                classified_result = self._get_classified_results(unclassified_keyword,output_name_rules,3,error_callback=error_callback)
+                stage3_results.setdefault(output_name, {})[classified_sheet_name] = classified_result
+            else:
+                messages.append(f'找不到{output_name}的Sheet2规则，已经返回')
+        return stage3_results, messages
     
       
     def save_stage3_results(self, stage2_file:Dict[str,Stage2OutputNameDict],stage3_results:Dict[str,Dict[str,models.ClassifiedResult]], error_callback=None) -> dict[str, Path]:
@@ -570,6 +858,7 @@ class WorkFlowProcessor:
             保存的文件路径字典
         """
         try:
+            column_buffer = StageColumnBuffer(self.stage_store, self.write_workers, self.manifest)
             for output_name,result_dict in stage3_results.items():
                 if result_dict == {}:
                     continue
@@ -579,16 +868,17 @@ class WorkFlowProcessor:
                 for classified_sheet_name,classified_result in result_dict.items():
                     if classified_result is None:
                         continue
+                    filtered_result = classified_result.filter(classified_conditions={'classified_sheet_name':classified_sheet_name})
+                    if filtered_result is None:
+                        continue
                     # 构建 keyword 到 matched_rule 的映射
                     keyword_to_rule = {
                         kw.keyword: kw.matched_rule 
-                        for kw in classified_result.filter(classified_conditions={'classified_sheet_name':classified_sheet_name}).classified_keywords
+                        for kw in filtered_result.classified_keywords
                     }
-                    self.add_matched_rule_with_pandas(excel_path = file_path,
-                                                      sheet_name = classified_sheet_name,
-                                                      keyword_to_rule = keyword_to_rule,
-                                                      new_column_name = '阶段3'
-                                                      )
+                    column_buffer.add(file_path, classified_sheet_name, '阶段3', keyword_to_rule)
+            # 每个工作簿只写入一次
+            column_buffer.flush()
             return stage2_file
         except  Exception as e:
             err_msg = f'保存阶段三分类结果失败：{e}'
@@ -615,50 +905,80 @@ class WorkFlowProcessor:
             level_rules = self.workflow_rules.filter_rules(level=level)
             logger.debug(f'level_before:{level_rules}')
             level_rules = self.get_level_rules_v1(level_rules,self.process_result_classified_file)
-            parent_rule_name_list = list(set(level_rules.get_parent_rules_name_by_level(level)))
+            # 去重并保持规则文件中的顺序
+            parent_rule_name_list = list(dict.fromkeys(level_rules.get_parent_rules_name_by_level(level)))
             logger.debug(f'level:{level}')
             logger.debug(f'level_rules_after:{level_rules}')
             logger.debug(f'parent_rule_name_list:{parent_rule_name_list}')
-            level_results = {}
             
-            # 处理每个阶段1文件
-            for output_name, values in self.process_result_classified_file.items():
-                file_path = values['file_path']
-                if values.get('classified_sheet_name') is None:
+            # 每个分类结果文件是一个独立分支
+            branches = {
+                output_name: (level, output_name, self._branch_input(values['file_path'], level), values['classified_sheet_name'],
+                              parent_rule_name_list, level_rules)
+                for output_name, values in self.process_result_classified_file.items()
+                if values.get('classified_sheet_name') is not None
+            }
+            return self._run_branches('_process_stage_high_branch', branches,
+                                      {output_name: values['file_path'] for output_name, values in self.process_result_classified_file.items()},
+                                      self.error_callback)
+        except Exception as e:
+            raise Exception(f"处理阶段3失败: {str(e)}")
+
+    def _process_stage_high_branch(self, level:int, output_name:str, pr_level_dict:Dict[str,pd.DataFrame]|Path,
+                                   classified_sheet_name_list:List[str], parent_rule_name_list:List[str],
+                                   level_rules:models.WorkFlowRules) -> tuple[Dict[str,Dict[str,Dict[str,models.ClassifiedResult]]],List[str]]:
+        """处理三阶段以上的一个分支（一个分类结果文件）
+
+        Returns:
+            ({output_name: {sheet名称: {父级规则: 分类结果}}}, 提示信息列表)
+        """
+        level_results = {}
+        messages = []
+        # 读取前一阶段分类文件
+        pr_level_dict = self._load_branch_input(pr_level_dict, level)
+        parent_rule_names = set(parent_rule_name_list)
+
+        # 本分支的规则按(sheet, 父级规则)分组一次
+        child_rules:Dict[tuple,List[models.WorkFlowRule]] = {}
+        for rule in level_rules.rules:
+            if rule.output_name == output_name:
+                child_rules.setdefault((rule.classified_sheet_name, rule.parent_rule), []).append(rule)
+
+        for classified_sheet_name in classified_sheet_name_list:
+            # 按上一层级的分类结果一次分组，只处理有关键词的父级规则
+            partitions = self._partition_by_parent_rule(pr_level_dict, level, classified_sheet_name)
+            for parent_rule_name, keywords in partitions.items():
+                if parent_rule_name not in parent_rule_names:
                     continue
-                classified_sheet_name_list = values['classified_sheet_name']
-                # 读取前一阶段分类文件
-                pr_level_dict = self.excel_handler.read_stage_results(file_path)
-
-                for classified_sheet_name in classified_sheet_name_list:
-                    for parent_rule_name in parent_rule_name_list:
-                        #获取需要分类的关键词
-                        
-                        unclassified_keyword = self._process_stage_df(pr_level_dict,level,classified_sheet_name = classified_sheet_name,parent_rule=parent_rule_name)
-                        logger.debug(f'classified_sheet_name:{classified_sheet_name},parent_rule_name:{parent_rule_name},level:{level}，unclassified_keyword:{unclassified_keyword}')
-                        if unclassified_keyword is None:
-                            continue
+                #获取需要分类的关键词
+                unclassified_keyword = models.UnclassifiedKeywords(data=keywords)
+                logger.debug(f'classified_sheet_name:{classified_sheet_name},parent_rule_name:{parent_rule_name},level:{level}，unclassified_keyword:{unclassified_keyword}')
+
+                # 获取分类规则
+                rules = child_rules.get((classified_sheet_name, parent_rule_name))
+
+                if rules:
+                    classified_result = self._get_classified_results(unclassified_keyword,models.WorkFlowRules(rules=rules),level)
+                    level_results.setdefault(output_name, {}).setdefault(classified_sheet_name, {})[parent_rule_name] = classified_result
+                else:
+                    messages.append(f'找不到{output_name}的Sheet2规则，已经返回')
+        return level_results, messages
 
-                        # 获取分类规则
-
-                        output_name_rules = level_rules.filter_rules(output_name=output_name,classified_sheet_name=classified_sheet_name,parent_rule=parent_rule_name)
-
-                        if output_name_rules:
-                            classified_result = self._get_classified_results(unclassified_keyword,output_name_rules,level)
-                            # if stage3_results == {}:
-                            #     stage3_results[output_name] = {}
-                            # elif stage3_results.get(output_name) is None:
-                            #     stage3_results[output_name] = {}
-                            # else:
-                            #     stage3_results[output_name][classified_sheet_name] = classified_result
-                            level_results.setdefault(output_name, {}).setdefault(classified_sheet_name, {})[parent_rule_name] = classified_result
-                        else:
-                            msg = f'找不到{output_name}的Sheet2规则，已经返回'
-                            if self.error_callback:
-                                self.error_callback(msg)
-            return level_results
+    def _partition_by_parent_rule(self, pipeline_data:Dict[str,pd.DataFrame], level:int, classified_sheet_name:str) -> Dict[str,List[str]]:
+        """将sheet按'阶段N-1'列分组，返回父级规则到关键词列表的映射，关键词保持原顺序"""
+        try:
+            df = pipeline_data[classified_sheet_name]
+            parent_rule_columon_name = '阶段'+str(level-1)
+            if parent_rule_columon_name not in df.columns:
+                logger.error(f'classified_sheet_name:{classified_sheet_name},parent_rule_columon_name:{parent_rule_columon_name}不存在，无法进行匹配，pipeline_data[kwargs["classified_sheet_name"]].columns:{df.columns}')
+                return {}
+            keywords = df['关键词'].astype(str)
+            return {
+                parent_rule: keywords.iloc[positions].tolist()
+                for parent_rule, positions in df.groupby(parent_rule_columon_name, sort=False).indices.items()
+            }
         except Exception as e:
-            raise Exception(f"处理阶段3失败: {str(e)}")
+            raise Exception(f"处理阶段性分词结果到待分类关键词：{e}")
 
 
     def save_stage_high_results(self, level:int,stage_high_result:Dict) -> dict[str, Path]:
@@ -673,6 +993,7 @@ class WorkFlowProcessor:
         """
         try:
             classified_result:Optional[models.ClassifiedResult] = None
+            column_buffer = StageColumnBuffer(self.stage_store, self.write_workers, self.manifest)
             for output_name,result_dict in self.process_result_classified_file.items():
                 if result_dict == {}:
                     continue
@@ -695,11 +1016,9 @@ class WorkFlowProcessor:
                             for kw in filtered_result.classified_keywords
                         }
                         logger.debug(f'\n\nkeyword_to_rule: {keyword_to_rule}\n\n')
-                        self.add_matched_rule_with_pandas(excel_path = file_path,
-                                                        sheet_name = classified_sheet_name,
-                                                        keyword_to_rule = keyword_to_rule,
-                                                        new_column_name = '阶段'+str(level)
-                                                        )
+                        column_buffer.add(file_path, classified_sheet_name, '阶段'+str(level), keyword_to_rule)
+            # 每个工作簿只写入一次，不同父规则的结果合并到同一列
+            column_buffer.flush()
             return True
         except  Exception as e:
             err_msg = f'保存阶段三分类结果失败：{e}'
@@ -707,61 +1026,709 @@ class WorkFlowProcessor:
                 self.error_callback(err_msg)
             raise Exception(err_msg)
 
-    def process_workflow(self, rules_file: Path, classification_file: Path, error_callback=None):
+    def export_stage_results(self, file_paths: Optional[List[Path]] = None) -> List[Path]:
+        """将阶段存储中的结果导出为最终文件
+
+        Args:
+            file_paths: 需要导出的输出文件路径，None表示导出本次工作流生成的全部文件
+
+        Returns:
+            导出的文件路径列表
+        """
+        if self.stage_store is self.excel_handler:
+            return []
+        if file_paths is None:
+            file_paths = [path for path in self.stage_output_files if path not in self.exported_files]
+        exported = self.stage_store.export(self.excel_handler, file_paths, self.write_workers)
+        self.exported_files.extend(exported)
+        return exported
+
+    def export_final_stage_results(self, level:int) -> List[Path]:
+        """导出第level级完成后不再变化的文件：后续层级没有该结果文件名称（或"全"）的规则
+
+        Args:
+            level: 已完成的层级
+
+        Returns:
+            导出的文件路径列表
+        """
+        if self.stage_store is self.excel_handler or not self.export_stage_store or self.result_layout != 'workbooks':
+            return []
+        pending_output_names = {rule.output_name for rule in self.workflow_rules.rules if rule.level > level}
+        # 一级未匹配关键词等不在分类结果文件中的文件，之后的层级不会再处理
+        matched_files = set((self.process_result_file or {}).values())
+        final_files = [
+            path for path in self.stage_output_files
+            if path not in self.exported_files
+            and (path not in matched_files
+                 or ('全' not in pending_output_names and self.manifest.output_name(path) not in pending_output_names))
+        ]
+        if final_files:
+            logger.debug(f'第{level}级完成后导出不再变化的文件: {final_files}')
+            return self.export_stage_results(final_files)
+        return []
+
+    def save_manifest(self) -> Path:
+        """将本次工作流的写入清单保存到输出目录"""
+        manifest_path = self.manifest.save(self.output_dir / f'工作流清单_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json')
+        logger.debug(f'写入清单已保存到: {manifest_path}')
+        return manifest_path
+
+    def _collect_results(self, level:int, stage_results):
+        """长表模式或指定结果数据库时记录一个层级的分类结果，stage_results为对应层级process_stage*的返回值"""
+        if self.result_table is None or not stage_results or isinstance(stage_results, str):
+            return
+        if level == 1:
+            self.result_table.add(stage_results)
+        elif level == 2:
+            for classified_result in stage_results.values():
+                self.result_table.add(classified_result)
+        elif level == 3:
+            for sheet_results in stage_results.values():
+                for classified_sheet_name, classified_result in sheet_results.items():
+                    self.result_table.add(classified_result, classified_sheet_name=classified_sheet_name)
+        else:
+            for sheet_results in stage_results.values():
+                for classified_sheet_name, parent_results in sheet_results.items():
+                    for parent_rule_name, classified_result in parent_results.items():
+                        self.result_table.add(classified_result, classified_sheet_name=classified_sheet_name, parent_rule=parent_rule_name)
+
+    def save_result_table(self) -> Path:
+        """将收集的长表结果一次写入单个文件，格式由excel_handler的output_format决定"""
+        output_file = get_result_table_path(self.output_dir, self.excel_handler.output_format)
+        self.excel_handler.write_sheets(output_file, {'Sheet1': self.result_table.to_dataframe()})
+        logger.info(f'长表结果已保存到: {output_file}，共{len(self.result_table)}行')
+        return output_file
+
+    def _checkpoint_supported(self) -> bool:
+        """长表模式、结果数据库和一次遍历需要在一次运行中完成全部层级，不写检查点"""
+        return self.result_layout == 'workbooks' and self.result_sink is None and self.schedule != 'single_pass'
+
+    def _checkpoint_options(self) -> dict:
+        """影响分类结果和输出位置的参数，变化时检查点失效"""
+        return {
+            'case_sensitive': self.classifier.case_sensitive,
+            'separator': self.classifier.separator,
+            'output_format': self.excel_handler.output_format,
+            'output_dir': str(self.output_dir),
+            'keep_unmatched': self.keep_unmatched,
+        }
+
+    def save_checkpoint(self, level:int, branches:List[str]|Dict|None, stage2_files:Optional[Dict[str,Stage2OutputNameDict]] = None):
+        """记录第level级已完成
+
+        Args:
+            level: 已完成的层级
+            branches: 该层级处理的结果文件名称
+            stage2_files: 阶段2的保存结果，第三级需要其中的sheet名称
+        """
+        if self._checkpoint is None:
+            return
+        self._checkpoint['completed_levels'].append(level)
+        # 没有对应规则的层级返回的是提示信息而不是分支结果
+        self._checkpoint['branches'][level] = list(branches) if branches and not isinstance(branches, str) else []
+        if stage2_files is not None:
+            self._checkpoint['stage2_files'] = {
+                output_name: {'file_path': str(values['file_path']), 'classified_sheet_name': list(values['classified_sheet_name'])}
+                for output_name, values in stage2_files.items()
+            }
+        state = {
+            'stage1_files': {output_name: str(path) for output_name, path in (self.process_result_file or {}).items()},
+            'stage2_files': self._checkpoint['stage2_files'],
+            'stage_output_files': [str(path) for path in self.stage_output_files],
+            'exported_files': [str(path) for path in self.exported_files],
+            'manifest': self.manifest.to_dict(),
+        }
+        WorkflowCheckpoint(self.checkpoint_path).save(self._checkpoint['inputs'], self._checkpoint['completed_levels'],
+                                                      self._checkpoint['branches'], state)
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        """读取可以继续的检查点，输入已变化或记录的输出文件缺失时返回None"""
+        if getattr(self.stage_store, 'in_process', False):
+            logger.warning('内存中的阶段存储无法从检查点继续，将从头开始')
+            return None
+        data = WorkflowCheckpoint(self.checkpoint_path).load(self._checkpoint['inputs'])
+        if data is None or not data.get('completed_levels'):
+            return None
+        if self.stage_store is self.excel_handler:
+            missing = [path for path in data['stage_output_files'] if not Path(path).exists()]
+        else:
+            stored = {str(path) for path in self.stage_store.list_files()}
+            missing = [path for path in data['stage_output_files'] if path not in stored]
+        if missing:
+            logger.warning(f'检查点记录的输出文件不存在，将从头开始: {missing}')
+            return None
+        return data
+
+    def _restore_checkpoint(self, data:dict) -> tuple[int, Dict[str,Path], Dict[str,Stage2OutputNameDict]]:
+        """从检查点恢复已完成层级的状态
+
+        Returns:
+            (已完成的最高层级, 阶段1文件路径字典, 阶段2保存结果)
+        """
+        completed_level = max(data['completed_levels'])
+        self.manifest = StageManifest.from_dict(data['manifest'])
+        self.stage_output_files = [Path(path) for path in data['stage_output_files']]
+        self.exported_files = [Path(path) for path in data['exported_files']]
+        stage1_files = {output_name: Path(path) for output_name, path in data['stage1_files'].items()}
+        stage2_files = {
+            output_name: {'file_path': Path(values['file_path']), 'classified_sheet_name': list(values['classified_sheet_name'])}
+            for output_name, values in (data.get('stage2_files') or {}).items()
+        }
+        self.process_result_file = stage1_files
+        if completed_level >= 3:
+            self.process_result_classified_file = self.manifest.read_stage_classified_sheet_name(stage1_files)
+        self._checkpoint['completed_levels'] = list(data['completed_levels'])
+        self._checkpoint['branches'] = {int(level): names for level, names in data['branches'].items()}
+        self._checkpoint['stage2_files'] = data.get('stage2_files')
+        logger.info(f'从检查点继续，已完成层级: {data["completed_levels"]}')
+        return completed_level, stage1_files, stage2_files
+
+    def process_graph_levels(self, stage1_results:models.ClassifiedResult, stage1_files:Dict[str,Path], stage1_seconds:float,
+                             error_callback=None) -> dict:
+        """按任务图处理二级及以上分类，分类完成后逐层级保存结果
+
+        Args:
+            stage1_results: 一级分类结果
+            stage1_files: 阶段1生成的文件路径字典
+            stage1_seconds: 一级分类耗时
+            error_callback: 错误回调函数
+
+        Returns:
+            最后一个层级的保存结果，格式与逐层级处理一致
+        """
+        graph = WorkflowGraph(self, self.branch_workers)
+        self.metrics.begin('任务图')
+        level_results = graph.run(stage1_results, stage1_seconds)
+        self.graph_report = graph.report()
+        for node in graph.nodes.values():
+            if node.metrics is not None:
+                self.metrics.add_branch(node.name, node.metrics)
+        for msg in graph.messages:
+            if error_callback:
+                error_callback(msg)
+        return self.save_level_results(level_results, stage1_files, error_callback)
+
+    def process_single_pass(self, keywords:models.UnclassifiedKeywords, error_callback=None) -> Dict[int,dict]:
+        """将工作流规则树编译为分层判定结构，每个关键词一次遍历全部层级
+
+        Args:
+            keywords: 待分类关键词
+            error_callback: 错误回调函数
+
+        Returns:
+            层级到分类结果的映射，1为一级分类结果，其余层级的结构与任务图的结果一致
+        """
+        classifier = HierarchicalClassifier(self)
+        level_results = classifier.classify(keywords.data)
+        for msg in classifier.messages:
+            if error_callback:
+                error_callback(msg)
+        return level_results
+
+    def save_level_results(self, level_results:Dict[int,dict], stage1_files:Dict[str,Path], error_callback=None,
+                           record_stages:bool = True) -> dict:
+        """逐层级保存已经完成分类的二级及以上结果（任务图、一次遍历、分块执行）
+
+        Args:
+            level_results: 层级到分类结果的映射
+            stage1_files: 阶段1生成的文件路径字典
+            error_callback: 错误回调函数
+            record_stages: 是否在运行指标中按层级记录阶段，分块执行时各层级计入所属分块
+
+        Returns:
+            最后一个层级的保存结果，格式与逐层级处理一致
+        """
+        max_level = self.workflow_rules.get_max_level()
+        # 分类已经完成，各层级只保存结果
+        if record_stages:
+            self.metrics.begin('阶段2')
+        stage2_results = level_results.get(2, {})
+        self._collect_results(2, stage2_results)
+        stage2_files = self.save_stage2_results(stage1_files, stage2_results, error_callback)
+        result = {'stage':2,'result':stage2_files}
+        self.export_final_stage_results(2)
+        self.save_checkpoint(2, stage2_results, stage2_files)
+        if max_level >= 3:
+            if record_stages:
+                self.metrics.begin('阶段3')
+            self.process_result_classified_file = self.manifest.read_stage_classified_sheet_name(self.process_result_file)
+            stage3_results = level_results.get(3, {})
+            self._collect_results(3, stage3_results)
+            stage3_file = self.save_stage3_results(stage2_file=stage2_files,stage3_results=stage3_results,error_callback=error_callback)
+            result = {'stage':3,'result':stage3_file}
+            self.export_final_stage_results(3)
+            self.save_checkpoint(3, stage3_results)
+        for stage in range(4, max_level + 1):
+            if record_stages:
+                self.metrics.begin(f'阶段{stage}')
+            stage_result = level_results.get(stage, {})
+            self._collect_results(stage, stage_result)
+            result = {'stage':stage,'result':self.save_stage_high_results(stage,stage_result)}
+            self.export_final_stage_results(stage)
+            self.save_checkpoint(stage, stage_result)
+        return result
+
+    def save_metrics_report(self, rules_file: Path, classification_file: Path | models.UnclassifiedKeywords,
+                            error: Optional[str] = None) -> Optional[Path]:
+        """结束本次运行的指标记录，保存为输出目录中的运行指标_<时间>.json
+
+        报告包含工作流规则文件的内容哈希，便于比较不同版本规则的运行指标。
+
+        Args:
+            rules_file: 工作流规则文件路径
+            classification_file: 待分类文件路径，或直接传入的关键词
+            error: 运行失败时的错误信息
+
+        Returns:
+            运行指标文件路径，本次运行未开始记录时返回None
+        """
+        if self.metrics is None:
+            return None
+        report = self.metrics.finish()
+        self.metrics = None
+        rules_file = Path(rules_file)
+        self.metrics_report = {
+            'status': 'failed' if error else 'completed',
+            'error': error,
+            'rules_file': str(rules_file),
+            'rules_hash': file_content_hash(rules_file) if rules_file.exists() else None,
+            'classification_file': None if isinstance(classification_file, models.UnclassifiedKeywords) else str(classification_file),
+            'max_level': self.workflow_rules.get_max_level() if self.workflow_rules is not None else None,
+            'config': {
+                'stage_store': type(self.stage_store).__name__,
+                'schedule': self.schedule,
+                'result_layout': self.result_layout,
+                'output_format': self.excel_handler.output_format,
+                'case_sensitive': self.classifier.case_sensitive,
+                'separator': self.classifier.separator,
+                'branch_workers': self.branch_workers,
+                'write_workers': self.write_workers,
+                'trace_memory': self.trace_memory,
+                'chunk_size': self.chunk_size,
+                'memory_budget_mb': self.memory_budget_mb,
+                'keep_unmatched': self.keep_unmatched,
+            },
+            **report,
+        }
+        report_path = self.output_dir / f'运行指标_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json'
+        return WorkflowMetrics.save(self.metrics_report, report_path)
+
+    def plan_workflow(self, rules_file: Path, classification_file: Path) -> dict:
+        """生成工作流的执行计划，不执行分类
+
+        计划包括各层级、各分支的规则数、关键词数和计算次数上限，以及按当前配置的文件读写次数，
+        同时保存为输出目录中的工作流计划_<时间>.json。
+
+        Args:
+            rules_file: 工作流规则文件路径
+            classification_file: 待分类文件路径
+
+        Returns:
+            执行计划
+        """
+        plan = WorkflowPlanner(self).plan(rules_file, classification_file)
+        plan_path = self.output_dir / f'工作流计划_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json'
+        plan_path.write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f'执行计划已保存到: {plan_path}')
+        return plan
+
+    def process_incremental(self, rules_file: Path, classification_file: Path, error_callback=None):
+        """增量运行：只分类上次运行结果中没有的关键词，并合并到已有的结果文件中
+
+        新关键词在内存中执行全部层级的分类，各结果文件的同名sheet在原有行之后追加新行，
+        新出现的分类sheet排在已有的分类sheet之后、未匹配关键词之前，新出现的结果文件直接写入。完成后更新检查点和写入清单，下一次增量运行以本次结果为基础。
+
+        Args:
+            rules_file: 工作流规则文件路径，内容必须与上次运行一致
+            classification_file: 新的待分类文件路径
+            error_callback: 错误回调函数
+
+        Returns:
+            {'stage': 最大层级, 'result': {结果文件名称: 文件路径}}，只包含有新增内容的文件
+        """
+        try:
+            if not self._checkpoint_supported():
+                raise ValueError("增量运行需要检查点，长表模式、结果数据库和一次遍历不支持增量运行")
+            inputs = WorkflowCheckpoint.fingerprint(rules_file, classification_file, self._checkpoint_options())
+            previous = WorkflowCheckpoint(self.checkpoint_path).load(inputs, compare=('rules_hash', 'options'))
+            if previous is None:
+                raise ValueError(f"{self.checkpoint_path}中没有规则相同的上次运行记录")
+            workflow_rules = self.excel_handler.read_workflow_rules(rules_file)
+            max_level = workflow_rules.get_max_level()
+            if max(previous['completed_levels'], default=0) < max_level:
+                raise ValueError(f"上次运行只完成了层级{previous['completed_levels']}，请先完成或继续上次运行")
+            missing = [path for path in previous['stage_output_files'] if not Path(path).exists()]
+            if missing:
+                raise ValueError(f"上次运行的结果文件不存在: {missing}")
+
+            # 读取上次的结果，Sheet1包含每个结果文件的全部关键词
+            previous_manifest = StageManifest.from_dict(previous['manifest'])
+            previous_files:Dict[str,Path] = {}
+            previous_sheets:Dict[Path,Dict[str,pd.DataFrame]] = {}
+            seen_keywords = set()
+            for path in map(Path, previous['stage_output_files']):
+                previous_files[previous_manifest.output_name(path)] = path
+                previous_sheets[path] = self.excel_handler.read_table(path, sheet_name=None)
+                if 'Sheet1' in previous_sheets[path]:
+                    seen_keywords.update(previous_sheets[path]['Sheet1']['关键词'].astype(str))
+            keywords = self.excel_handler.read_keyword_file(classification_file)
+            new_keywords = [keyword for keyword in keywords.data if keyword not in seen_keywords]
+            logger.info(f'待分类关键词{len(keywords.data)}个，其中新关键词{len(new_keywords)}个')
+            if not new_keywords:
+                return {'stage':max_level,'result':{}}
+
+            # 新关键词的各层级结果保存在内存中，不单独导出
+            # 新关键词与分块执行的一块相同，一次遍历全部层级；没有匹配的分支也保留未匹配关键词，合并后仍没有分类sheet时再删除
+            stage_store, export_stage_store, resume = self.stage_store, self.export_stage_store, self.resume
+            schedule, keep_unmatched = self.schedule, self.keep_unmatched
+            self.stage_store, self.export_stage_store, self.resume, self.incremental = MemoryStageStore(), False, False, False
+            self.schedule, self.keep_unmatched = 'single_pass', True
+            try:
+                self.process_workflow(rules_file, models.UnclassifiedKeywords.model_construct(data=new_keywords), error_callback)
+                new_store, new_manifest, new_output_files = self.stage_store, self.manifest, self.stage_output_files
+                new_stage1_files = self.process_result_file or {}
+            finally:
+                self.stage_store, self.export_stage_store, self.resume, self.incremental = stage_store, export_stage_store, resume, True
+                self.schedule, self.keep_unmatched = schedule, keep_unmatched
+
+            # 按结果文件名称合并到上次的结果文件
+            self.manifest = previous_manifest
+            self.stage_output_files = [Path(path) for path in previous['stage_output_files']]
+            merged_files = {}
+            with WorkbookWriterPool(self.excel_handler, self.write_workers) as pool:
+                for new_path in new_output_files:
+                    output_name = new_manifest.output_name(new_path)
+                    path = previous_files.get(output_name, new_path)
+                    sheets = dict(previous_sheets.get(path, {}))
+                    for sheet_name, df in new_store.read_sheets(new_path).items():
+                        sheets[sheet_name] = pd.concat([sheets[sheet_name], df], ignore_index=True) if sheet_name in sheets else df
+                    # 新出现的分类sheet排在已有的分类sheet之后、未匹配关键词之前，与一次运行的sheet顺序一致
+                    sheet_names = sorted(sheets, key=_sheet_order)
+                    if not self.keep_unmatched:
+                        sheet_names = drop_unmatched_sheet(sheet_names)
+                    sheets = {sheet_name: sheets[sheet_name] for sheet_name in sheet_names}
+                    pool.submit(path, 'write_sheets', path, sheets)
+                    self.manifest.record_sheets(path, sheets, output_name, replace=True)
+                    if path not in self.stage_output_files:
+                        self.stage_output_files.append(path)
+                    merged_files[output_name] = path
+
+            # 以本次结果为基础更新检查点
+            stage1_files = {output_name: Path(path) for output_name, path in previous['stage1_files'].items()}
+            stage1_files.update({name: path for name, path in merged_files.items() if name in new_stage1_files})
+            stage2_files = previous.get('stage2_files')
+            if stage2_files is not None:
+                for output_name, path in stage1_files.items():
+                    stage2_files[output_name] = {
+                        'file_path': str(path),
+                        'classified_sheet_name': [name for name in self.manifest.sheet_names(path) if name not in ('Sheet1', '未匹配关键词')],
+                    }
+            WorkflowCheckpoint(self.checkpoint_path).save(inputs, previous['completed_levels'], {
+                int(level): names for level, names in previous['branches'].items()
+            }, {
+                'stage1_files': {output_name: str(path) for output_name, path in stage1_files.items()},
+                'stage2_files': stage2_files,
+                'stage_output_files': [str(path) for path in self.stage_output_files],
+                'exported_files': [str(path) for path in self.stage_output_files],
+                'manifest': self.manifest.to_dict(),
+            })
+            self.process_result_file = stage1_files
+            self.save_manifest()
+            logger.info(f'增量结果已合并到: {list(merged_files.values())}')
+            return {'stage':max_level,'result':merged_files}
+        except Exception as e:
+            err_msg = f'增量处理工作流失败：{e}'
+            if error_callback:
+                error_callback(err_msg)
+            raise Exception(err_msg)
+
+    def _chunked(self, classification_file: Path | models.UnclassifiedKeywords) -> bool:
+        """是否分块执行：指定了chunk_size或memory_budget_mb且输入为待分类文件（直接传入的关键词已经在内存中）"""
+        return ((self.chunk_size is not None or self.memory_budget_mb is not None)
+                and not isinstance(classification_file, models.UnclassifiedKeywords))
+
+    def _iter_keyword_chunks(self, classification_file: Path, sizes: Dict[str,int]):
+        """按sizes['target']的大小流式返回待分类关键词块，目标大小可以在两块之间调整"""
+        buffer:List[str] = []
+        read_size = min(sizes['target'], _CHUNK_READ_SIZE)
+        for keywords in self.excel_handler.iter_keyword_file(Path(classification_file), read_size):
+            buffer.extend(keywords.data)
+            while len(buffer) >= sizes['target']:
+                chunk, buffer = buffer[:sizes['target']], buffer[sizes['target']:]
+                yield models.UnclassifiedKeywords.model_construct(data=chunk)
+        if buffer:
+            yield models.UnclassifiedKeywords.model_construct(data=buffer)
+
+    def _adjust_chunk_size(self, sizes: Dict[str,int]):
+        """按内存预算调整下一块的大小：进程内存超过预算时减半，低于预算的一半时加倍"""
+        if self.memory_budget_mb is None:
+            return
+        gc.collect()
+        rss = current_rss_bytes()
+        if rss is None:
+            return
+        budget = self.memory_budget_mb * 1024 * 1024
+        if rss > budget:
+            if sizes['target'] > _MIN_CHUNK_SIZE:
+                sizes['target'] = max(sizes['target'] // 2, _MIN_CHUNK_SIZE)
+                logger.info(f'进程内存{rss / 1024 / 1024:.1f}MB超过预算{self.memory_budget_mb}MB，分块大小调整为{sizes["target"]}')
+            else:
+                logger.warning(f'进程内存{rss / 1024 / 1024:.1f}MB超过预算{self.memory_budget_mb}MB，分块大小已经是最小值{_MIN_CHUNK_SIZE}')
+        elif rss < budget / 2 and sizes['target'] < sizes['max']:
+            sizes['target'] = min(sizes['target'] * 2, sizes['max'])
+            logger.debug(f'进程内存{rss / 1024 / 1024:.1f}MB低于预算的一半，分块大小调整为{sizes["target"]}')
+
+    def _classify_chunk(self, keywords: models.UnclassifiedKeywords, classifier: HierarchicalClassifier,
+                        spill: ChunkSpill, sent_messages: set, error_callback=None):
+        """在内存中完成一块关键词的全部层级，并将各结果文件溢写到spill"""
+        self.stage_store = MemoryStageStore()
+        self.manifest = StageManifest()
+        self.stage_output_files = []
+        self.exported_files = []
+        level_results = classifier.classify(keywords.data)
+        for msg in classifier.messages:
+            # 各块的提示相同，只提示一次
+            if msg not in sent_messages:
+                sent_messages.add(msg)
+                if error_callback:
+                    error_callback(msg)
+        stage1_files = self.save_stage1_results(level_results.get(1))
+        self.process_result_file = stage1_files
+        if stage1_files and self.workflow_rules.get_max_level() >= 2:
+            self.save_level_results(level_results, stage1_files, error_callback, record_stages=False)
+        matched_files = set((stage1_files or {}).values())
+        for path in self.stage_output_files:
+            spill.add(self.manifest.output_name(path), self.stage_store.read_sheets(path), path in matched_files)
+
+    def process_chunked(self, rules_file: Path, classification_file: Path, error_callback=None):
+        """分块执行：待分类文件按块流式读取，每块在内存中完成全部层级后溢写到磁盘，最后合并为结果文件
+
+        每块使用一次遍历的分层判定结构分类，结果与一次处理全部关键词完全一致；内存中只保留当前块的结果，
+        合并时逐个结果文件读取溢写文件，按一次处理时的sheet顺序和行顺序拼接后写出。
+        一块中没有匹配的二级分支同样保留未匹配关键词，合并后仍没有任何分类sheet的结果文件才删除未匹配关键词sheet。
+        溢写文件保存在输出目录的临时目录中，结束后删除。分块执行不写检查点。
+
+        Args:
+            rules_file: 工作流规则文件路径
+            classification_file: 待分类文件路径
+            error_callback: 错误回调函数
+
+        Returns:
+            {'stage': 最大层级, 'result': {结果文件名称: 文件路径}}
+        """
+        stage_store, export_stage_store, keep_unmatched = self.stage_store, self.export_stage_store, self.keep_unmatched
+        spill = None
+        try:
+            self.graph_report = None
+            self._checkpoint = None
+            self.result_table = None
+            self._classification_counters = new_counters()
+            self.metrics = WorkflowMetrics(self.metrics_snapshot, self.trace_memory)
+            self.metrics.start()
+            self.metrics.begin('读取输入')
+            workflow_rules = self.excel_handler.read_workflow_rules(rules_file)
+            if workflow_rules != self.workflow_rules:
+                self._compiled_rules = {}
+            self.workflow_rules = workflow_rules
+            max_level = workflow_rules.get_max_level()
+            classifier = HierarchicalClassifier(self)
+            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+            spill = ChunkSpill(self.output_dir / f'.分块缓存_{timestamp}')
+            max_size = self.chunk_size or _DEFAULT_CHUNK_SIZE
+            sizes = {'target': max_size, 'max': max_size}
+            sent_messages = set()
+            # 各块的结果只写入内存中的阶段存储，不单独导出；没有匹配的分支也保留未匹配关键词，合并时再删除
+            self.export_stage_store, self.keep_unmatched = False, True
+            chunk_count = keyword_count = 0
+            for keywords in self._iter_keyword_chunks(classification_file, sizes):
+                chunk_count += 1
+                keyword_count += len(keywords.data)
+                self.metrics.begin(f'分块{chunk_count}')
+                logger.info(f'处理第{chunk_count}块: {len(keywords.data)}个关键词')
+                self._classify_chunk(keywords, classifier, spill, sent_messages, error_callback)
+                self.stage_store = stage_store
+                self._adjust_chunk_size(sizes)
+            self.stage_store, self.export_stage_store, self.keep_unmatched = stage_store, export_stage_store, keep_unmatched
+            if not spill.has_matched() and not keep_unmatched:
+                # 与一次处理相同：没有关键词匹配一级分类规则时不生成结果文件
+                raise ValueError('没有关键词匹配一级分类规则')
+
+            # 逐个结果文件合并各块的结果
+            self.metrics.begin('合并')
+            self.manifest = StageManifest()
+            self.stage_output_files = []
+            self.exported_files = []
+            self.process_result_file = {}
+            merged_files = {}
+            for output_name, sheets, matched in spill.iter_outputs(drop_unmatched=not keep_unmatched):
+                output_file = self.excel_handler.get_output_path(self.output_dir, f'{output_name}_{timestamp}')
+                self.excel_handler.write_sheets(output_file, sheets)
+                self.manifest.record_sheets(output_file, sheets, output_name, replace=True)
+                self.stage_output_files.append(output_file)
+                self.exported_files.append(output_file)
+                if matched:
+                    self.process_result_file[output_name] = output_file
+                merged_files[output_name] = output_file
+            logger.info(f'分块执行完成: {keyword_count}个关键词，{chunk_count}块，溢写{spill.bytes_written}字节')
+            self.save_manifest()
+            self.save_metrics_report(rules_file, classification_file)
+            return {'stage':max_level,'result':merged_files}
+        except Exception as e:
+            err_msg = f'分块处理工作流失败：{e}'
+            if error_callback:
+                error_callback(err_msg)
+            try:
+                self.save_metrics_report(rules_file, classification_file, error=str(e))
+            except Exception as report_error:
+                logger.warning(f'保存运行指标失败: {report_error}')
+            raise Exception(err_msg)
+        finally:
+            self.stage_store, self.export_stage_store, self.keep_unmatched = stage_store, export_stage_store, keep_unmatched
+            if spill is not None:
+                spill.clear()
+
+    def process_workflow(self, rules_file: Path, classification_file: Path | models.UnclassifiedKeywords, error_callback=None):
         """处理完整工作流
         
         Args:
             rules_file: 工作流规则文件路径
-            classification_file: 待分类文件路径
+            classification_file: 待分类文件路径，也可以直接传入已读取的关键词
             error_callback: 错误回调函数
             
         Returns:
-            生成的文件路径字典
+            生成的文件路径字典，长表模式下result为长表文件路径
         """
+        if self.incremental:
+            return self.process_incremental(rules_file, classification_file, error_callback)
+        if self._chunked(classification_file):
+            return self.process_chunked(rules_file, classification_file, error_callback)
+        temporary_store = False
         try:
             result = {}
             stage = 1
+            self.stage_output_files = []
+            self.exported_files = []
+            self.manifest = StageManifest()
+            self.graph_report = None
+            self._checkpoint = None
+            self._classification_counters = new_counters()
+            self.metrics = WorkflowMetrics(self.metrics_snapshot, self.trace_memory)
+            self.metrics.start()
+            self.metrics.begin('读取输入')
+            self.result_table = ResultTableCollector() if self.result_layout == 'long' or self.result_sink is not None else None
+            if (self.result_layout == 'long' or self.schedule == 'single_pass') and self.stage_store is self.excel_handler:
+                # 长表模式不生成分文件结果，一次遍历在结束时一次写出，阶段中间结果保存在内存中
+                temporary_store = True
+                self.stage_store = MemoryStageStore()
+            checkpoint = None
+            # 直接传入关键词时（增量运行）没有可以计算哈希的输入文件，不写检查点
+            if self._checkpoint_supported() and not isinstance(classification_file, models.UnclassifiedKeywords):
+                self._checkpoint = {
+                    'inputs': WorkflowCheckpoint.fingerprint(rules_file, classification_file, self._checkpoint_options()),
+                    'completed_levels': [], 'branches': {}, 'stage2_files': None,
+                }
+                if self.resume:
+                    checkpoint = self._load_checkpoint()
             # 读取工作流规则
             workflow_rules = self.excel_handler.read_workflow_rules(rules_file)
+            if workflow_rules != self.workflow_rules:
+                # 规则不变时（如批量处理多个待分类文件）沿用上次运行编译的规则集
+                self._compiled_rules = {}
             self.workflow_rules = workflow_rules
             logger.debug(f'self.workflow_rules: {self.workflow_rules}')    
-            # 读取待分类文件
-            keywords_df = self.excel_handler.read_keyword_file(classification_file)
-            # 处理阶段1：基础分类,将词分类到各xlsx文件中
-            stage1_results = self.process_stage1(keywords_df, workflow_rules, error_callback)
-            
-            # 保存阶段1结果
-            stage1_files = self.save_stage1_results(stage1_results)
-            self.process_result_file = stage1_files
-            result = {'stage':1,'result':stage1_files}
-            stage += 1
             max_level = workflow_rules.get_max_level()
             logger.debug(f'max_level: {max_level}')
-            if stage <= max_level:
+            if checkpoint is not None:
+                # 跳过已完成的层级，剩余层级逐层级处理
+                self.metrics.begin('恢复检查点')
+                completed_level, stage1_files, stage2_files = self._restore_checkpoint(checkpoint)
+                result = {'stage':completed_level,'result':stage1_files if completed_level == 1 else stage2_files if completed_level <= 3 else True}
+                stage = completed_level + 1
+            else:
+                # 读取待分类文件
+                if isinstance(classification_file, models.UnclassifiedKeywords):
+                    keywords_df = classification_file
+                else:
+                    keywords_df = self.excel_handler.read_keyword_file(classification_file)
+                # 处理阶段1：基础分类,将词分类到各xlsx文件中
+                self.metrics.begin('一次遍历' if self.schedule == 'single_pass' else '阶段1')
+                stage1_start = time.perf_counter()
+                if self.schedule == 'single_pass':
+                    level_results = self.process_single_pass(keywords_df, error_callback)
+                    stage1_results = level_results.get(1)
+                else:
+                    stage1_results = self.process_stage1(keywords_df, workflow_rules, error_callback)
+                stage1_seconds = time.perf_counter() - stage1_start
+                self._collect_results(1, stage1_results)
+                
+                # 保存阶段1结果
+                stage1_files = self.save_stage1_results(stage1_results)
+                self.process_result_file = stage1_files
+                result = {'stage':1,'result':stage1_files}
+                self.export_final_stage_results(1)
+                self.save_checkpoint(1, stage1_files)
+                stage += 1
+                if not stage1_files:
+                    # 只在保留未匹配关键词时出现：没有关键词匹配一级分类规则，没有后续层级可以处理
+                    stage = max_level + 1
+            if self.schedule == 'graph' and checkpoint is None and stage <= max_level:
+                # 各层级分类按任务图一次完成，之后不再进入逐层级处理
+                result = self.process_graph_levels(stage1_results, stage1_files, stage1_seconds, error_callback)
+                stage = max_level + 1
+            if self.schedule == 'single_pass' and stage <= max_level:
+                result = self.save_level_results(level_results, stage1_files, error_callback)
+                stage = max_level + 1
+            if stage == 2 and stage <= max_level:
                 # 处理阶段2：将分类细分到各sheet
+                self.metrics.begin('阶段2')
                 stage2_results = self.process_stage2(stage1_files, workflow_rules, error_callback)
+                self._collect_results(2, stage2_results)
                 # 保存阶段2结果
                 stage2_files = self.save_stage2_results(stage1_files, stage2_results, error_callback)
                 result = {'stage':2,'result':stage2_files}
+                self.export_final_stage_results(2)
+                self.save_checkpoint(2, stage2_results, stage2_files)
                 stage += 1
                 logger.debug(f'当前工作流层级: {stage},max_level: {max_level}')
-            if stage <= max_level:
-                self.process_result_classified_file = self.excel_handler.read_stage_classified_sheet_name(self.process_result_file)
+            if stage == 3 and stage <= max_level:
+                self.metrics.begin('阶段3')
+                # sheet名称从写入清单获取，不再重新打开各工作簿
+                self.process_result_classified_file = self.manifest.read_stage_classified_sheet_name(self.process_result_file)
                 logger.debug(f'self.process_result_classified_file:{self.process_result_classified_file}')
                 # 处理阶段3：分类后处理（Sheet3处理）
                 stage3_results = self.process_stage3(stage2_files, workflow_rules, error_callback)
+                self._collect_results(3, stage3_results)
                 
                 stage3_file = self.save_stage3_results(stage2_file=stage2_files,stage3_results=stage3_results,error_callback=error_callback)
                 result = {'stage':3,'result':stage3_file}
+                self.export_final_stage_results(3)
+                self.save_checkpoint(3, stage3_results)
                 stage += 1
                 logger.debug(f'当前工作流层级: {stage},max_level: {max_level}')
             while stage <= max_level:
+                self.metrics.begin(f'阶段{stage}')
                 stage_result = self.process_stage_high(stage)
+                self._collect_results(stage, stage_result)
                 stage_save_result = self.save_stage_high_results(stage,stage_result)
                 result = {'stage':stage,'result':stage_save_result}
+                self.export_final_stage_results(stage)
+                self.save_checkpoint(stage, stage_result)
                 stage += 1
                 logger.debug(f'stage_result:{stage_result}')
+            self.metrics.begin('导出')
+            if self.result_sink is not None:
+                self.run_id = self.result_sink.write_result_table(self.result_table, rules_file, classification_file)
+            if self.result_layout == 'long':
+                result = {'stage':result['stage'],'result':self.save_result_table()}
+            else:
+                if self.export_stage_store or temporary_store:
+                    self.export_stage_results()
+                # 仅在内存中且未导出时没有写入任何文件
+                if self.export_stage_store or temporary_store or not getattr(self.stage_store, 'in_process', False):
+                    self.save_manifest()
             logger.debug(f'result:{result}')
+            self.save_metrics_report(rules_file, classification_file)
             return result
             
 
@@ -769,4 +1736,11 @@ class WorkFlowProcessor:
             err_msg = f'处理完整工作流失败：{e}'
             if error_callback:
                 error_callback(err_msg)
+            try:
+                self.save_metrics_report(rules_file, classification_file, error=str(e))
+            except Exception as report_error:
+                logger.warning(f'保存运行指标失败: {report_error}')
             raise Exception(f"处理完整工作流失败：{e}")
+        finally:
+            if temporary_store:
+                self.stage_store = self.excel_handler
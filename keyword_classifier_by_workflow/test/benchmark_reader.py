@@ -0,0 +1,144 @@
+from src.kw_cf.excel_handler import ExcelHandler
+from pathlib import Path
+import pandas as pd
+import random
+import struct
+import time
+import sys
+import zipfile
+
+# .xlsb（BIFF12）中用到的记录类型
+_BRT_ROW_HDR, _BRT_CELL_REAL, _BRT_CELL_ISST, _BRT_SST_ITEM = 0x00, 0x05, 0x07, 0x13
+_BRT_BEGIN_SHEET, _BRT_END_SHEET, _BRT_BEGIN_BOOK, _BRT_END_BOOK = 0x81, 0x82, 0x83, 0x84
+_BRT_BEGIN_BUNDLE_SHS, _BRT_END_BUNDLE_SHS, _BRT_BEGIN_SHEET_DATA, _BRT_END_SHEET_DATA = 0x8F, 0x90, 0x91, 0x92
+_BRT_WS_DIM, _BRT_BUNDLE_SH, _BRT_BEGIN_SST, _BRT_END_SST = 0x94, 0x9C, 0x9F, 0xA0
+_XLSB_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="bin" ContentType="application/vnd.ms-excel.sheet.binary.macroEnabled.main"/>'
+    '<Override PartName="/xl/worksheets/sheet1.bin" ContentType="application/vnd.ms-excel.worksheet"/>'
+    '<Override PartName="/xl/sharedStrings.bin" ContentType="application/vnd.ms-excel.sharedStrings"/>'
+    '</Types>'
+)
+_XLSB_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.bin"/>'
+    '</Relationships>'
+)
+_XLSB_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.bin"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.bin"/>'
+    '</Relationships>'
+)
+
+
+def make_workbook(file_path: Path, rows: int, seed: int = 0) -> Path:
+    """生成合成的待分类工作簿，后缀为.xlsb时生成二进制工作簿"""
+    if file_path.exists():
+        return file_path
+    random.seed(seed)
+    words = ['苹果', '华为', '小米', '手机', '电脑', '价格', '评测', '维修', '二手', '官网']
+    keywords = [''.join(random.sample(words, 3)) + str(i) for i in range(rows)]
+    df = pd.DataFrame({'关键词': keywords, '搜索量': [random.randint(0, 10000) for _ in range(rows)]})
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    if file_path.suffix == '.xlsb':
+        return write_xlsb(file_path, df)
+    df.to_excel(file_path, index=False)
+    return file_path
+
+
+def _xlsb_record(record_type: int, payload: bytes = b'') -> bytes:
+    """BIFF12记录：类型和长度都是每字节7位的变长整数"""
+    header = bytearray()
+    for value, max_bytes in ((record_type, 2), (len(payload), 4)):
+        for _ in range(max_bytes):
+            byte, value = value & 0x7F, value >> 7
+            header.append(byte | (0x80 if value else 0))
+            if not value:
+                break
+    return bytes(header) + payload
+
+
+def _xlsb_string(text: str) -> bytes:
+    encoded = text.encode('utf-16-le')
+    return struct.pack('<I', len(encoded) // 2) + encoded
+
+
+def write_xlsb(file_path: Path, df: pd.DataFrame) -> Path:
+    """将只有字符串列和数值列的DataFrame写入单sheet的.xlsb工作簿（没有库可以写入.xlsb，按BIFF12格式直接生成）"""
+    strings: dict[str, int] = {}
+    rows = [list(df.columns)] + df.values.tolist()
+    sheet = bytearray(_xlsb_record(_BRT_BEGIN_SHEET))
+    sheet += _xlsb_record(_BRT_WS_DIM, struct.pack('<4I', 0, len(rows) - 1, 0, len(df.columns) - 1))
+    sheet += _xlsb_record(_BRT_BEGIN_SHEET_DATA)
+    for row_index, row in enumerate(rows):
+        sheet += _xlsb_record(_BRT_ROW_HDR, struct.pack('<IIHHBI', row_index, 0, 0x0127, 0, 0, 0))
+        for column, value in enumerate(row):
+            if isinstance(value, str):
+                index = strings.setdefault(value, len(strings))
+                sheet += _xlsb_record(_BRT_CELL_ISST, struct.pack('<III', column, 0, index))
+            else:
+                sheet += _xlsb_record(_BRT_CELL_REAL, struct.pack('<IId', column, 0, value))
+    sheet += _xlsb_record(_BRT_END_SHEET_DATA) + _xlsb_record(_BRT_END_SHEET)
+
+    shared_strings = bytearray(_xlsb_record(_BRT_BEGIN_SST, struct.pack('<II', len(strings), len(strings))))
+    for text in strings:
+        shared_strings += _xlsb_record(_BRT_SST_ITEM, b'\x00' + _xlsb_string(text))
+    shared_strings += _xlsb_record(_BRT_END_SST)
+
+    workbook = (_xlsb_record(_BRT_BEGIN_BOOK) + _xlsb_record(_BRT_BEGIN_BUNDLE_SHS)
+                + _xlsb_record(_BRT_BUNDLE_SH, struct.pack('<II', 0, 1) + _xlsb_string('rId1') + _xlsb_string('Sheet1'))
+                + _xlsb_record(_BRT_END_BUNDLE_SHS) + _xlsb_record(_BRT_END_BOOK))
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSB_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSB_ROOT_RELS)
+        zf.writestr('xl/workbook.bin', workbook)
+        zf.writestr('xl/_rels/workbook.bin.rels', _XLSB_WORKBOOK_RELS)
+        zf.writestr('xl/worksheets/sheet1.bin', bytes(sheet))
+        zf.writestr('xl/sharedStrings.bin', bytes(shared_strings))
+    return file_path
+
+
+def benchmark(file_paths: dict[str, Path], engines: list[str]) -> dict[str, float]:
+    """对比各读取引擎的耗时，并校验读取结果完全一致
+
+    Args:
+        file_paths: 后缀到同一内容的工作簿的映射，每个引擎读取其支持的格式
+        engines: 读取引擎，第一个引擎的结果作为基准
+    """
+    timings = {}
+    frames = {}
+    for engine in engines:
+        file_path = file_paths['.xlsb' if engine == 'pyxlsb' else '.xlsx']
+        handler = ExcelHandler(reader_engine=engine)
+        start = time.perf_counter()
+        frames[engine] = handler.read_excel(file_path)
+        timings[engine] = time.perf_counter() - start
+    # calamine同时读取.xlsb，与pyxlsb的结果一并校验
+    if 'calamine' in engines and 'pyxlsb' in engines:
+        frames['calamine(xlsb)'] = ExcelHandler(reader_engine='calamine').read_excel(file_paths['.xlsb'])
+    baseline_engine = engines[0]
+    for engine, frame in frames.items():
+        pd.testing.assert_frame_equal(frames[baseline_engine], frame, check_dtype=False)
+    return timings
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    engines = [engine for engine in ('openpyxl', 'calamine', 'pyxlsb') if ExcelHandler.is_engine_available(engine)]
+    print(f'可用读取引擎: {engines}（pyxlsb读取.xlsb，其余读取.xlsx）')
+    for rows in sizes:
+        file_paths = {suffix: make_workbook(Path('data/benchmark') / f'待分类_benchmark_{rows}{suffix}', rows)
+                      for suffix in ('.xlsx', '.xlsb')}
+        timings = benchmark(file_paths, engines)
+        report = ', '.join(f'{engine}: {seconds:.2f}s' for engine, seconds in timings.items())
+        print(f'{rows}行 -> {report}')
+
+
+if __name__ == '__main__':
+    main()
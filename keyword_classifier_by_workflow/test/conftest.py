@@ -0,0 +1,99 @@
+import copy
+import re
+import random
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import pandas as pd
+import pytest
+from src.kw_cf.excel_handler import ExcelHandler
+
+# 五个层级的工作流规则：一级按品牌、二级按品类分sheet、三至五级按修饰词逐层细分
+WORKFLOW_RULES = {
+    'Sheet1': {'分类规则': ['苹果|华为', '小米', 'oppo'], '结果文件名称': ['大牌', '小米', 'oppo']},
+    'Sheet2': {'分类规则': ['手机', '电脑|耳机', '手机', '手表', '手机|手表'],
+               '结果文件名称': ['大牌', '大牌', '小米', '小米', 'oppo'],
+               '分类sheet名称': ['手机', '其它数码', '手机', '手表', '全部']},
+    'Sheet3': {'分类规则': ['价格', '评测', '维修', '二手'], '结果文件名称': ['全', '全', '大牌', '小米'],
+               '分类sheet名称': ['全', '全', '手机', '手机']},
+    'Sheet4': {'分类规则': ['便宜', '最新', '推荐', '推荐'], '结果文件名称': ['全', '全', '大牌', '小米'],
+               '分类sheet名称': ['全', '全', '手机', '手机'], '上层分类规则': ['价格', '价格', '评测', '维修']},
+    'Sheet5': {'分类规则': ['1|3', '2|4'], '结果文件名称': ['全', '全'], '分类sheet名称': ['全', '全'],
+               '上层分类规则': ['便宜', '最新']},
+}
+
+
+def make_keywords(count: int, seed: int = 1) -> List[str]:
+    """生成count个不重复的合成关键词"""
+    rng = random.Random(seed)
+    brands = ['苹果', '华为', '小米', 'oppo', '其它']
+    items = ['手机', '电脑', '耳机', '手表']
+    modifiers = ['价格', '评测', '维修', '二手', '官网']
+    extras = ['便宜', '最新', '推荐', '']
+    return [f'{rng.choice(brands)}{rng.choice(items)}{rng.choice(modifiers)}{rng.choice(extras)}{i}' for i in range(count)]
+
+
+def write_keyword_file(path: Path, keywords: List[str]) -> Path:
+    """写入待分类文件"""
+    pd.DataFrame({'关键词': keywords}).to_excel(path, index=False)
+    return path
+
+
+def write_rules_file(path: Path, rules: Dict[str, dict] = WORKFLOW_RULES) -> Path:
+    """写入工作流规则文件"""
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name, columns in rules.items():
+            pd.DataFrame(columns).to_excel(writer, sheet_name=sheet_name, index=False)
+    return path
+
+
+def read_results(result_files: Path | Iterable[Path]) -> Dict[str, List[Tuple[str, dict]]]:
+    """读取结果文件：结果文件名称（去掉时间） -> 按顺序的(sheet名称, 各列数据)
+
+    Args:
+        result_files: 结果目录（读取其中全部xlsx结果文件）或结果文件列表
+    """
+    handler = ExcelHandler()
+    if isinstance(result_files, Path):
+        result_files = [path for path in result_files.iterdir() if path.suffix == '.xlsx']
+    results = {}
+    for path in sorted(map(Path, result_files)):
+        output_name = re.sub(r'_\d{14}$', '', path.stem)
+        assert output_name not in results, f'有多个{output_name}结果文件'
+        sheets = handler.read_table(path, sheet_name=None, dtype=str)
+        results[output_name] = [(sheet_name, df.fillna('').to_dict('list')) for sheet_name, df in sheets.items()]
+    return results
+
+
+@pytest.fixture
+def workflow_data(tmp_path):
+    """工作流规则文件和400个关键词的待分类文件"""
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    keywords = make_keywords(400)
+    return {
+        'data_dir': data_dir,
+        'keywords': keywords,
+        'rules_file': write_rules_file(data_dir / '工作流规则_测试.xlsx'),
+        'classification_file': write_keyword_file(data_dir / '待分类_测试.xlsx', keywords),
+    }
+
+
+@pytest.fixture
+def workflow_rules():
+    """工作流规则的副本，可以修改后用write_rules_file写入"""
+    return copy.deepcopy(WORKFLOW_RULES)
+
+
+@pytest.fixture(name='write_keyword_file')
+def write_keyword_file_fixture():
+    return write_keyword_file
+
+
+@pytest.fixture(name='write_rules_file')
+def write_rules_file_fixture():
+    return write_rules_file
+
+
+@pytest.fixture(name='read_results')
+def read_results_fixture():
+    return read_results
@@ -46,6 +46,14 @@ class Test:
     def test_read_keywords(self):
         result = self.excel_handler.read_keyword_file(self.keyword_file)
         print(result)
+
+    def test_iter_keywords(self, chunk_size: int = 10000):
+        full = self.excel_handler.read_keyword_file(self.keyword_file)
+        streamed = []
+        for chunk in self.excel_handler.iter_keyword_file(self.keyword_file, chunk_size):
+            streamed.extend(chunk.data)
+        assert streamed == full.data, '流式读取结果与一次性读取不一致'
+        print(f'流式读取{len(streamed)}个关键词，与一次性读取结果一致')
         
     def test_workflow_processor(self):
         processor = WorkFlowProcessor()
@@ -0,0 +1,116 @@
+import json
+import pytest
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+class InterruptedProcessor(WorkFlowProcessor):
+    """在指定层级开始时中断的工作流处理器"""
+    def __init__(self, fail_level: int, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_level = fail_level
+
+    def process_stage3(self, *args, **kwargs):
+        if self.fail_level == 3:
+            raise RuntimeError('中断')
+        return super().process_stage3(*args, **kwargs)
+
+    def process_stage_high(self, level: int):
+        if level == self.fail_level:
+            raise RuntimeError('中断')
+        return super().process_stage_high(level)
+
+
+class CountingProcessor(WorkFlowProcessor):
+    """记录一级分类是否重新执行的工作流处理器"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stage1_runs = 0
+
+    def process_stage1(self, *args, **kwargs):
+        self.stage1_runs += 1
+        return super().process_stage1(*args, **kwargs)
+
+
+def completed_levels(output_dir) -> list:
+    return json.loads((output_dir / '工作流检查点.json').read_text(encoding='utf-8'))['completed_levels']
+
+
+@pytest.mark.parametrize('fail_level', [3, 4, 5])
+def test_interrupted_run_resumes_to_same_output(workflow_data, tmp_path, read_results, fail_level):
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, classification_file)
+
+    output_dir = tmp_path / 'resumed'
+    with pytest.raises(Exception, match='中断'):
+        InterruptedProcessor(fail_level, output_dir=output_dir).process_workflow(rules_file, classification_file)
+    assert completed_levels(output_dir) == list(range(1, fail_level))
+
+    processor = CountingProcessor(output_dir=output_dir, resume=True)
+    result = processor.process_workflow(rules_file, classification_file)
+    assert result['stage'] == 5
+    assert processor.stage1_runs == 0
+    assert completed_levels(output_dir) == [1, 2, 3, 4, 5]
+    assert read_results(output_dir) == read_results(tmp_path / 'full')
+
+
+@pytest.mark.parametrize('changed', ['rules', 'input'])
+def test_changed_input_discards_checkpoint(workflow_data, workflow_rules, tmp_path, read_results, write_rules_file,
+                                           write_keyword_file, changed):
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    output_dir = tmp_path / 'result'
+    with pytest.raises(Exception, match='中断'):
+        InterruptedProcessor(4, output_dir=output_dir).process_workflow(rules_file, classification_file)
+
+    if changed == 'rules':
+        workflow_rules['Sheet5']['分类规则'] = ['5|7', '6|8']
+        write_rules_file(rules_file, workflow_rules)
+    else:
+        write_keyword_file(classification_file, workflow_data['keywords'] + ['华为手机价格便宜新增'])
+
+    processor = CountingProcessor(output_dir=output_dir, resume=True)
+    processor.process_workflow(rules_file, classification_file)
+    assert processor.stage1_runs == 1
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, classification_file)
+    assert read_results(processor.stage_output_files) == read_results(tmp_path / 'full')
+
+
+def test_incremental_run_matches_full_run_on_union(workflow_data, tmp_path, read_results, write_keyword_file):
+    rules_file, keywords = workflow_data['rules_file'], workflow_data['keywords']
+    data_dir = workflow_data['data_dir']
+    # 上次运行的关键词中没有手表，增量运行时小米结果文件新增手表sheet
+    previous = [keyword for keyword in keywords[:250] if '手表' not in keyword]
+    new = [keyword for keyword in keywords if keyword not in previous]
+    previous_file = write_keyword_file(data_dir / '待分类_上次.xlsx', previous)
+    union_file = write_keyword_file(data_dir / '待分类_全部.xlsx', previous + new)
+
+    output_dir = tmp_path / 'incremental'
+    WorkFlowProcessor(output_dir=output_dir).process_workflow(rules_file, previous_file)
+    result = WorkFlowProcessor(output_dir=output_dir, incremental=True).process_workflow(rules_file, union_file)
+    assert set(result['result']) == {'大牌', '小米', 'oppo', '未匹配关键词'}
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, union_file)
+
+    full = read_results(tmp_path / 'full')
+    assert [sheet_name for sheet_name, _ in full['小米']] == ['Sheet1', '手机', '手表', '未匹配关键词']
+    assert read_results(output_dir) == full
+    # 再次增量运行没有新关键词，结果不变
+    result = WorkFlowProcessor(output_dir=output_dir, incremental=True).process_workflow(rules_file, union_file)
+    assert result['result'] == {}
+    assert read_results(output_dir) == full
+
+
+@pytest.mark.parametrize('new', [
+    # 小米的新关键词没有匹配任何二级规则，只进入小米的未匹配关键词sheet
+    ['小米电脑官网新增'],
+    # 新关键词都没有匹配一级规则
+    ['其它电脑官网新增'],
+    ['小米电脑官网新增', '其它电脑官网新增', '华为手机价格便宜新增'],
+])
+def test_incremental_run_keeps_unmatched_new_keywords(workflow_data, tmp_path, read_results, write_keyword_file, new):
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    union_file = write_keyword_file(workflow_data['data_dir'] / '待分类_全部.xlsx', workflow_data['keywords'] + new)
+
+    output_dir = tmp_path / 'incremental'
+    WorkFlowProcessor(output_dir=output_dir).process_workflow(rules_file, classification_file)
+    WorkFlowProcessor(output_dir=output_dir, incremental=True).process_workflow(rules_file, union_file)
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, union_file)
+    assert read_results(output_dir) == read_results(tmp_path / 'full')
@@ -0,0 +1,69 @@
+import pytest
+from src.kw_cf import workflow_processor
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+from src.kw_cf.sharding import shard_keyword_file
+
+# pandas默认识别为缺失值的字符串，一次处理和分块处理都不应分类
+NA_STRINGS = ['NA', 'null', 'n/a', 'NULL', 'None', '#N/A']
+
+
+class ChunkRecordingProcessor(WorkFlowProcessor):
+    """记录每块关键词数的工作流处理器"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.chunk_sizes = []
+
+    def _classify_chunk(self, keywords, *args, **kwargs):
+        self.chunk_sizes.append(len(keywords.data))
+        return super()._classify_chunk(keywords, *args, **kwargs)
+
+
+@pytest.fixture
+def classification_file(workflow_data, write_keyword_file):
+    """在关键词之间插入缺失值字符串的待分类文件"""
+    keywords = list(workflow_data['keywords'])
+    for i, value in enumerate(NA_STRINGS):
+        keywords.insert(i * 50, value)
+    return write_keyword_file(workflow_data['data_dir'] / '待分类_含缺失值.xlsx', keywords)
+
+
+# 每块1个关键词时，大部分块的一级或二级分支都没有匹配
+@pytest.mark.parametrize('chunk_size', [1, 64, 1000])
+def test_chunked_run_matches_one_shot_run(workflow_data, classification_file, tmp_path, read_results, chunk_size):
+    rules_file = workflow_data['rules_file']
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, classification_file)
+    processor = ChunkRecordingProcessor(output_dir=tmp_path / 'chunked', chunk_size=chunk_size)
+    processor.process_workflow(rules_file, classification_file)
+
+    assert sum(processor.chunk_sizes) == len(workflow_data['keywords'])
+    assert max(processor.chunk_sizes) <= chunk_size
+    full = read_results(tmp_path / 'full')
+    sheet1 = dict(full['未匹配关键词'])['Sheet1']['关键词']
+    assert not set(NA_STRINGS) & set(sheet1)
+    assert read_results(tmp_path / 'chunked') == full
+    # 溢写文件在结束后删除
+    assert not list((tmp_path / 'chunked').glob('.分块缓存_*'))
+
+
+@pytest.mark.parametrize('rss_mb, expected_sizes', [
+    # 内存超过预算时每块减半，直到最小块大小
+    (512, [100, 50, 25, 12, 10, 10]),
+    # 内存低于预算的一半时逐块加倍，不超过chunk_size
+    (10, [100, 100, 100, 100]),
+])
+def test_memory_budget_adjusts_chunk_size(workflow_data, tmp_path, read_results, monkeypatch, rss_mb, expected_sizes):
+    monkeypatch.setattr(workflow_processor, '_MIN_CHUNK_SIZE', 10)
+    monkeypatch.setattr(workflow_processor, 'current_rss_bytes', lambda: rss_mb * 1024 * 1024)
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    processor = ChunkRecordingProcessor(output_dir=tmp_path / 'chunked', chunk_size=100, memory_budget_mb=256)
+    processor.process_workflow(rules_file, classification_file)
+
+    assert processor.chunk_sizes[:len(expected_sizes)] == expected_sizes
+    assert sum(processor.chunk_sizes) == len(workflow_data['keywords'])
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, classification_file)
+    assert read_results(tmp_path / 'chunked') == read_results(tmp_path / 'full')
+
+
+def test_shards_drop_missing_value_strings(workflow_data, classification_file, tmp_path):
+    manifest = shard_keyword_file(classification_file, 3, tmp_path / 'shards')
+    assert manifest['keywords'] == len(workflow_data['keywords'])
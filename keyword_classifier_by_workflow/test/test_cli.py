@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from src.kw_cf.cli import main
+from src.kw_cf.logger_config import console_handler
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+@pytest.fixture(autouse=True)
+def restore_console_level():
+    """main会修改控制台日志级别，测试结束后恢复"""
+    level = console_handler.level
+    yield
+    console_handler.setLevel(level)
+
+
+def expected_results(rules_file, keyword_file, output_dir, read_results):
+    WorkFlowProcessor(output_dir=output_dir).process_workflow(rules_file, keyword_file)
+    return read_results(output_dir)
+
+
+def test_single_file(workflow_data, tmp_path, read_results):
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    argv = [str(rules_file), str(classification_file), '-o', str(tmp_path / 'cli'), '--log-level', 'ERROR']
+    assert main(argv) == 0
+
+    # 单个文件直接输出到输出目录
+    assert not [path for path in (tmp_path / 'cli').iterdir() if path.is_dir()]
+    assert read_results(tmp_path / 'cli') == expected_results(rules_file, classification_file, tmp_path / 'reference', read_results)
+
+
+def test_directory_batch_in_parallel(workflow_data, tmp_path, read_results, write_keyword_file):
+    rules_file, keywords = workflow_data['rules_file'], workflow_data['keywords']
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    keyword_files = [write_keyword_file(input_dir / '待分类_甲.xlsx', keywords[:200]),
+                     write_keyword_file(input_dir / '待分类_乙.xlsx', keywords[200:])]
+    # 不以'待分类_'开头的文件不处理
+    write_keyword_file(input_dir / '其它.xlsx', keywords)
+
+    argv = [str(rules_file), str(input_dir), '-o', str(tmp_path / 'cli'), '-j', '2', '--log-level', 'ERROR']
+    assert main(argv) == 0
+    assert sorted(path.name for path in (tmp_path / 'cli').iterdir()) == ['待分类_乙', '待分类_甲']
+    for keyword_file in keyword_files:
+        expected = expected_results(rules_file, keyword_file, tmp_path / 'reference' / keyword_file.stem, read_results)
+        assert read_results(tmp_path / 'cli' / keyword_file.stem) == expected
+
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_failed_file_sets_exit_code(workflow_data, tmp_path, read_results, write_keyword_file, workers):
+    rules_file = workflow_data['rules_file']
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    keyword_file = write_keyword_file(input_dir / '待分类_甲.xlsx', workflow_data['keywords'])
+    pd.DataFrame({'序号': [1, 2]}).to_excel(input_dir / '待分类_缺少关键词列.xlsx', index=False)
+
+    argv = [str(rules_file), str(input_dir), '-o', str(tmp_path / 'cli'), '-j', workers, '--log-level', 'CRITICAL']
+    assert main(argv) == 1
+    # 其他文件仍然处理完成
+    expected = expected_results(rules_file, keyword_file, tmp_path / 'reference', read_results)
+    assert read_results(tmp_path / 'cli' / '待分类_甲') == expected
+
+
+@pytest.mark.parametrize('extra_args', [['-j', '0'], ['--chunk-size', '0'], ['-s', '|']])
+def test_invalid_arguments_exit_with_usage_error(workflow_data, extra_args):
+    argv = [str(workflow_data['rules_file']), str(workflow_data['classification_file']), *extra_args]
+    with pytest.raises(SystemExit) as exc_info:
+        main(argv)
+    assert exc_info.value.code == 2
+
+
+def test_missing_input_exits_with_usage_error(workflow_data, tmp_path):
+    with pytest.raises(SystemExit) as exc_info:
+        main([str(workflow_data['rules_file']), str(tmp_path / '待分类_不存在.xlsx')])
+    assert exc_info.value.code == 2
+    empty_dir = tmp_path / 'empty'
+    empty_dir.mkdir()
+    with pytest.raises(SystemExit) as exc_info:
+        main([str(workflow_data['rules_file']), str(empty_dir)])
+    assert exc_info.value.code == 2
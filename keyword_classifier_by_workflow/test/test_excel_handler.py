@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+from src.kw_cf.excel_handler import ExcelHandler
+
+
+def write_table(path, df: pd.DataFrame):
+    """按文件后缀写入待分类文件"""
+    if path.suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    elif path.suffix == '.arrow':
+        df.to_feather(path)
+    elif path.suffix == '.csv':
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    else:
+        df.to_excel(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.arrow', '.csv'])
+def test_empty_keyword_cells_are_dropped(tmp_path, suffix):
+    df = pd.DataFrame({'关键词': ['华为手机', None, '小米手表'], '序号': [1, 2, 3]})
+    path = write_table(tmp_path / f'待分类_空值{suffix}', df)
+    handler = ExcelHandler()
+
+    assert handler.read_keyword_file(path).data == ['华为手机', '小米手表']
+    assert handler.read_table(path, dtype=str)['关键词'].isna().tolist() == [False, True, False]
+    streamed = [keyword for chunk in handler.iter_keyword_file(path, 2) for keyword in chunk.data]
+    assert streamed == ['华为手机', '小米手表']
+
+
+@pytest.mark.parametrize('suffix', ['.xlsx', '.csv', '.parquet', '.arrow'])
+def test_streamed_keywords_match_read_keyword_file(tmp_path, suffix):
+    # pandas默认识别为缺失值的字符串，以及相近但不属于缺失值的关键词
+    values = ['华为手机', 'NA', 'null', 'n/a', 'N/A', 'NULL', 'None', 'nan', '#N/A', '<NA>',
+              'na手机', ' NA ', 'Null值', '小米手表', '华为手机']
+    path = write_table(tmp_path / f'待分类_缺失值{suffix}', pd.DataFrame({'关键词': values}))
+    handler = ExcelHandler()
+
+    expected = handler.read_keyword_file(path).data
+    for chunk_size in (1, 4, 100):
+        streamed = [keyword for chunk in handler.iter_keyword_file(path, chunk_size) for keyword in chunk.data]
+        assert streamed == expected
+    if suffix in ('.xlsx', '.csv'):
+        # 带空格的' NA '不是缺失值，清理后保留为NA
+        assert expected == ['华为手机', 'na手机', 'NA', 'Null值', '小米手表']
@@ -0,0 +1,76 @@
+import os
+import pytest
+from src.kw_cf.excel_handler import ExcelHandler
+from src.kw_cf.input_cache import InputCache
+from src.kw_cf.models import UnclassifiedKeywords
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return InputCache(tmp_path / 'cache')
+
+
+def cache_entries(cache: InputCache) -> list:
+    return sorted(path.name for path in cache.cache_dir.glob('*.pkl'))
+
+
+def test_repeated_read_hits_cache(workflow_data, cache, monkeypatch):
+    handler = ExcelHandler(input_cache=cache)
+    keywords = handler.read_keyword_file(workflow_data['classification_file'])
+    rules = handler.read_workflow_rules(workflow_data['rules_file'])
+    assert keywords.data == workflow_data['keywords']
+    assert len(cache_entries(cache)) == 2
+
+    def read_table(*args, **kwargs):
+        raise AssertionError('命中缓存时不应读取文件')
+
+    monkeypatch.setattr(handler, 'read_table', read_table)
+    assert handler.read_keyword_file(workflow_data['classification_file']).data == keywords.data
+    assert handler.read_workflow_rules(workflow_data['rules_file']).rules == rules.rules
+    assert len(cache_entries(cache)) == 2
+
+
+def test_changed_file_invalidates_cache(workflow_data, cache, write_keyword_file):
+    handler = ExcelHandler(input_cache=cache)
+    classification_file = workflow_data['classification_file']
+    handler.read_keyword_file(classification_file)
+
+    write_keyword_file(classification_file, ['华为手机', '小米手表'])
+    assert handler.read_keyword_file(classification_file).data == ['华为手机', '小米手表']
+    assert len(cache_entries(cache)) == 2
+
+
+def test_reader_engine_is_part_of_cache_key(workflow_data, cache):
+    classification_file = workflow_data['classification_file']
+    ExcelHandler(input_cache=cache, reader_engine='openpyxl').read_keyword_file(classification_file)
+    entries = cache_entries(cache)
+    ExcelHandler(input_cache=cache, reader_engine='openpyxl').read_keyword_file(classification_file)
+    assert cache_entries(cache) == entries
+    # 使用其他读取引擎时重新解析
+    ExcelHandler(input_cache=cache, reader_engine='auto').read_keyword_file(classification_file)
+    assert len(cache_entries(cache)) == 2
+
+    other = InputCache(cache.cache_dir)
+    other.put('keywords', classification_file, UnclassifiedKeywords(data=['其它']), {'reader_engine': 'calamine'})
+    assert other.get('keywords', classification_file, {'reader_engine': 'calamine'}).data == ['其它']
+    assert other.get('keywords', classification_file, {'reader_engine': 'calamine', 'usecols': ['关键词']}) is None
+    assert len(cache_entries(cache)) == 3
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, write_keyword_file):
+    files = [write_keyword_file(tmp_path / f'待分类_{i}.xlsx', [f'关键词{i}{j}' for j in range(50)]) for i in range(3)]
+    cache = InputCache(tmp_path / 'cache')
+    entries = [cache.put('keywords', path, UnclassifiedKeywords(data=[f'关键词{i}{j}' for j in range(50)]))
+               for i, path in enumerate(files)]
+    # 依次设置为更早的使用时间，再读取第一个条目使其成为最近使用
+    for age, entry in enumerate(reversed(entries), 1):
+        os.utime(entry, ns=(0, entry.stat().st_mtime_ns - age * 10 ** 9))
+    assert cache.get('keywords', files[0]) is not None
+
+    # 上限只能容纳三个条目，写入第四个时淘汰最久未使用的第二个条目
+    cache.max_size_bytes = sum(entry.stat().st_size for entry in entries) + 10
+    new_file = write_keyword_file(tmp_path / '待分类_3.xlsx', ['关键词'])
+    cache.put('keywords', new_file, UnclassifiedKeywords(data=['关键词']))
+    assert [entry.exists() for entry in entries] == [True, False, True]
+    assert cache.get('keywords', files[1]) is None
+    assert cache.get('keywords', new_file).data == ['关键词']
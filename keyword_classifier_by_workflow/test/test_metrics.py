@@ -0,0 +1,95 @@
+import json
+import os
+import pytest
+from src.kw_cf.metrics import CLASSIFICATION_COUNTERS, IO_COUNTERS
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+def run_report(workflow_data, output_dir, **kwargs) -> dict:
+    """运行工作流并读取保存的运行指标"""
+    processor = WorkFlowProcessor(output_dir=output_dir, **kwargs)
+    processor.process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    report_path, = output_dir.glob('运行指标_*.json')
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    assert report == processor.metrics_report
+    return report
+
+
+def level_outputs(results: dict) -> dict:
+    """结果文件中各层级匹配成功的关键词数"""
+    outputs = {1: 0, 2: 0}
+    for output_name, sheets in results.items():
+        for sheet_name, columns in sheets:
+            if output_name == '未匹配关键词':
+                continue
+            if sheet_name == 'Sheet1':
+                outputs[1] += len(columns['关键词'])
+            elif sheet_name != '未匹配关键词':
+                outputs[2] += len(columns['关键词'])
+            for column, values in columns.items():
+                if column.startswith('阶段'):
+                    level = int(column[2:])
+                    outputs[level] = outputs.get(level, 0) + sum(1 for value in values if value)
+    return outputs
+
+
+def test_report_has_stages_and_branches(workflow_data, tmp_path, read_results):
+    report = run_report(workflow_data, tmp_path / 'levels')
+    stages = {stage['name']: stage for stage in report['stages']}
+
+    assert report['status'] == 'completed' and report['error'] is None
+    assert report['max_level'] == 5 and report['config']['schedule'] == 'levels'
+    assert list(stages) == ['读取输入', *(f'阶段{level}' for level in range(1, 6)), '导出']
+    # 总计为各阶段之和
+    for key in (*CLASSIFICATION_COUNTERS, *IO_COUNTERS):
+        assert report[key] == sum(stage[key] for stage in report['stages'])
+
+    # 每个层级输入的关键词数为上一层级匹配的关键词数中有下一层级规则的部分，输出的关键词数与结果文件一致
+    outputs = level_outputs(read_results(tmp_path / 'levels'))
+    assert stages['阶段1']['rows_in'] == len(workflow_data['keywords'])
+    assert stages['阶段2']['rows_in'] == stages['阶段1']['rows_out']
+    assert stages['阶段3']['rows_in'] == stages['阶段2']['rows_out']
+    for level in range(1, 6):
+        stage = stages[f'阶段{level}']
+        assert stage['rows_out'] == outputs[level]
+        assert 0 < stage['rows_out'] <= stage['rows_in'] <= stage['evaluations']
+
+    # 二级以上每个结果文件是一个分支，分支的计数之和不超过所属阶段
+    for level in range(2, 6):
+        stage = stages[f'阶段{level}']
+        assert sorted(branch['name'] for branch in stage['branches']) == ['oppo', '大牌', '小米']
+        for key in ('rows_in', 'rows_out', 'evaluations'):
+            assert sum(branch[key] for branch in stage['branches']) == stage[key]
+        assert sum(branch['files_read'] for branch in stage['branches']) <= stage['files_read']
+        assert all(branch['pid'] == os.getpid() for branch in stage['branches'])
+
+
+def test_parallel_branches_report_same_counts(workflow_data, tmp_path):
+    serial = run_report(workflow_data, tmp_path / 'serial')
+    parallel = run_report(workflow_data, tmp_path / 'parallel', branch_workers=2)
+
+    assert parallel['config']['branch_workers'] == 2
+    # 每个工作进程单独编译规则，编译数不比较
+    for key in ('rows_in', 'rows_out', 'evaluations', 'files_read', 'files_written'):
+        assert parallel[key] == serial[key]
+        assert [stage[key] for stage in parallel['stages']] == [stage[key] for stage in serial['stages']]
+    branches = [branch for stage in parallel['stages'] for branch in stage['branches']]
+    assert branches and all(branch['pid'] != os.getpid() for branch in branches)
+    assert parallel['worker_cpu_seconds'] == pytest.approx(sum(stage['worker_cpu_seconds'] for stage in parallel['stages']), abs=1e-5)
+    assert parallel['worker_cpu_seconds'] > 0
+
+
+def test_failed_run_saves_report(workflow_data, tmp_path, monkeypatch):
+    def process_stage3(*args, **kwargs):
+        raise RuntimeError('阶段3出错')
+
+    processor = WorkFlowProcessor(output_dir=tmp_path / 'failed')
+    monkeypatch.setattr(processor, 'process_stage3', process_stage3)
+    with pytest.raises(Exception, match='阶段3出错'):
+        processor.process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+
+    report_path, = (tmp_path / 'failed').glob('运行指标_*.json')
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    assert report['status'] == 'failed' and '阶段3出错' in report['error']
+    assert [stage['name'] for stage in report['stages']] == ['读取输入', '阶段1', '阶段2', '阶段3']
+    assert report['rows_in'] == sum(stage['rows_in'] for stage in report['stages']) > 0
@@ -0,0 +1,46 @@
+import json
+import pytest
+from src.kw_cf.excel_handler import ExcelHandler
+from src.kw_cf.input_cache import InputCache
+from src.kw_cf.stage_store import MemoryStageStore
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+CONFIGS = {
+    'levels': lambda tmp_path: {},
+    'openpyxl': lambda tmp_path: {'excel_handler': ExcelHandler(writer_engine='openpyxl')},
+    'graph': lambda tmp_path: {'schedule': 'graph'},
+    'memory': lambda tmp_path: {'stage_store': MemoryStageStore()},
+    'long': lambda tmp_path: {'result_layout': 'long'},
+    # 生成计划时已读取输入文件，运行时命中缓存
+    'input_cache': lambda tmp_path: {'excel_handler': ExcelHandler(input_cache=InputCache(tmp_path / 'cache'))},
+    'csv': lambda tmp_path: {'excel_handler': ExcelHandler(output_format='csv')},
+}
+
+
+def plan_and_run(workflow_data, tmp_path, config: str):
+    """按配置生成执行计划后运行工作流，返回(计划, 运行指标)"""
+    processor = WorkFlowProcessor(output_dir=tmp_path / config, **CONFIGS[config](tmp_path))
+    plan = processor.plan_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    processor.process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    report_path, = (tmp_path / config).glob('运行指标_*.json')
+    return plan, json.loads(report_path.read_text(encoding='utf-8'))
+
+
+@pytest.mark.parametrize('config', [config for config in CONFIGS if config != 'csv'])
+def test_planned_file_operations_match_metrics(workflow_data, tmp_path, config):
+    plan, report = plan_and_run(workflow_data, tmp_path, config)
+    assert (plan['file_reads'], plan['file_writes']) == (report['files_read'], report['files_written'])
+
+    if config in ('levels', 'openpyxl', 'graph'):
+        # 逐层级写入阶段文件时，每个层级的读写次数与对应阶段一致，读取输入文件计入第1级
+        stages = {stage['name']: stage for stage in report['stages']}
+        actual = [(stages['读取输入']['files_read'] + stages['阶段1']['files_read'], stages['阶段1']['files_written'])]
+        actual += [(stages[f'阶段{level}']['files_read'], stages[f'阶段{level}']['files_written']) for level in range(2, 6)]
+        assert [(level['file_reads'], level['file_writes']) for level in plan['levels']] == actual
+
+
+def test_planned_sheet_file_operations_are_upper_bound(workflow_data, tmp_path):
+    plan, report = plan_and_run(workflow_data, tmp_path, 'csv')
+    # 目录形式的结果按sheet文件读写，没有关键词的sheet不会写入
+    assert plan['file_reads'] == report['files_read']
+    assert report['files_written'] <= plan['file_writes'] <= report['files_written'] + 1
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from src.kw_cf import excel_handler
+from src.kw_cf.excel_handler import ExcelHandler
+from benchmark_reader import make_workbook
+
+pytestmark = pytest.mark.skipif(
+    not (ExcelHandler.is_engine_available('calamine') and ExcelHandler.is_engine_available('pyxlsb')),
+    reason='需要安装python-calamine和pyxlsb')
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    """内容相同的.xlsx和.xlsb待分类文件"""
+    return {suffix: make_workbook(tmp_path / f'待分类_引擎{suffix}', 50) for suffix in ('.xlsx', '.xlsb')}
+
+
+@pytest.fixture
+def without_calamine(monkeypatch):
+    """模拟未安装python-calamine"""
+    is_engine_available = ExcelHandler.is_engine_available
+    monkeypatch.setattr(ExcelHandler, 'is_engine_available',
+                        staticmethod(lambda engine: engine != 'calamine' and is_engine_available(engine)))
+
+
+@pytest.mark.parametrize('reader_engine, suffix, expected', [
+    ('auto', '.xlsx', ['calamine', 'openpyxl']),
+    ('auto', '.xlsb', ['calamine', 'pyxlsb']),
+    ('openpyxl', '.xlsx', ['openpyxl']),
+    # openpyxl无法读取二进制工作簿
+    ('openpyxl', '.xlsb', ['calamine', 'pyxlsb']),
+    ('pyxlsb', '.xlsb', ['pyxlsb', 'calamine']),
+    ('calamine', '.xlsx', ['calamine', 'openpyxl']),
+])
+def test_reader_engine_selection(reader_engine, suffix, expected):
+    assert ExcelHandler(reader_engine=reader_engine).get_reader_engines(f'待分类_引擎{suffix}') == expected
+
+
+@pytest.mark.parametrize('suffix, expected', [('.xlsx', ['openpyxl']), ('.xlsb', ['pyxlsb'])])
+def test_auto_engine_falls_back_without_calamine(workbooks, without_calamine, suffix, expected):
+    handler = ExcelHandler()
+    assert handler.get_reader_engines(workbooks[suffix]) == expected
+    assert handler.read_keyword_file(workbooks[suffix]).data == ExcelHandler(reader_engine='openpyxl').read_keyword_file(workbooks['.xlsx']).data
+
+
+def test_xlsb_without_reader_engine_is_rejected(monkeypatch):
+    monkeypatch.setattr(ExcelHandler, 'is_engine_available', staticmethod(lambda engine: engine == 'openpyxl'))
+    with pytest.raises(ValueError, match='没有可用于读取'):
+        ExcelHandler().get_reader_engines('待分类_引擎.xlsb')
+
+
+def test_unknown_reader_engine_is_rejected():
+    with pytest.raises(ValueError, match='不支持的读取引擎'):
+        ExcelHandler(reader_engine='xlrd')
+
+
+def test_failed_engine_falls_back_to_next(workbooks, monkeypatch):
+    read_excel = pd.read_excel
+    engines = []
+
+    def failing_calamine(*args, engine=None, **kwargs):
+        engines.append(engine)
+        if engine == 'calamine':
+            raise OSError('读取失败')
+        return read_excel(*args, engine=engine, **kwargs)
+
+    monkeypatch.setattr(excel_handler.pd, 'read_excel', failing_calamine)
+    df = ExcelHandler().read_excel(workbooks['.xlsb'])
+    assert engines == ['calamine', 'pyxlsb']
+    assert len(df) == 50
+
+
+@pytest.mark.parametrize('reader_engine', ['calamine', 'pyxlsb'])
+def test_xlsb_keywords_match_xlsx(workbooks, reader_engine):
+    expected = ExcelHandler(reader_engine='openpyxl').read_keyword_file(workbooks['.xlsx']).data
+    handler = ExcelHandler(reader_engine=reader_engine)
+    assert handler.read_keyword_file(workbooks['.xlsb']).data == expected
+    streamed = [keyword for chunk in handler.iter_keyword_file(workbooks['.xlsb'], 7) for keyword in chunk.data]
+    assert streamed == expected
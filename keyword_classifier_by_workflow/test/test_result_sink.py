@@ -0,0 +1,45 @@
+import pytest
+from src.kw_cf.excel_handler import ExcelHandler
+from src.kw_cf.result_sink import SQLiteResultSink
+from src.kw_cf.result_table import RESULT_TABLE_COLUMNS
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+@pytest.fixture
+def reference(workflow_data, tmp_path, read_results):
+    """按原有方式输出的分文件结果"""
+    WorkFlowProcessor(output_dir=tmp_path / 'reference').process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    return read_results(tmp_path / 'reference')
+
+
+def test_sink_export_matches_result_files(workflow_data, tmp_path, read_results, reference):
+    sink = SQLiteResultSink(tmp_path / '分类结果.db')
+    processor = WorkFlowProcessor(output_dir=tmp_path / 'sink', result_sink=sink)
+    processor.process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+
+    # 写入数据库的同时仍输出分文件结果
+    assert read_results(tmp_path / 'sink') == reference
+    runs = sink.list_runs()
+    assert runs['run_id'].tolist() == [processor.run_id]
+    assert runs['row_count'].tolist() == [len(sink.query(processor.run_id))]
+    assert read_results(sink.export(processor.run_id, ExcelHandler(), tmp_path / 'export').values()) == reference
+
+
+def test_sink_query_filters_rows(workflow_data, tmp_path, reference):
+    sink = SQLiteResultSink(tmp_path / '分类结果.db')
+    processor = WorkFlowProcessor(output_dir=tmp_path / 'sink', result_sink=sink)
+    processor.process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+
+    rows = sink.query(processor.run_id, level=3, matched_rule='价格')
+    assert list(rows.columns) == RESULT_TABLE_COLUMNS
+    assert set(rows['分类层级']) == {3} and set(rows['匹配的规则']) == {'价格'}
+    expected = sorted(keyword for sheets in reference.values() for _, columns in sheets if '阶段3' in columns
+                      for keyword, rule in zip(columns['关键词'], columns['阶段3']) if rule == '价格')
+    assert expected and sorted(rows['关键词']) == expected
+
+    rows = sink.query(processor.run_id, level=2, output_name='小米', classified_sheet_name='手表')
+    assert sorted(rows['关键词']) == sorted(dict(reference['小米'])['手表']['关键词'])
+    unmatched = sink.query(processor.run_id, level=1, matched_rule=None)
+    assert sorted(unmatched['关键词']) == sorted(dict(reference['未匹配关键词'])['Sheet1']['关键词'])
+    with pytest.raises(ValueError, match='不支持的查询条件'):
+        sink.query(processor.run_id, keyword='华为手机')
@@ -0,0 +1,27 @@
+import pytest
+from src.kw_cf.excel_handler import ExcelHandler
+from src.kw_cf.result_table import RESULT_TABLE_COLUMNS, fan_out_result_table
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+@pytest.fixture
+def reference(workflow_data, tmp_path, read_results):
+    """按原有方式输出的分文件结果"""
+    WorkFlowProcessor(output_dir=tmp_path / 'reference').process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    return read_results(tmp_path / 'reference')
+
+
+@pytest.mark.parametrize('schedule', ['levels', 'single_pass'])
+def test_long_table_fans_out_to_result_files(workflow_data, tmp_path, read_results, reference, schedule):
+    processor = WorkFlowProcessor(output_dir=tmp_path / 'long', result_layout='long', schedule=schedule)
+    result = processor.process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    result_table = result['result']
+    assert result_table.name.startswith('分类结果_')
+
+    handler = ExcelHandler()
+    assert list(handler.read_table(result_table).columns) == RESULT_TABLE_COLUMNS
+    output_files = fan_out_result_table(result_table, handler, tmp_path / 'fan_out')
+    assert sorted(output_files) == sorted(reference)
+    assert read_results(output_files.values()) == reference
+    # 长表模式不输出分文件结果
+    assert [path.name for path in (tmp_path / 'long').iterdir() if not path.name.startswith(('运行指标_', '工作流清单_'))] == [result_table.name]
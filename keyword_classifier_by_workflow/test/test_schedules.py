@@ -0,0 +1,44 @@
+import pytest
+from src.kw_cf.workflow_processor import WorkFlowProcessor, SCHEDULES
+
+
+@pytest.mark.parametrize('schedule, branch_workers', [
+    *((schedule, 1) for schedule in SCHEDULES),
+    # 任务图的节点在进程池中执行
+    ('graph', 2),
+])
+def test_schedule_matches_levels_run(workflow_data, tmp_path, read_results, schedule, branch_workers):
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    WorkFlowProcessor(output_dir=tmp_path / 'reference').process_workflow(rules_file, classification_file)
+    output_dir = tmp_path / f'{schedule}_{branch_workers}'
+    processor = WorkFlowProcessor(output_dir=output_dir, schedule=schedule, branch_workers=branch_workers)
+    result = processor.process_workflow(rules_file, classification_file)
+
+    assert result['stage'] == 5
+    reference = read_results(tmp_path / 'reference')
+    assert [sheet_name for sheet_name, _ in reference['大牌']] == ['Sheet1', '手机', '其它数码', '未匹配关键词']
+    assert read_results(output_dir) == reference
+    if schedule == 'graph':
+        assert_critical_path(processor.graph_report)
+    else:
+        assert processor.graph_report is None
+
+
+def assert_critical_path(report: dict):
+    """关键路径从一级节点开始逐级向下，沿同一结果文件、同一sheet的分支到达耗时之和最大的节点"""
+    nodes = {node['name']: node for node in report['nodes']}
+    path = [nodes[name] for name in report['critical_path']]
+    assert path[0]['name'] == '1'
+    assert [node['level'] for node in path] == list(range(1, len(path) + 1))
+    # 耗时最长的链可能在没有下一层级规则的分支结束，长度取决于各节点的实际耗时
+    assert len(path) >= 3
+    assert all(node['state'] == 'done' and node['keywords'] > 0 for node in path[1:])
+    # 节点名称为"层级/结果文件/sheet/父级规则"，二级以下的节点与上游属于同一结果文件，三级以下属于同一sheet
+    branches = [node['name'].split('/')[1:3] for node in path[1:]]
+    assert len({output_name for output_name, *_ in branches}) == 1
+    assert len({tuple(branch) for branch in branches[1:]}) == 1
+
+    assert report['critical_path_seconds'] == pytest.approx(sum(node['seconds'] for node in path), abs=1e-5)
+    # 每个已完成节点都在某条从一级节点开始的依赖链上，关键路径不短于其中任何一条
+    done_seconds = [node['seconds'] for node in report['nodes'] if node['state'] == 'done' and node['level'] > 1]
+    assert report['critical_path_seconds'] >= path[0]['seconds'] + max(done_seconds) - 1e-5
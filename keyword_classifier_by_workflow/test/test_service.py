@@ -0,0 +1,157 @@
+import http.client
+import json
+import threading
+import pytest
+from src.kw_cf import service as service_module
+from src.kw_cf.service import ClassificationService
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+@pytest.fixture
+def service(workflow_data):
+    return ClassificationService({'测试': workflow_data['rules_file']}, max_concurrency=1, queue_timeout=0.1, max_keywords=500)
+
+
+@pytest.fixture
+def request_json(service):
+    """在系统分配的端口上启动服务，返回发送请求的函数: (方法, 路径, 请求体, 请求头) -> (状态码, 响应头, 响应JSON)"""
+    server = service.create_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def request(method: str, path: str, body=None, headers=None):
+        connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+        try:
+            data = body if isinstance(body, bytes) or body is None else json.dumps(body, ensure_ascii=False).encode('utf-8')
+            connection.request(method, path, body=data, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def result_locations(results: dict) -> dict:
+    """结果文件中每个关键词所在的(结果文件名称, sheet名称)及各阶段列的值"""
+    locations = {}
+    for output_name, sheets in results.items():
+        for sheet_name, columns in sheets:
+            for row, keyword in enumerate(columns['关键词']):
+                location = locations.setdefault(keyword, set())
+                location.add((output_name, sheet_name))
+                for column, values in columns.items():
+                    if column.startswith('阶段') and values[row]:
+                        location.add((output_name, sheet_name, column, values[row]))
+    return locations
+
+
+def path_locations(path: list) -> set:
+    """接口返回的分类路径对应的结果文件位置，与result_locations的格式相同"""
+    location = set()
+    for step in path:
+        if step['level'] <= 2:
+            location.add((step['output_name'], step['classified_sheet_name']))
+        elif step['matched_rule']:
+            location.add((step['output_name'], step['classified_sheet_name'], f"阶段{step['level']}", step['matched_rule']))
+    return location
+
+
+def test_workflow_paths_match_result_files(workflow_data, tmp_path, read_results, request_json):
+    rules_file, keywords = workflow_data['rules_file'], workflow_data['keywords']
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(rules_file, workflow_data['classification_file'])
+    expected = result_locations(read_results(tmp_path / 'full'))
+
+    status, _, body = request_json('POST', '/classify/workflow', {'rule_book': '测试', 'keywords': keywords})
+    assert status == 200
+    assert [result['keyword'] for result in body['results']] == keywords
+    assert {result['keyword']: path_locations(result['path']) for result in body['results']} == expected
+
+
+def test_health_metrics_and_level(request_json, workflow_data):
+    status, _, health = request_json('GET', '/health')
+    assert status == 200 and list(health['rule_books']) == ['测试']
+
+    payload = {'keywords': ['小米手表价格', '小米电脑', '华为手机', None], 'level': 2, 'output_name': '小米'}
+    status, _, body = request_json('POST', '/classify/level', payload)
+    assert status == 200
+    assert [(result['keyword'], result['classified_sheet_name'], result['matched_rule']) for result in body['results']] == [
+        ('小米手表价格', '手表', '手表'), ('小米电脑', '未匹配关键词', None), ('华为手机', '手机', '手机')]
+
+    payload = {'keywords': ['华为手机价格便宜'], 'level': 4, 'output_name': '大牌', 'classified_sheet_name': '手机', 'parent_rule': '价格'}
+    status, _, body = request_json('POST', '/classify/level', payload)
+    assert status == 200 and body['results'][0]['matched_rule'] == '便宜'
+
+    status, _, metrics = request_json('GET', '/metrics')
+    assert status == 200
+    assert metrics['completed'] == 3 and metrics['keywords'] == 4
+    assert metrics['rule_books']['测试']['rows_in'] == 4 and metrics['rule_books']['测试']['rows_out'] == 3
+
+
+def test_reload_changed_rules(request_json, workflow_data, workflow_rules, write_rules_file):
+    assert request_json('POST', '/reload', {'rule_book': '测试'})[2] == {'reloaded': []}
+    _, _, health = request_json('GET', '/health')
+
+    workflow_rules['Sheet2']['分类规则'][3] = '手表|手环'
+    write_rules_file(workflow_data['rules_file'], workflow_rules)
+    assert request_json('POST', '/reload')[2] == {'reloaded': ['测试']}
+    _, _, reloaded = request_json('GET', '/health')
+    assert reloaded['rule_books']['测试']['rules_hash'] != health['rule_books']['测试']['rules_hash']
+    _, _, body = request_json('POST', '/classify/level', {'keywords': ['小米手环'], 'level': 2, 'output_name': '小米'})
+    assert body['results'][0]['classified_sheet_name'] == '手表'
+
+
+@pytest.mark.parametrize('payload, message', [
+    ({'keywords': '华为手机'}, 'keywords必须是关键词列表'),
+    ({'keywords': ['华为手机', 1]}, '关键词必须是字符串'),
+    ({'keywords': [['华为手机']]}, '关键词必须是字符串'),
+    ({'keywords': ['华为手机'], 'level': True}, 'level必须是大于0的整数'),
+    ({'keywords': ['华为手机'], 'level': 0}, 'level必须是大于0的整数'),
+    ({'keywords': ['华为手机'], 'level': '2'}, 'level必须是大于0的整数'),
+])
+def test_invalid_payload_is_bad_request(request_json, payload, message):
+    path = '/classify/level' if 'level' in payload else '/classify/workflow'
+    status, _, body = request_json('POST', path, payload)
+    assert status == 400 and message in body['error']
+
+
+@pytest.mark.parametrize('body, headers', [
+    (b'{"keywords": [', {}),
+    ('["华为手机"]'.encode('utf-8'), {}),
+    (b'{}', {'Content-Length': '-1'}),
+    (b'{}', {'Content-Length': 'abc'}),
+])
+def test_invalid_body_is_bad_request(request_json, body, headers):
+    status, _, response = request_json('POST', '/classify/workflow', body, headers)
+    assert status == 400 and response['error']
+
+
+@pytest.mark.parametrize('method, path, payload', [
+    ('GET', '/classify', None),
+    ('POST', '/classify/workflow', {'rule_book': '不存在', 'keywords': []}),
+    ('POST', '/classify/level', {'keywords': ['华为手机'], 'level': 3, 'output_name': '小米', 'classified_sheet_name': '电脑'}),
+])
+def test_unknown_route_rule_book_or_branch_is_not_found(request_json, method, path, payload):
+    assert request_json(method, path, payload)[0] == 404
+
+
+def test_too_many_keywords_or_large_body(request_json, monkeypatch):
+    status, _, body = request_json('POST', '/classify/workflow', {'keywords': [f'关键词{i}' for i in range(501)]})
+    assert status == 413 and '最多500个关键词' in body['error']
+    monkeypatch.setattr(service_module._ServiceRequestHandler, 'max_body_bytes', 10)
+    assert request_json('POST', '/classify/workflow', {'keywords': ['华为手机']})[0] == 413
+
+
+def test_busy_service_rejects_request(request_json, service):
+    # 占用唯一的并发名额
+    assert service._slots.acquire(timeout=1)
+    try:
+        status, headers, _ = request_json('POST', '/classify/workflow', {'keywords': ['华为手机']})
+    finally:
+        service._slots.release()
+    assert status == 503 and headers['Retry-After'] == '1'
+    assert request_json('GET', '/health')[0] == 200
+    _, _, metrics = request_json('GET', '/metrics')
+    assert metrics['rejected'] == 1 and metrics['client_errors'] == 0
@@ -0,0 +1,74 @@
+import openpyxl
+import pytest
+from src.kw_cf import excel_handler
+from src.kw_cf.workflow_processor import WorkFlowProcessor, SCHEDULES
+from src.kw_cf.sharding import shard_keyword_file, merge_shard_results
+
+
+def run_shards(workflow_data, tmp_path, shard_count: int, shard_format: str, schedule: str = 'levels'):
+    """拆分待分类文件，逐个分片运行工作流（保留未匹配关键词）后合并，返回分片清单和合并结果目录"""
+    shard_dir = tmp_path / 'shards'
+    manifest = shard_keyword_file(workflow_data['classification_file'], shard_count, shard_dir, output_format=shard_format)
+    result_dirs = []
+    for shard in manifest['shards']:
+        result_dir = tmp_path / f"shard{shard['index']}"
+        processor = WorkFlowProcessor(output_dir=result_dir, schedule=schedule, keep_unmatched=True)
+        processor.process_workflow(workflow_data['rules_file'], shard_dir / shard['file'])
+        result_dirs.append(result_dir)
+    # 合并不依赖结果目录的顺序
+    merge_shard_results(shard_dir, result_dirs[::-1], tmp_path / 'merged')
+    return manifest, tmp_path / 'merged'
+
+
+@pytest.mark.parametrize('shard_count', [1, 3])
+def test_merged_csv_shards_match_full_run(workflow_data, tmp_path, read_results, shard_count):
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    manifest, merged_dir = run_shards(workflow_data, tmp_path, shard_count, 'csv')
+
+    full = read_results(tmp_path / 'full')
+    assert set(full) == {'大牌', '小米', 'oppo', '未匹配关键词'}
+    assert sum(shard['keywords'] for shard in manifest['shards']) == len(workflow_data['keywords'])
+    assert read_results(merged_dir) == full
+
+
+@pytest.mark.parametrize('schedule', SCHEDULES)
+def test_merged_small_shards_match_full_run(workflow_data, tmp_path, read_results, schedule):
+    # 每个分片只有几个关键词，大部分分片中有的一级或二级分支没有匹配
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    _, merged_dir = run_shards(workflow_data, tmp_path, 80, 'csv', schedule)
+    assert read_results(merged_dir) == read_results(tmp_path / 'full')
+
+
+def test_merged_xlsx_shards_over_spill_limit_match_full_run(workflow_data, tmp_path, read_results, monkeypatch):
+    # 降低Excel行数上限，使分片文件、各分片结果和合并结果中的sheet都拆分为续表sheet
+    monkeypatch.setattr(excel_handler, 'EXCEL_MAX_ROWS', 50)
+    WorkFlowProcessor(output_dir=tmp_path / 'full').process_workflow(workflow_data['rules_file'], workflow_data['classification_file'])
+    manifest, merged_dir = run_shards(workflow_data, tmp_path, 2, 'xlsx')
+
+    shard_sheets = openpyxl.load_workbook(tmp_path / 'shards' / manifest['shards'][0]['file'], read_only=True).sheetnames
+    merged_sheets = openpyxl.load_workbook(next(merged_dir.glob('大牌_*.xlsx')), read_only=True).sheetnames
+    assert 'Sheet1_续2' in shard_sheets and 'Sheet1_续2' in merged_sheets
+    assert read_results(merged_dir) == read_results(tmp_path / 'full')
+
+
+def test_merge_rejects_missing_shard(workflow_data, tmp_path):
+    shard_dir = tmp_path / 'shards'
+    manifest = shard_keyword_file(workflow_data['classification_file'], 2, shard_dir)
+    result_dir = tmp_path / 'shard1'
+    WorkFlowProcessor(output_dir=result_dir).process_workflow(workflow_data['rules_file'], shard_dir / manifest['shards'][0]['file'])
+
+    with pytest.raises(Exception, match='缺少分片'):
+        merge_shard_results(shard_dir, [result_dir], tmp_path / 'merged')
+
+
+def test_merge_rejects_shard_run_without_unmatched_keywords(workflow_data, tmp_path):
+    shard_dir = tmp_path / 'shards'
+    manifest = shard_keyword_file(workflow_data['classification_file'], 2, shard_dir)
+    result_dirs = [tmp_path / f"shard{shard['index']}" for shard in manifest['shards']]
+    for shard, result_dir in zip(manifest['shards'], result_dirs):
+        keep_unmatched = shard['index'] == 1
+        WorkFlowProcessor(output_dir=result_dir, keep_unmatched=keep_unmatched).process_workflow(
+            workflow_data['rules_file'], shard_dir / shard['file'])
+
+    with pytest.raises(Exception, match='分片2运行时没有保留未匹配关键词'):
+        merge_shard_results(shard_dir, result_dirs, tmp_path / 'merged')
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from src.kw_cf.stage_store import MemoryStageStore, ArrowStageStore
+from src.kw_cf.workflow_processor import WorkFlowProcessor
+
+
+@pytest.fixture(params=['memory', 'arrow'])
+def stage_store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStageStore()
+    return ArrowStageStore(tmp_path / 'store')
+
+
+def test_stage_store_matches_excel_run(workflow_data, tmp_path, read_results, stage_store):
+    rules_file, classification_file = workflow_data['rules_file'], workflow_data['classification_file']
+    WorkFlowProcessor(output_dir=tmp_path / 'excel').process_workflow(rules_file, classification_file)
+    processor = WorkFlowProcessor(output_dir=tmp_path / 'stored', stage_store=stage_store)
+    assert processor.process_workflow(rules_file, classification_file)['stage'] == 5
+
+    assert read_results(tmp_path / 'stored') == read_results(tmp_path / 'excel')
+
+
+def test_arrow_store_keeps_column_order(tmp_path):
+    store = ArrowStageStore(tmp_path / 'store')
+    output_file = tmp_path / '大牌.xlsx'
+    keywords = ['华为手机', '苹果手机']
+    store.write_sheets(output_file, {'手机': pd.DataFrame({'关键词': keywords})})
+    # 超过两位数编号后，新增列仍按写入顺序读取
+    for i in range(1, 121):
+        store.add_columns(output_file, {'手机': {f'阶段{i}': {'华为手机': f'规则{i}'}}})
+
+    df = store.read_sheets(output_file)['手机']
+    assert list(df.columns) == ['关键词', *(f'阶段{i}' for i in range(1, 121))]
+    assert df['阶段100'].tolist() == ['规则100', None]
+    assert store.read_sheet(output_file, '手机', ['阶段11', '阶段100']).column_names == ['阶段11', '阶段100']
+
+    # 替换sheet后原有新增列不再读取
+    store.append_sheets(output_file, {'手机': pd.DataFrame({'关键词': keywords})})
+    store.add_columns(output_file, {'手机': {'阶段3': {'苹果手机': '价格'}}})
+    assert store.read_sheets(output_file)['手机'].to_dict('list') == {'关键词': keywords, '阶段3': [None, '价格']}
+
+
+def test_arrow_store_closes_memory_maps(tmp_path, monkeypatch):
+    import pyarrow
+    store = ArrowStageStore(tmp_path / 'store')
+    output_file = tmp_path / '大牌.xlsx'
+    store.write_sheets(output_file, {'手机': pd.DataFrame({'关键词': ['华为手机']})})
+    sources = []
+
+    def memory_map(*args, **kwargs):
+        sources.append(open_memory_map(*args, **kwargs))
+        return sources[-1]
+
+    open_memory_map = pyarrow.memory_map
+    monkeypatch.setattr(pyarrow, 'memory_map', memory_map)
+    store.add_columns(output_file, {'手机': {'阶段3': {'华为手机': '价格'}}})
+    table = store.read_sheet(output_file, '手机')
+
+    assert len(sources) == 3 and all(source.closed for source in sources)
+    # 关闭文件后表中的数据仍然可用，存储目录可以删除
+    assert table.to_pydict() == {'关键词': ['华为手机'], '阶段3': ['价格']}
+    store.clear()
+    assert not (tmp_path / 'store').exists()